@@ -5,16 +5,39 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from llm_main import llm
+from token_budget import LedgerCallback, budgeted_invoke, budgeted_llm
+import json
+import textwrap
 import pandas as pd
+from typing import List, Optional
+from langchain_core.tools import StructuredTool
 from langchain_experimental.agents.agent_toolkits import create_pandas_dataframe_agent
+from trends import get_trend_engine
+from similarity import MAX_NEIGHBOURS, clamp_k, get_similarity_index
+from data_quality import get_quality_report
+from speculation import CancelOnEvent, SpeculationCancelled
 
 # Load CSV once globally
 
 
-def query_maker(df,query):
-    """Optimizes user query for pandas agent by identifying relevant columns."""
+def query_maker(df,query, previous_query=None, previous_optimized_query=None):
+    """Optimizes user query for pandas agent by identifying relevant columns.
+
+    When the query is a follow-up in a conversation, the previous query and its
+    optimized form are passed so references like "the same for 2023" can be resolved.
+    """
     try:
         columns = df.columns.tolist()
+
+        followup_block = ""
+        if previous_query:
+            followup_block = f"""
+                    This is a follow-up in an ongoing conversation.
+                    Previous query: "{previous_query}"
+                    Previous optimized query: "{previous_optimized_query or previous_query}"
+                    Resolve references such as "the same", "those districts" or "now for 2023"
+                    against the previous query, keeping everything the user did not change.
+                    """
         
         prompt = f"""
                     You are a query optimizer for groundwater data analysis.
@@ -23,6 +46,7 @@ def query_maker(df,query):
                     {columns}
 
                     User's original query: "{query}"
+                    {followup_block}
 
                     Your task:
                     1. Identify which specific columns from the list above are relevant to the user's query
@@ -37,7 +61,7 @@ def query_maker(df,query):
                     Return ONLY the optimized query as a string, nothing else.
                     """
         
-        opt_query = llm.invoke(prompt)
+        opt_query = budgeted_invoke(llm, "query_maker", prompt)
         return opt_query.content.strip()
     
     except FileNotFoundError:
@@ -48,9 +72,79 @@ def query_maker(df,query):
 
 
 
-def data_analysis_agent(df,query, max_retries=3):
-    """Creates a data analysis agent with custom instructions."""
-    opt_query = query_maker(df,query)
+def make_trend_tool(df):
+    """Exposes the precomputed TrendEngine to the pandas agent as a tool."""
+    engine = get_trend_engine(df)
+
+    def groundwater_trends(metric: Optional[str] = None, start: Optional[int] = None,
+                           end: Optional[int] = None, states: Optional[List[str]] = None,
+                           districts: Optional[List[str]] = None, top: int = 5) -> str:
+        try:
+            report = engine.summary(metric=metric, start=start, end=end, n=top,
+                                    states=states, districts=districts,
+                                    include_districts=bool(districts))
+        except ValueError as e:
+            return f"Error: {e}"
+        # Keep the tool output compact: the transition list can be hundreds of rows
+        transitions = report['category_transitions']
+        transitions['transitions'] = transitions['transitions'][:top]
+        return json.dumps(report)
+
+    return StructuredTool.from_function(
+        func=groundwater_trends,
+        name="groundwater_trends",
+        description=(
+            "Fast precomputed trends across assessment years for any numeric column. "
+            f"Years available: {engine.years}. Returns yearly aggregates, year-over-year % change, "
+            "CAGR, top increasing/decreasing districts and stage category transitions "
+            "(safe/semi-critical/critical/over-exploited). Use this instead of writing pandas code "
+            "for any 'how has X changed' question. 'metric' is an exact column name "
+            "(default: Stage of Ground Water Extraction (%)); states/districts are optional filters."
+        ),
+    )
+
+
+def make_similarity_tool(df):
+    """Exposes the precomputed similar-district index to the pandas agent as a tool."""
+    index = get_similarity_index(df)
+
+    def similar_districts(district: str, state: Optional[str] = None, year: Optional[int] = None,
+                          k: int = 5, lower: Optional[List[str]] = None, higher: Optional[List[str]] = None,
+                          states: Optional[List[str]] = None, exclude_same_state: bool = False) -> str:
+        try:
+            report = index.similar(district, state=state, year=year, k=clamp_k(k, default=5), lower=lower,
+                                   higher=higher, states=states, exclude_same_state=exclude_same_state)
+        except ValueError as e:
+            return f"Error: {e}"
+        return json.dumps(report)
+
+    return StructuredTool.from_function(
+        func=similar_districts,
+        name="similar_districts",
+        description=(
+            "Finds the k districts most similar to a given district (same assessment year by default) "
+            "across standardized recharge, extraction by sector, stage %, rainfall and area. "
+            "Use this for 'which districts are like X' or 'peers of X' questions instead of pandas code. "
+            f"lower/higher take feature names from {index.features} and keep only peers below/above "
+            "the district's own value (e.g. lower=['gw_extraction_ham'] for 'peers with lower extraction'). "
+            f"states restricts peers to those states. k is 1 to {MAX_NEIGHBOURS}."
+        ),
+    )
+
+
+def data_analysis_agent(df,query, max_retries=3, previous_query=None, previous_optimized_query=None,
+                        cancel_event=None):
+    """Creates a data analysis agent with custom instructions.
+
+    cancel_event is set when the run was started speculatively (see speculation.py)
+    and turned out not to be needed; the run then stops at its next LLM/tool call.
+    """
+    opt_query = query_maker(df,query, previous_query, previous_optimized_query)
+    if cancel_event is not None and cancel_event.is_set():
+        raise SpeculationCancelled("cancelled after query_maker")
+
+    # Precomputed once per dataset version, so the agent does not re-scan for nulls/outliers
+    quality_context = get_quality_report(df).prompt_context(opt_query)
     
     print(f"Original Query: {query}")
     print(f"Optimized Query: {opt_query}\n")
@@ -67,16 +161,22 @@ def data_analysis_agent(df,query, max_retries=3):
                     - Statistical summaries (mean, median, std, min, max)
                     - Comparisons and trends
                     - Grouping and aggregations where relevant
-                    - Data quality checks (missing values, outliers)
+                    - Caveats from the known data-quality issues listed below
                     3. Extract maximum insights from the data
                     4. Present findings in a clear, structured format
 
                     IMPORTANT NOTES:
                     - Your analysis will be used by downstream agents (visualization, policy recommendation, etc.)
                     - Be thorough and include all relevant metrics
-                    - Always validate data before analysis (check for NaN, data types)
+                    - Data quality is already checked (see DATA QUALITY): do NOT run isna(), dtypes, describe()
+                      or outlier scans yourself; mention listed issues that affect your answer
                     - If comparing regions, include percentage differences and rankings
                     - Round numerical outputs to 2 decimal places for readability
+                    - For changes over years (YoY, CAGR, category shifts, top movers) call the `groundwater_trends` tool first
+                    - For "districts like X" / "peers of X" questions call the `similar_districts` tool
+
+                    DATA QUALITY (precomputed for this dataset version, scoped to the query):
+{textwrap.indent(quality_context, ' ' * 20)}
 
                     OUTPUT FORMAT:
                     Provide your analysis in this structure:
@@ -89,18 +189,22 @@ def data_analysis_agent(df,query, max_retries=3):
                     """
 
     agent_executor = create_pandas_dataframe_agent(
-        llm=llm,
+        llm=budgeted_llm(llm, "analysis"),
         df=df,
         prefix=AGENT_PREFIX,
         verbose=True,
         allow_dangerous_code=True,
         agent_type="openai-functions",
+        extra_tools=[make_trend_tool(df), make_similarity_tool(df)],
     )
     
     # Retry logic for API errors
     for attempt in range(max_retries):
         try:
-            result = agent_executor.invoke({"input": opt_query})
+            callbacks = [LedgerCallback("analysis")]
+            if cancel_event is not None:
+                callbacks.append(CancelOnEvent(cancel_event))
+            result = agent_executor.invoke({"input": opt_query}, config={"callbacks": callbacks})
             return result
         
         except Exception as e:
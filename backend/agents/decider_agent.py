@@ -3,16 +3,19 @@
 import json
 # Assuming llm_main is available
 from llm_main import llm 
+from token_budget import budgeted_invoke
 from textwrap import dedent
 
 
-def deciding_agent(query: str, role: str) -> list:
+def deciding_agent(query: str, role: str, previous_query: str = None) -> list:
     """
     Uses an LLM to decide which agents to run in what order based on query and user role.
     
     Args:
         query: User's question about groundwater
         role: User's role (e.g., 'government', 'researcher', 'citizen')
+        previous_query: Previous query of the same conversation, if any. When given,
+            the router may skip data_analysis_agent and reuse the earlier analysis.
     
     Returns:
         list: Ordered list of agent names to execute
@@ -35,6 +38,15 @@ def deciding_agent(query: str, role: str) -> list:
         for name, desc in AGENT_DEFINITIONS.items()
     )
 
+    followup_rules = ""
+    if previous_query:
+        # Kept at the prompt's indentation so the outer dedent still applies
+        followup_rules = f"""5. **Follow-up Queries**:
+                        - The previous query in this conversation was: "{previous_query}"
+                        - Its data analysis result is already available and will be reused
+                        - If the new query only changes the presentation of the same data (e.g. "make it a chart", "explain it simply"), DO NOT include `data_analysis_agent`
+                        - If the new query changes regions, years or metrics (e.g. "now show the same for 2023"), include `data_analysis_agent` again"""
+
     prompt = dedent(f"""
                         You are an expert router agent for a groundwater management system. Your job is to analyze the user's query and their role, then determine which agents should run and in what sequence.
 
@@ -64,6 +76,7 @@ def deciding_agent(query: str, role: str) -> list:
                         - "Show chart of rainfall" → ["data_analysis_agent", "visualization_agent"]
                         - "Which blocks are over-exploited?" → ["data_analysis_agent", "user_agent"] (if role=citizen)
                         - "Give policy recommendations" → ["data_analysis_agent", "policy_agent"]
+                        {followup_rules}
 
                         **YOUR TASK:**
                         Return ONLY a JSON array of agent names in execution order. No explanations, no markdown, no extra text.
@@ -94,7 +107,7 @@ def deciding_agent(query: str, role: str) -> list:
 
     try:
         # ⚠️ NOTE: This requires a functional LLM implementation in llm_main.py
-        response = llm.invoke(prompt) 
+        response = budgeted_invoke(llm, "router", prompt)
         
         if hasattr(response, 'content'):
             response_str = response.content
@@ -5,6 +5,7 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from llm_main import llm
+from token_budget import analysis_text, budgeted_invoke, estimate_tokens, fit_input
 
 def policy_agent(query, context):
     """
@@ -22,11 +23,12 @@ def policy_agent(query, context):
         data_analysis = context.get('data_analysis', 'No analysis available.')
         
         
-        prompt = f"""
+        # Analysis is filled in after the template is measured, trimmed to the token budget
+        prompt_template = f"""
                     You are a policy advisor for groundwater management in India.
 
                     DATA ANALYSIS RESULTS:
-                    {data_analysis}
+                    {{data_analysis}}
 
                     ORIGINAL QUERY:
                     {query}
@@ -65,7 +67,10 @@ def policy_agent(query, context):
                     Write the policy brief now.
 """
         
-        policy_response = llm.invoke(prompt)
+        data_analysis = fit_input("policy", estimate_tokens(prompt_template), analysis_text(data_analysis))
+        prompt = prompt_template.replace("{data_analysis}", data_analysis)
+
+        policy_response = budgeted_invoke(llm, "policy", prompt)
         return policy_response.content
     
     except Exception as e:
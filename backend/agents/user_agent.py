@@ -5,6 +5,7 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from llm_main import llm
+from token_budget import analysis_text, budgeted_invoke, estimate_tokens, fit_input
 
 def usy_agent(query, context):
     """
@@ -21,13 +22,14 @@ def usy_agent(query, context):
         # Get data analysis result
         data_analysis = context.get('data_analysis', 'No analysis available.')
         
-        prompt = f"""
+        # Analysis is filled in after the template is measured, trimmed to the token budget
+        prompt_template = f"""
                     You are an expert groundwater policy advisor helping farmers and citizens in India understand complex groundwater data in a simple, practical way.
 
                     Below is the data analysis and the user's query:
 
                     DATA ANALYSIS:
-                    {data_analysis}
+                    {{data_analysis}}
 
                     USER QUERY:
                     {query}
@@ -68,7 +70,10 @@ def usy_agent(query, context):
                     """
 
         
-        user_response = llm.invoke(prompt)
+        data_analysis = fit_input("user", estimate_tokens(prompt_template), analysis_text(data_analysis))
+        prompt = prompt_template.replace("{data_analysis}", data_analysis)
+
+        user_response = budgeted_invoke(llm, "user", prompt)
         return user_response.content
     
     except Exception as e:
@@ -10,14 +10,26 @@ from typing import Dict, List, Any, Optional
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from llm_main import llm
+from token_budget import budgeted_invoke
+from result_cache import RESULT_CACHE, dataset_version, plan_key
 
 
 # 🛑 FIX: Added df argument
-def extract_query_parameters(df: pd.DataFrame, query: str) -> Dict[str, Any]:
+def extract_query_parameters(df: pd.DataFrame, query: str, previous_params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
     Uses LLM ONLY to extract filter parameters from query.
     NO agent execution - just parameter extraction.
+    If previous_params is given (follow-up query), the LLM updates them instead of starting over.
     """
+    followup_block = ""
+    if previous_params:
+        followup_block = f"""
+    This is a follow-up query. The previous query resolved to these parameters:
+    {json.dumps(previous_params)}
+    Start from them and change ONLY what the new query changes
+    (e.g. "now show the same for 2023" only replaces "years").
+    """
+
     prompt = f"""
     Extract filtering parameters from this groundwater query.
     
@@ -25,7 +37,7 @@ def extract_query_parameters(df: pd.DataFrame, query: str) -> Dict[str, Any]:
     {df.columns.tolist()}
     
     User Query: "{query}"
-    
+    {followup_block}
     Return ONLY a valid JSON object with these keys:
     {{
         "states": ["list of state names in UPPERCASE if mentioned, or empty array"],
@@ -55,7 +67,7 @@ def extract_query_parameters(df: pd.DataFrame, query: str) -> Dict[str, Any]:
     """
     
     # ... (LLM invocation and JSON parsing logic remains the same)
-    response = llm.invoke(prompt)
+    response = budgeted_invoke(llm, "viz_params", prompt)
     
     try:
         content = response.content.strip()
@@ -114,53 +126,70 @@ def extract_query_parameters(df: pd.DataFrame, query: str) -> Dict[str, Any]:
         }
 
 
-# 🛑 FIX: Added df argument
-def build_pandas_filters(df: pd.DataFrame, params: Dict[str, Any]) -> pd.DataFrame:
+FILTER_KEYS = ('states', 'districts', 'years', 'stage_filter')
+
+
+def same_filters(params: Dict[str, Any], other: Optional[Dict[str, Any]]) -> bool:
     """
-    Builds filters using PURE PANDAS operations.
-    NO AGENTS - just direct DataFrame filtering.
+    True when both parameter dicts select the same rows (sorting, limits and
+    displayed columns may still differ).
     """
-    filtered_df = df.copy() 
+    if not other:
+        return False
+    return all(params.get(key) == other.get(key) for key in FILTER_KEYS)
+
+
+def build_filter_mask(df: pd.DataFrame, params: Dict[str, Any]) -> pd.Series:
+    """
+    Boolean row mask for the filter parameters (states, districts, years, stage_filter).
+    Building the mask never copies the DataFrame, so callers that only need row
+    positions (e.g. streaming exports) stay cheap.
+    """
+    mask = pd.Series(True, index=df.index)
     
     # Filter by states (case-insensitive matching)
     if params.get('states') and len(params['states']) > 0:
         states_upper = [s.upper() for s in params['states']]
-        filtered_df = filtered_df[filtered_df['STATE'].str.upper().isin(states_upper)]
+        mask &= df['STATE'].str.upper().isin(states_upper)
     
     # Filter by districts (case-insensitive matching)
     if params.get('districts') and len(params['districts']) > 0:
         districts_upper = [d.upper() for d in params['districts']]
-        filtered_df = filtered_df[filtered_df['DISTRICT'].str.upper().isin(districts_upper)]
+        mask &= df['DISTRICT'].str.upper().isin(districts_upper)
     
     # Filter by years
     if params.get('years') and len(params['years']) > 0:
-        filtered_df = filtered_df[filtered_df['YEAR'].isin(params['years'])]
+        mask &= df['YEAR'].isin(params['years'])
     
     # Filter by stage (over-exploited, critical, etc.)
-    stage_filter = params.get('stage_filter', {})
+    stage_filter = params.get('stage_filter') or {}
     stage_type = stage_filter.get('type', 'none')
+    stage = df['Stage of Ground Water Extraction (%)']
     
     if stage_type == 'over-exploited':
-        filtered_df = filtered_df[filtered_df['Stage of Ground Water Extraction (%)'] > 100]
+        mask &= stage > 100
     elif stage_type == 'critical':
-        filtered_df = filtered_df[
-            (filtered_df['Stage of Ground Water Extraction (%)'] >= 90) &
-            (filtered_df['Stage of Ground Water Extraction (%)'] <= 100)
-        ]
+        mask &= (stage >= 90) & (stage <= 100)
     elif stage_type == 'semi-critical':
-        filtered_df = filtered_df[
-            (filtered_df['Stage of Ground Water Extraction (%)'] >= 70) &
-            (filtered_df['Stage of Ground Water Extraction (%)'] < 90)
-        ]
+        mask &= (stage >= 70) & (stage < 90)
     elif stage_type == 'safe':
-        filtered_df = filtered_df[filtered_df['Stage of Ground Water Extraction (%)'] < 70]
+        mask &= stage < 70
     elif stage_filter.get('min') is not None:
-        filtered_df = filtered_df[filtered_df['Stage of Ground Water Extraction (%)'] >= stage_filter['min']]
+        mask &= stage >= stage_filter['min']
     
     if stage_filter.get('max') is not None:
-        filtered_df = filtered_df[filtered_df['Stage of Ground Water Extraction (%)'] <= stage_filter['max']]
+        mask &= stage <= stage_filter['max']
     
-    return filtered_df
+    return mask
+
+
+# 🛑 FIX: Added df argument
+def build_pandas_filters(df: pd.DataFrame, params: Dict[str, Any]) -> pd.DataFrame:
+    """
+    Builds filters using PURE PANDAS operations.
+    NO AGENTS - just direct DataFrame filtering.
+    """
+    return df[build_filter_mask(df, params)]
 
 
 def select_and_format_columns(filtered_df: pd.DataFrame, params: Dict[str, Any]) -> pd.DataFrame:
@@ -279,12 +308,38 @@ def convert_to_json(result_df: pd.DataFrame, query: str, params: Dict[str, Any])
     }
 
 
+def restamp_payload(payload: Dict[str, Any], query: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    A cached payload was built for an equivalent plan; echo this request's query
+    and filters (which may differ in case or order) instead of the original ones.
+    """
+    payload['query'] = query
+    filters = payload.get('metadata', {}).get('filters_applied', {})
+    for key in filters:
+        if key == 'stage_filter':
+            filters[key] = (params.get('stage_filter') or {}).get('type', 'none')
+        else:
+            filters[key] = params.get(key, [])
+    return payload
+
+
 # 🛑 FIX: Updated signature to accept df as the first argument
 def visualization_agent(df: pd.DataFrame, query: str, context: Optional[Dict] = None) -> Dict[str, Any]:
     """
     MAIN FUNCTION: Pure pandas visualization agent.
     ...
+    Session reuse: if context carries 'previous_params' / 'previous_filtered_df' /
+    'previous_visualization' from an earlier turn, identical parameters return the
+    previous payload and identical filters skip re-filtering. The resolved params and
+    filtered frame are written back to context['visualization_params'] and
+    context['visualization_filtered_df']; context['visualization_reused'] flags a reused payload.
+
+    Plan cache: a payload for an equivalent parameter dict on the same dataset
+    version is served from RESULT_CACHE (context['visualization_cached'] = True).
     """
+    if context is None:
+        context = {}
+    previous_params = context.get('previous_params')
     print(f"\n{'='*80}")
     print(f"VISUALIZATION AGENT - 100% PURE PANDAS (NO AGENTS)")
     print(f"{'='*80}")
@@ -294,14 +349,40 @@ def visualization_agent(df: pd.DataFrame, query: str, context: Optional[Dict] =
         # Step 1: Extract parameters (LLM only for understanding)
         print("Step 1: Extracting query parameters...")
         # 🛑 FIX: Pass the DataFrame (df)
-        params = extract_query_parameters(df, query)
+        params = extract_query_parameters(df, query, previous_params)
         print(f"✓ Parameters: {json.dumps(params, indent=2)}\n")
-        
+
+        previous_df = context.get('previous_filtered_df')
+        previous_output = context.get('previous_visualization')
+        if params == previous_params and previous_output is not None and previous_df is not None:
+            print("✓ Parameters unchanged since last turn - reusing session result\n")
+            context['visualization_params'] = params
+            context['visualization_filtered_df'] = previous_df
+            context['visualization_reused'] = True
+            return dict(previous_output, query=query)
+
+        cache_key = None
+        if RESULT_CACHE.enabled:
+            cache_key = plan_key(params, dataset_version(df))
+            cached = RESULT_CACHE.get(cache_key)
+            if cached is not None:
+                print("✓ Same query plan answered before - serving cached result\n")
+                context['visualization_params'] = params
+                context['visualization_filtered_df'] = previous_df if same_filters(params, previous_params) else None
+                context['visualization_cached'] = True
+                return restamp_payload(cached, query, params)
+
         # Step 2: Filter data (PURE PANDAS)
         print("Step 2: Filtering data with pandas...")
-        # 🛑 FIX: Pass the DataFrame (df)
-        filtered_df = build_pandas_filters(df, params)
-        print(f"✓ Filtered: {filtered_df.shape[0]} rows\n")
+        if previous_df is not None and same_filters(params, previous_params):
+            filtered_df = previous_df
+            print(f"✓ Filters unchanged - reusing session frame: {filtered_df.shape[0]} rows\n")
+        else:
+            # 🛑 FIX: Pass the DataFrame (df)
+            filtered_df = build_pandas_filters(df, params)
+            print(f"✓ Filtered: {filtered_df.shape[0]} rows\n")
+        context['visualization_params'] = params
+        context['visualization_filtered_df'] = filtered_df
         
         # Step 3: Select and format columns (PURE PANDAS)
         print("Step 3: Selecting columns with pandas...")
@@ -318,6 +399,9 @@ def visualization_agent(df: pd.DataFrame, query: str, context: Optional[Dict] =
         json_output = convert_to_json(result_df, query, params)
         print(f"✓ JSON generated: {len(json_output['data'])} records\n")
         print(f"{'='*80}\n")
+
+        if cache_key is not None:
+            RESULT_CACHE.put(cache_key, json_output)
         
         return json_output
     
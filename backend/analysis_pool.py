@@ -0,0 +1,90 @@
+# analysis_pool.py
+
+"""
+Process pool for CPU-heavy pandas work, so it runs outside the GIL of the web worker.
+
+Pool processes attach to the shared dataset (see shared_dataset.py) by its
+manifest path in their initializer, so they get a zero-copy view of the data
+instead of a pickled copy. Tasks are module-level functions taking the
+DataFrame as first argument, e.g. trends.trend_summary.
+
+Enabled with INGRES_ANALYSIS_PROCESSES=<n> (requires INGRES_SHARED_DATASET=1).
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Optional
+
+from shared_dataset import attach
+
+_WORKER_DF = None  # set in each pool process by _init_worker
+
+
+def _init_worker(manifest_path: str):
+    global _WORKER_DF
+    _WORKER_DF = attach(manifest_path)
+
+
+def _run_task(func: Callable, args: tuple, kwargs: dict) -> Any:
+    return func(_WORKER_DF, *args, **kwargs)
+
+
+class AnalysisPool:
+    def __init__(self, manifest_path: str, processes: int):
+        methods = multiprocessing.get_all_start_methods()
+        # Never plain fork: web workers run threads, and forking a threaded process is unsafe
+        context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        self.manifest_path = manifest_path
+        self.processes = processes
+        self._executor = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(manifest_path,),
+        )
+
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        return self._executor.submit(_run_task, func, args, kwargs)
+
+    def run(self, func: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """
+        Runs func(df, *args, **kwargs) in a pool process and waits for the result.
+        Exceptions raised by func are re-raised here.
+        """
+        return self.submit(func, *args, **kwargs).result(timeout=timeout)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_POOL: Optional[AnalysisPool] = None
+_POOL_PID: Optional[int] = None
+_POOL_LOCK = threading.Lock()
+_MANIFEST_PATH: Optional[str] = None
+
+
+def configure_analysis_pool(manifest_path: Optional[str]):
+    """
+    Records where pool processes attach from. Called once at app startup.
+    """
+    global _MANIFEST_PATH
+    _MANIFEST_PATH = manifest_path
+
+
+def get_analysis_pool() -> Optional[AnalysisPool]:
+    """
+    Lazily creates the pool in the calling process (after gunicorn forked it),
+    or returns None when the pool is disabled and work should run in-process.
+    """
+    global _POOL, _POOL_PID
+    processes = int(os.getenv("INGRES_ANALYSIS_PROCESSES", "0"))
+    if processes <= 0 or _MANIFEST_PATH is None:
+        return None
+
+    with _POOL_LOCK:
+        if _POOL is None or _POOL_PID != os.getpid():
+            _POOL = AnalysisPool(_MANIFEST_PATH, processes)
+            _POOL_PID = os.getpid()
+        return _POOL
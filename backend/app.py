@@ -1,6 +1,7 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, send_file, stream_with_context
 import pandas as pd
 import json
+import contextlib
 from flask_cors import CORS
 import sys
 import os
@@ -15,6 +16,20 @@ except ImportError:
     print("ERROR: Could not import IngresAgent from main_agent.py. Check your paths.")
     sys.exit(1)
 
+from session_store import SESSION_STORE
+from result_cache import RESULT_CACHE
+from speculation import SPECULATION_STATS
+from profiling import ARTIFACTS, RequestProfiler, artifact_path, authorized, list_profiles, requested_profile
+from dashboard import get_dashboard
+from trends import get_trend_engine, trend_summary
+from similarity import clamp_k, get_similarity_index, similar_districts
+from data_quality import get_quality_report
+from shared_dataset import load_shared
+from ingest import load_store
+from analysis_pool import configure_analysis_pool, get_analysis_pool
+from job_queue import JobQueue, QueueFull
+from export import EXPORT_FORMATS, DEFAULT_CHUNK_SIZE, ExportError, export_chunks, params_from_args, params_from_json
+
 
 # 1. Initialize Flask App
 app = Flask(__name__)
@@ -22,16 +37,62 @@ CORS(app)
 
 # 2. Load Data Once on Application Startup
 # This is crucial for performance: DO NOT load the CSV inside the route function.
+# With INGRES_SHARED_DATASET=1 all worker processes attach to one memory-mapped copy.
+# With INGRES_DATA_STORE=<dir> the data comes from the ingest.py columnar store instead.
+USE_SHARED_DATASET = os.getenv("INGRES_SHARED_DATASET", "0") == "1"
+DATA_STORE = os.getenv("INGRES_DATA_STORE")
+DATA_SOURCE = DATA_STORE or 'ingres_one.csv'
+SHARED_MANIFEST = None
 try:
-    GLOBAL_DF = pd.read_csv('ingres_one.csv')
-    print("✅ DataFrame 'ingres_one.csv' loaded successfully.")
+    if DATA_STORE:
+        store_manifest = os.path.join(DATA_STORE, '_manifest.json')
+        if not os.path.exists(store_manifest):
+            raise FileNotFoundError(store_manifest)
+    if USE_SHARED_DATASET:
+        if DATA_STORE:
+            # A new ingest run rewrites the store manifest, which publishes a new version
+            GLOBAL_DF, SHARED_MANIFEST = load_shared(store_manifest, loader=lambda: load_store(DATA_STORE))
+        else:
+            GLOBAL_DF, SHARED_MANIFEST = load_shared('ingres_one.csv')
+        print(f"✅ DataFrame '{DATA_SOURCE}' attached from shared memory ({SHARED_MANIFEST}).")
+    elif DATA_STORE:
+        GLOBAL_DF = load_store(DATA_STORE)
+        print(f"✅ DataFrame loaded from store '{DATA_STORE}' ({len(GLOBAL_DF)} rows).")
+    else:
+        GLOBAL_DF = pd.read_csv('ingres_one.csv')
+        print("✅ DataFrame 'ingres_one.csv' loaded successfully.")
 except FileNotFoundError:
-    print("FATAL ERROR: 'ingres_one.csv' not found. Please ensure it is in the correct directory.")
+    print(f"FATAL ERROR: '{DATA_SOURCE}' not found. Please ensure it is in the correct directory.")
     GLOBAL_DF = None # Set to None to prevent crashes later
 except Exception as e:
     print(f"FATAL ERROR: Failed to load DataFrame: {e}")
     GLOBAL_DF = None
 
+# Precompute the district x year trend panel once (used by /api/trends and the agents)
+TREND_ENGINE = get_trend_engine(GLOBAL_DF) if GLOBAL_DF is not None else None
+
+# Standardized feature matrix for similar-district search (used by /api/similar and the agents)
+SIMILARITY_INDEX = get_similarity_index(GLOBAL_DF) if GLOBAL_DF is not None else None
+
+# Null counts, distributions, outliers and inconsistent rows, computed once per dataset version
+QUALITY_REPORT = get_quality_report(GLOBAL_DF) if GLOBAL_DF is not None else None
+
+# Dashboard summaries are rendered once per dataset version and served as bytes
+DASHBOARD = get_dashboard(GLOBAL_DF) if GLOBAL_DF is not None else None
+if DASHBOARD is not None:
+    print(f"✅ Dashboard payloads built in {DASHBOARD.build_seconds}s (version {DASHBOARD.version}).")
+
+# CPU-heavy analysis can be sent to a process pool attached to the same shared copy
+configure_analysis_pool(SHARED_MANIFEST)
+
+
+def _split_arg(name):
+    """Comma-separated query-string argument -> list (or None)."""
+    value = request.args.get(name)
+    if not value:
+        return None
+    return [item.strip() for item in value.split(',') if item.strip()]
+
 
 # 3. Define the API Route for Agent Execution
 @app.route('/api/run_agent', methods=['POST'])
@@ -39,6 +100,11 @@ def run_agent_pipeline():
     """
     Receives query and role, executes the IngresAgent pipeline, 
     and returns the final output combined with visualization data.
+    An optional 'session_id' ties the request to a conversation so follow-up
+    queries can reuse the previous turn's state; use the id returned in the response
+    (unknown ids start a new conversation under a fresh id).
+    Send session_id "new" to start a conversation. Requests without one are
+    stateless and never stored.
     """
     if GLOBAL_DF is None:
         return jsonify({"error": "Data server is unavailable. Failed to load 'ingres_one.csv'."}), 503
@@ -55,48 +121,380 @@ def run_agent_pipeline():
     if not query or not role:
         return jsonify({"error": "Missing 'query' or 'role' parameter in the request."}), 400
 
+    # Opt-in profiling of this one request (header X-Ingres-Profile or ?profile=, see profiling.py)
+    try:
+        profile_request = requested_profile(request)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     try:
-        # Initialize and run the IngresAgent pipeline
+        if profile_request is None:
+            response_data = execute_pipeline(query, role, data.get('session_id'))
+            return jsonify(response_data), 200
+
+        with RequestProfiler(profile_request, label=f"role={role} query={query!r}") as profiler:
+            response_data = execute_pipeline(query, role, data.get('session_id'))
+            jsonify(response_data)  # serialization is part of what gets profiled
+        response_data["profile"] = profiler.report()
+        response = jsonify(response_data)
+        response.headers['X-Ingres-Profile-Id'] = profiler.profile_id
+        return response, 200
+
+    except Exception as e:
+        print(f"An unexpected error occurred during pipeline execution: {e}")
+        # Print traceback for better debugging on the server side
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": f"Internal server error during agent execution: {str(e)}"}), 500
+
+
+def execute_pipeline(query, role, session_id=None, on_stage=None):
+    """
+    Runs one IngresAgent turn and builds the API response dict.
+    Shared by the synchronous route and the background job workers.
+    on_stage(stage, result) is called after routing and after every agent.
+    """
+    # Only conversations the client asked for are stored, so stateless API calls
+    # (scripts, jobs, load tests) cannot push live chats out of the LRU
+    session = SESSION_STORE.get_or_create(session_id) if session_id else None
+
+    # Initialize and run the IngresAgent pipeline.
+    # Turns of the same conversation run one at a time so they see each other's state.
+    with session.lock if session is not None else contextlib.nullcontext():
         agent_instance = IngresAgent(
             dataframe=GLOBAL_DF,
             query=query,
-            role=role
+            role=role,
+            session=session,
+            on_stage=on_stage
         )
         final_output = agent_instance.run_pipeline()
 
-        # --- 🛑 CORRECTED LOGIC TO INCLUDE VISUALIZATION CONTEXT ---
-        
-        # 1. Safely extract the visualization data (it will be None if the agent didn't run)
-        viz_data = agent_instance.results.get('visualization', None)
+    # --- 🛑 CORRECTED LOGIC TO INCLUDE VISUALIZATION CONTEXT ---
+    
+    # 1. Safely extract the visualization data (it will be None if the agent didn't run)
+    viz_data = agent_instance.results.get('visualization', None)
+    
+    # 2. Structure the combined response dictionary
+    response_data = {
+        "query": query,
+        "role": role,
+        "session_id": session.session_id if session is not None else None,
+        "reused_from_session": agent_instance.reused,
+        "served_from_cache": agent_instance.cached,
+        "speculation": agent_instance.speculation,
+        "token_usage": agent_instance.token_ledger.summary(),
+        "visualization_context": viz_data,
+        "main_output": None
+    }
+
+    # 3. Handle the main_output (which could be a string summary or a structured dict)
+    if isinstance(final_output, dict):
+        # If the final_output is already a dict (e.g., pure data analysis or visualization output)
+        response_data["main_output"] = final_output
+    elif isinstance(final_output, str):
+        # If it's a string (e.g., user_agent or policy_agent summary), wrap it
+        response_data["main_output"] = {"summary_text": final_output}
+    else:
+        # Catchall
+        response_data["main_output"] = {"summary_text": str(final_output)}
         
-        # 2. Structure the combined response dictionary
-        response_data = {
-            "query": query,
-            "role": role,
-            "visualization_context": viz_data,
-            "main_output": None
-        }
-
-        # 3. Handle the main_output (which could be a string summary or a structured dict)
-        if isinstance(final_output, dict):
-            # If the final_output is already a dict (e.g., pure data analysis or visualization output)
-            response_data["main_output"] = final_output
-        elif isinstance(final_output, str):
-            # If it's a string (e.g., user_agent or policy_agent summary), wrap it
-            response_data["main_output"] = {"summary_text": final_output}
+    return response_data
+    # --- END CORRECTED LOGIC ---
+
+
+# Background jobs: same pipeline, run by a local worker pool instead of the request thread
+JOB_QUEUE = JobQueue(
+    runner=execute_pipeline,
+    workers=int(os.getenv("INGRES_JOB_WORKERS", "4")),
+    max_jobs=int(os.getenv("INGRES_MAX_JOBS", "1000")),
+    result_ttl=float(os.getenv("INGRES_JOB_TTL", "3600")),
+    max_queued=int(os.getenv("INGRES_MAX_QUEUED_JOBS", "100")),
+)
+# Long-polls return before typical 60s proxy/browser timeouts
+JOB_MAX_WAIT = 50
+# Seconds a client is told to wait before resubmitting to a full queue
+JOB_RETRY_AFTER = 30
+
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """
+    Enqueues an agent run and returns its job id immediately (202), or 503 with
+    Retry-After when INGRES_MAX_QUEUED_JOBS runs are already waiting.
+    Same payload as /api/run_agent: query, role, optional session_id.
+    """
+    if GLOBAL_DF is None:
+        return jsonify({"error": "Data server is unavailable. Failed to load 'ingres_one.csv'."}), 503
+
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"error": "Missing JSON payload in request."}), 400
+
+    query = data.get('query')
+    role = data.get('role')
+    if not query or not role:
+        return jsonify({"error": "Missing 'query' or 'role' parameter in the request."}), 400
+
+    try:
+        job = JOB_QUEUE.submit(query, role, data.get('session_id'))
+    except QueueFull as e:
+        print(f"⚠️ Job rejected: {e}")
+        response = jsonify({"error": "Too many queued jobs, try again later."})
+        response.headers['Retry-After'] = str(JOB_RETRY_AFTER)
+        return response, 503
+    response = job.to_dict(include_stages=False)
+    response["queue_position"] = JOB_QUEUE.queue_position(job)
+    response["status_url"] = f"/api/jobs/{job.job_id}"
+    return jsonify(response), 202
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Job status, finished stages and (when done) the final output.
+    ?wait=<seconds>&since=<version> long-polls until the job changes past 'since'.
+    """
+    job = JOB_QUEUE.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown or expired job '{job_id}'."}), 404
+
+    wait = min(request.args.get('wait', default=0, type=float), JOB_MAX_WAIT)
+    if wait > 0:
+        since = request.args.get('since', default=job.version, type=int)
+        job.wait_for_change(since, wait)
+
+    response = job.to_dict()
+    response["queue_position"] = JOB_QUEUE.queue_position(job)
+    return jsonify(response), 200
+
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    if JOB_QUEUE.get(job_id) is None:
+        return jsonify({"error": f"Unknown or expired job '{job_id}'."}), 404
+    if not JOB_QUEUE.cancel(job_id):
+        return jsonify({"error": "Only queued jobs can be cancelled."}), 409
+    return jsonify({"cancelled": job_id}), 200
+
+
+@app.route('/api/jobs', methods=['GET'])
+def job_stats():
+    return jsonify(JOB_QUEUE.stats()), 200
+
+
+# Time-series comparison across assessment years
+@app.route('/api/trends', methods=['GET'])
+def get_trends():
+    """
+    Query args: metric, start, end, states, districts (comma-separated),
+    top (movers per direction), by ('abs' or 'pct'), include_districts (true/false).
+    """
+    if TREND_ENGINE is None:
+        return jsonify({"error": "Data server is unavailable. Failed to load 'ingres_one.csv'."}), 503
+
+    try:
+        trends_kwargs = dict(
+            metric=request.args.get('metric'),
+            start=request.args.get('start', type=int),
+            end=request.args.get('end', type=int),
+            n=request.args.get('top', default=10, type=int),
+            by=request.args.get('by', default='abs'),
+            states=_split_arg('states'),
+            districts=_split_arg('districts'),
+            include_districts=request.args.get('include_districts', 'false').lower() == 'true',
+        )
+        pool = get_analysis_pool()
+        if pool is not None:
+            trends = pool.run(trend_summary, **trends_kwargs)
         else:
-            # Catchall
-            response_data["main_output"] = {"summary_text": str(final_output)}
-            
-        return jsonify(response_data), 200
-        # --- END CORRECTED LOGIC ---
+            trends = TREND_ENGINE.summary(**trends_kwargs)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    except Exception as e:
-        print(f"An unexpected error occurred during pipeline execution: {e}")
-        # Print traceback for better debugging on the server side
-        import traceback
-        traceback.print_exc()
-        return jsonify({"error": f"Internal server error during agent execution: {str(e)}"}), 500
+    return jsonify(trends), 200
+
+
+# Similar-district (k-NN) search
+@app.route('/api/similar', methods=['GET'])
+def get_similar():
+    """
+    Query args: district (required), state, year, k, features, states, years,
+    category, lower, higher (comma-separated feature names), exclude_same_state.
+    e.g. /api/similar?district=PUNE&lower=gw_extraction_ham
+    """
+    if SIMILARITY_INDEX is None:
+        return jsonify({"error": "Data server is unavailable. Failed to load 'ingres_one.csv'."}), 503
+
+    district = request.args.get('district')
+    if not district:
+        return jsonify({"error": "Missing 'district' parameter"}), 400
+
+    try:
+        years = _split_arg('years')
+        similar_kwargs = dict(
+            state=request.args.get('state'),
+            year=request.args.get('year', type=int),
+            k=clamp_k(request.args.get('k', type=int)),
+            features=_split_arg('features'),
+            states=_split_arg('states'),
+            years=[int(y) for y in years] if years else None,
+            category=request.args.get('category'),
+            lower=_split_arg('lower'),
+            higher=_split_arg('higher'),
+            exclude_same_state=request.args.get('exclude_same_state', 'false').lower() == 'true',
+        )
+        pool = get_analysis_pool()
+        if pool is not None:
+            similar = pool.run(similar_districts, district, **similar_kwargs)
+        else:
+            similar = SIMILARITY_INDEX.similar(district, **similar_kwargs)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify(similar), 200
+
+
+# Precomputed data-quality / outlier report
+@app.route('/api/data_quality', methods=['GET'])
+def get_data_quality():
+    """
+    Query args (all optional): states, districts, years, columns (comma-separated), limit
+    (max outlier / suspicious rows listed, default 100).
+    """
+    if QUALITY_REPORT is None:
+        return jsonify({"error": "Data server is unavailable. Failed to load 'ingres_one.csv'."}), 503
+
+    try:
+        years = _split_arg('years')
+        report = QUALITY_REPORT.summary(
+            states=_split_arg('states'),
+            districts=_split_arg('districts'),
+            years=[int(y) for y in years] if years else None,
+            columns=_split_arg('columns'),
+            limit=max(0, request.args.get('limit', default=100, type=int)),
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify(report), 200
+
+
+# Streaming bulk export of filtered rows
+@app.route('/api/export', methods=['GET', 'POST'])
+def export_data():
+    """
+    Streams all rows matching the structured filters as CSV, NDJSON or Arrow IPC.
+    POST: JSON body with the extract_query_parameters keys (states, districts, years,
+    stage_filter, columns_to_show, sort_by, sort_order, limit) plus optional
+    'format', 'chunk_size', 'clean_names' (see export.params_from_json). GET: same via query
+    args (see export.params_from_args).
+    """
+    if GLOBAL_DF is None:
+        return jsonify({"error": "Data server is unavailable. Failed to load 'ingres_one.csv'."}), 503
+
+    try:
+        if request.method == 'POST':
+            data = request.get_json(silent=True)
+            if not isinstance(data, dict):
+                return jsonify({"error": "Missing JSON payload in request."}), 400
+            params = params_from_json(data)
+            options = data
+        else:
+            params = params_from_args(request.args)
+            options = request.args
+
+        fmt = str(options.get('format', 'csv')).lower()
+        chunks = export_chunks(
+            GLOBAL_DF,
+            params,
+            fmt=fmt,
+            chunk_size=int(options.get('chunk_size', DEFAULT_CHUNK_SIZE)),
+            clean_names=str(options.get('clean_names', 'false')).lower() == 'true',
+        )
+    except (ExportError, ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    extension = {"csv": "csv", "ndjson": "ndjson", "arrow": "arrows"}[fmt]
+    return Response(
+        stream_with_context(chunks),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f"attachment; filename=ingres_export.{extension}"},
+    )
+
+
+# Conversation session inspection / reset
+@app.route('/api/session/<session_id>', methods=['GET'])
+def get_session(session_id):
+    session = SESSION_STORE.get(session_id)
+    if session is None:
+        return jsonify({"error": f"Unknown or expired session '{session_id}'."}), 404
+    return jsonify(session.summary()), 200
+
+
+@app.route('/api/session/<session_id>', methods=['DELETE'])
+def delete_session(session_id):
+    if not SESSION_STORE.delete(session_id):
+        return jsonify({"error": f"Unknown or expired session '{session_id}'."}), 404
+    return jsonify({"deleted": session_id}), 200
+
+
+@app.route('/api/sessions/stats', methods=['GET'])
+def session_stats():
+    return jsonify(SESSION_STORE.stats()), 200
+
+
+# Pre-rendered dashboard summaries (HTTP-cacheable)
+@app.route('/api/dashboard', defaults={'name': 'index'}, methods=['GET'])
+@app.route('/api/dashboard/<name>', methods=['GET'])
+def dashboard(name):
+    """
+    index, overview, states, categories, critical. Strong ETags answer conditional
+    requests with 304; URLs pinned with ?v=<dataset_version> are cached as immutable.
+    """
+    if DASHBOARD is None:
+        return jsonify({"error": "Data server is unavailable. Failed to load 'ingres_one.csv'."}), 503
+
+    entry = DASHBOARD.get(name)
+    if entry is None:
+        return jsonify({"error": f"Unknown dashboard '{name}'. Available: {DASHBOARD.names}"}), 404
+
+    body, etag = entry
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = DASHBOARD.cache_control(request.args.get('v'))
+    return response.make_conditional(request)
+
+
+# Hit rates of the shared query-plan result cache
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(RESULT_CACHE.stats()), 200
+
+
+# Speculative data analysis: commit/cancel counts and wasted work
+@app.route('/api/speculation/stats', methods=['GET'])
+def speculation_stats():
+    return jsonify(SPECULATION_STATS.to_dict()), 200
+
+
+# Stored per-request profiles (they contain query text: same token as profiling itself)
+@app.route('/api/profiles', methods=['GET'])
+def get_profiles():
+    if not authorized(request):
+        return jsonify({"error": "Profiles require a valid X-Ingres-Profile-Token."}), 403
+    return jsonify({"profiles": list_profiles()}), 200
+
+
+@app.route('/api/profiles/<profile_id>/<artifact>', methods=['GET'])
+def download_profile(profile_id, artifact):
+    if not authorized(request):
+        return jsonify({"error": "Profiles require a valid X-Ingres-Profile-Token."}), 403
+    path = artifact_path(profile_id, artifact)
+    if path is None:
+        return jsonify({"error": f"Profile artifact '{profile_id}/{artifact}' not found."}), 404
+    return send_file(path, mimetype=ARTIFACTS[artifact][1], as_attachment=True,
+                     download_name=os.path.basename(path))
 
 
 # 4. Run the Application
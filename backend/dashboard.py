@@ -0,0 +1,175 @@
+# dashboard.py
+
+"""
+Pre-rendered dashboard payloads served by /api/dashboard/*.
+
+National and state summaries only change when the dataset does, so every
+payload is computed and serialized once per dataset version and served as
+bytes from memory. Each payload carries a strong ETag (dataset version +
+content hash); responses for a URL pinned to the version (?v=<version>) are
+immutable, so browsers and reverse proxies can answer repeat requests
+without reaching Python.
+"""
+
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from dataset_rows import (
+    EXTRACTABLE_COLUMN,
+    EXTRACTION_COLUMN,
+    RECHARGE_COLUMN,
+    STAGE_COLUMN,
+    FrameCache,
+    aggregate_row_mask,
+)
+from result_cache import dataset_version
+from trends import CATEGORY_ORDER, categorize_stage
+
+VOLUME_COLUMNS = [RECHARGE_COLUMN, EXTRACTABLE_COLUMN, EXTRACTION_COLUMN]
+
+TOP_CRITICAL = int(os.getenv("INGRES_DASHBOARD_TOP", "10"))
+# Unpinned URLs are revalidated after this many seconds; pinned (?v=) URLs never change
+MAX_AGE = int(os.getenv("INGRES_DASHBOARD_MAX_AGE", "300"))
+IMMUTABLE_MAX_AGE = 31536000
+
+
+def _totals(group: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Volume totals of a set of districts; stage % is recomputed from the sums.
+    """
+    sums = group[VOLUME_COLUMNS].sum()
+    extractable = sums[EXTRACTABLE_COLUMN]
+    stage = sums[EXTRACTION_COLUMN] / extractable * 100 if extractable else None
+    return {
+        "districts": int(len(group)),
+        "recharge_ham": round(float(sums[RECHARGE_COLUMN]), 2),
+        "extractable_ham": round(float(extractable), 2),
+        "extraction_ham": round(float(sums[EXTRACTION_COLUMN]), 2),
+        "stage_percent": None if stage is None else round(float(stage), 2),
+    }
+
+
+def _category_counts(group: pd.DataFrame) -> Dict[str, int]:
+    counts = group['category'].value_counts()
+    return {category: int(counts.get(category, 0)) for category in CATEGORY_ORDER}
+
+
+def build_payloads(df: pd.DataFrame) -> Dict[str, Dict[str, Any]]:
+    """
+    All dashboard summaries as JSON-ready dicts, keyed by endpoint name.
+    """
+    df = df[~aggregate_row_mask(df)]  # national total rows would double every sum
+    data = df.assign(
+        STATE=df['STATE'].str.strip().str.upper(),
+        DISTRICT=df['DISTRICT'].str.strip(),
+        category=categorize_stage(df[STAGE_COLUMN].to_numpy()),
+    )
+    years = sorted(int(y) for y in data['YEAR'].dropna().unique())
+    by_year = {int(year): group for year, group in data.groupby('YEAR')}
+
+    overview = {
+        "years": years,
+        "national": {
+            str(year): dict(_totals(group), categories=_category_counts(group))
+            for year, group in by_year.items()
+        },
+    }
+
+    states: Dict[str, Dict[str, Any]] = {}
+    for (year, state), group in data.groupby(['YEAR', 'STATE']):
+        states.setdefault(str(int(year)), {})[state] = dict(_totals(group), categories=_category_counts(group))
+
+    distribution: Dict[str, Any] = {}
+    for year, group in by_year.items():
+        counts = _category_counts(group)
+        categorized = sum(counts.values())
+        distribution[str(year)] = {
+            category: {
+                "districts": count,
+                "share_percent": round(count / categorized * 100, 2) if categorized else 0.0,
+            }
+            for category, count in counts.items()
+        }
+
+    critical: Dict[str, List[Dict[str, Any]]] = {}
+    for year, group in by_year.items():
+        stressed = group[group[STAGE_COLUMN] >= 90].nlargest(TOP_CRITICAL, STAGE_COLUMN)
+        critical[str(year)] = [
+            {
+                "state": row.STATE,
+                "district": row.DISTRICT,
+                "stage_percent": round(float(stage), 2),
+                "category": row.category,
+                "extraction_ham": round(float(extraction), 2),
+            }
+            for row, stage, extraction in zip(
+                stressed.itertuples(index=False),
+                stressed[STAGE_COLUMN].to_numpy(),
+                stressed[EXTRACTION_COLUMN].to_numpy(),
+            )
+        ]
+
+    return {
+        "overview": overview,
+        "states": {"years": years, "states": states},
+        "categories": {"years": years, "thresholds": {"safe": "< 70", "semi-critical": "70 - 90",
+                                                      "critical": "90 - 100", "over-exploited": "> 100"},
+                       "distribution": distribution},
+        "critical": {"years": years, "top": TOP_CRITICAL, "districts": critical},
+    }
+
+
+class DashboardCache:
+    """
+    Serialized payloads + ETags for one dataset version.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        started = time.perf_counter()
+        self.df = df
+        self.version = dataset_version(df)
+        self._payloads: Dict[str, Tuple[bytes, str]] = {}
+
+        payloads = build_payloads(df)
+        payloads["index"] = {
+            "endpoints": {name: f"/api/dashboard/{name}?v={self.version}" for name in payloads},
+        }
+        for name, payload in payloads.items():
+            # No timestamps in the body: every worker process must produce the same ETag
+            body = json.dumps(
+                dict(payload, dataset_version=self.version),
+                separators=(",", ":"), default=str,
+            ).encode("utf-8")
+            etag = f"{self.version}-{hashlib.sha1(body).hexdigest()[:12]}"
+            self._payloads[name] = (body, etag)
+        self.build_seconds = round(time.perf_counter() - started, 3)
+
+    @property
+    def names(self) -> List[str]:
+        return sorted(self._payloads)
+
+    def get(self, name: str) -> Optional[Tuple[bytes, str]]:
+        """
+        (JSON body, strong ETag) of a payload, or None for an unknown name.
+        """
+        return self._payloads.get(name)
+
+    def cache_control(self, pinned_version: Optional[str]) -> str:
+        if pinned_version == self.version:
+            return f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+        return f"public, max-age={MAX_AGE}, must-revalidate"
+
+
+_DASHBOARDS: FrameCache[DashboardCache] = FrameCache(DashboardCache)
+
+
+def get_dashboard(df: pd.DataFrame) -> DashboardCache:
+    """
+    Returns the (cached) dashboard payloads for this DataFrame.
+    """
+    return _DASHBOARDS.get(df)
@@ -0,0 +1,324 @@
+# data_quality.py
+
+"""
+Data-quality and outlier profile, computed once per dataset version.
+
+The analysis agent used to spend iterations on isna() / describe() / outlier
+scans over the same static table for every request. This module computes
+them once:
+    - null and zero counts per column, duplicate and invalid keys
+    - per-column distributions (quantiles, min/max, negatives)
+    - z-score and IQR outliers within each (STATE, YEAR) group, vectorized
+      over all numeric columns at once
+    - suspicious rows: stage % inconsistent with extraction / extractable,
+      total extraction != sum of the sectors, extractable resource !=
+      recharge - environmental flows, aggregate (all-India) rows
+Served whole by /api/data_quality, and as a per-query slice in the prompt of
+the data analysis agent.
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from dataset_rows import (
+    EXTRACTABLE_COLUMN,
+    EXTRACTION_COLUMN,
+    RECHARGE_COLUMN,
+    STAGE_COLUMN,
+    FrameCache,
+    aggregate_row_mask,
+)
+from result_cache import dataset_version
+
+ENV_FLOWS_COLUMN = 'Environmental Flows (ham)'
+SECTOR_PREFIX = EXTRACTION_COLUMN + ' - '
+GROUP_COLUMNS = ['STATE', 'YEAR']
+
+Z_THRESHOLD = 3.0
+IQR_FACTOR = 1.5
+MIN_GROUP_SIZE = 5  # smaller state-year groups have no meaningful spread
+STAGE_TOLERANCE = 1.0  # percentage points
+VOLUME_TOLERANCE = 0.01  # relative
+
+# Outlier checks run on these columns (all numeric columns when None)
+OUTLIER_COLUMNS: Optional[List[str]] = None
+
+
+def _records(table: pd.DataFrame) -> List[Dict[str, Any]]:
+    # NaN (e.g. no z-score for an IQR-only outlier) is not valid JSON
+    return table.astype(object).where(table.notna(), None).to_dict(orient='records')
+
+
+def _relative_gap(a: pd.Series, b: pd.Series) -> pd.Series:
+    return (a - b).abs() / np.maximum(a.abs(), b.abs()).replace(0, np.nan)
+
+
+class DataQualityReport:
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.version = dataset_version(df)
+        self.numeric = [col for col in df.select_dtypes(include='number').columns if col != 'YEAR']
+        self.aggregate_rows = aggregate_row_mask(df)
+        self.keys = pd.DataFrame({
+            'YEAR': df['YEAR'],
+            'STATE': df['STATE'].astype(str).str.strip().str.upper(),
+            'DISTRICT': df['DISTRICT'].astype(str).str.strip().str.upper(),
+        })
+
+        self.overview = self._overview()
+        self.columns = self._columns()
+        self.outliers = self._outliers()
+        self.suspicious = self._suspicious()
+
+    # ------------------------------------------------------------------ profile
+
+    def _overview(self) -> Dict[str, Any]:
+        df = self.df
+        duplicated = self.keys.duplicated(keep=False)
+        return {
+            "dataset_version": self.version,
+            "rows": int(len(df)),
+            "columns": int(len(df.columns)),
+            "years": sorted(int(y) for y in df['YEAR'].dropna().unique()),
+            "states": int(self.keys.loc[~self.aggregate_rows, 'STATE'].nunique()),
+            "total_nulls": int(df.isna().sum().sum()),
+            "duplicate_keys": self.keys[duplicated].drop_duplicates().to_dict(orient='records'),
+            "aggregate_rows": int(self.aggregate_rows.sum()),
+            "non_numeric_columns": [col for col in df.columns
+                                    if col not in self.numeric and col not in ('YEAR', 'STATE', 'DISTRICT')],
+        }
+
+    def _columns(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Nulls and distribution of every numeric column, over real districts only.
+        """
+        data = self.df.loc[~self.aggregate_rows, self.numeric]
+        values = data.to_numpy(dtype=np.float64)
+        quantiles = np.nanquantile(values, [0.01, 0.25, 0.5, 0.75, 0.99], axis=0)
+        stats = {
+            "nulls": np.isnan(values).sum(axis=0),
+            "zeros": (values == 0).sum(axis=0),
+            "negatives": (values < 0).sum(axis=0),
+            "mean": np.nanmean(values, axis=0),
+            "std": np.nanstd(values, axis=0),
+            "min": np.nanmin(values, axis=0),
+            "max": np.nanmax(values, axis=0),
+        }
+        columns = {}
+        for j, col in enumerate(self.numeric):
+            columns[col] = {
+                "dtype": str(self.df[col].dtype),
+                "nulls": int(stats["nulls"][j]),
+                "zeros": int(stats["zeros"][j]),
+                "negatives": int(stats["negatives"][j]),
+                "mean": round(float(stats["mean"][j]), 2),
+                "std": round(float(stats["std"][j]), 2),
+                "min": round(float(stats["min"][j]), 2),
+                "p01": round(float(quantiles[0, j]), 2),
+                "p25": round(float(quantiles[1, j]), 2),
+                "median": round(float(quantiles[2, j]), 2),
+                "p75": round(float(quantiles[3, j]), 2),
+                "p99": round(float(quantiles[4, j]), 2),
+                "max": round(float(stats["max"][j]), 2),
+            }
+        return columns
+
+    def _outliers(self) -> pd.DataFrame:
+        """
+        Long table (row, column, value, z, bounds, method) of values that are
+        outliers within their state and year, by z-score and/or IQR.
+        """
+        columns = OUTLIER_COLUMNS or self.numeric
+        real = ~self.aggregate_rows.to_numpy()
+        data = self.df.loc[real, columns]
+        groups = self.keys.loc[real, GROUP_COLUMNS]
+        grouped = data.groupby([groups['STATE'], groups['YEAR']])
+
+        # One groupby per statistic, broadcast back to rows: no per-group Python loop
+        index = pd.MultiIndex.from_frame(groups)
+        size = grouped[columns[0]].transform('size').to_numpy()
+        mean = grouped.transform('mean').to_numpy()
+        std = grouped.transform('std').to_numpy()
+        q1 = grouped.quantile(0.25).reindex(index).to_numpy()
+        q3 = grouped.quantile(0.75).reindex(index).to_numpy()
+
+        values = data.to_numpy(dtype=np.float64)
+        # Constant groups leave a rounding-error std, which would turn into huge z-scores
+        std = np.where(std > 1e-9 * np.maximum(np.abs(mean), 1.0), std, np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z = (values - mean) / std
+        iqr = q3 - q1
+        low, high = q1 - IQR_FACTOR * iqr, q3 + IQR_FACTOR * iqr
+
+        big_enough = (size >= MIN_GROUP_SIZE)[:, None]
+        z_flag = big_enough & (np.abs(z) > Z_THRESHOLD)
+        iqr_flag = big_enough & (iqr > 0) & ((values < low) | (values > high))
+        rows, cols = np.nonzero(z_flag | iqr_flag)
+
+        positions = np.flatnonzero(real)[rows]
+        method = np.where(z_flag[rows, cols] & iqr_flag[rows, cols], 'z+iqr',
+                          np.where(z_flag[rows, cols], 'z', 'iqr'))
+        return pd.DataFrame({
+            'row': positions,
+            'YEAR': self.df['YEAR'].to_numpy()[positions],
+            'STATE': self.df['STATE'].to_numpy()[positions],
+            'DISTRICT': self.df['DISTRICT'].to_numpy()[positions],
+            'column': np.asarray(columns, dtype=object)[cols],
+            'value': values[rows, cols].round(2),
+            'z': np.round(z[rows, cols], 2),
+            'iqr_low': low[rows, cols].round(2),
+            'iqr_high': high[rows, cols].round(2),
+            'method': method,
+        }).sort_values('z', key=lambda s: s.abs(), ascending=False, kind='stable').reset_index(drop=True)
+
+    def _suspicious(self) -> pd.DataFrame:
+        """
+        Rows whose columns contradict each other, one line per (row, check).
+        """
+        df = self.df
+        checks = []
+
+        def add(mask: pd.Series, check: str, detail: pd.Series):
+            mask = mask.fillna(False).to_numpy(dtype=bool)
+            if mask.any():
+                checks.append(pd.DataFrame({
+                    'row': np.flatnonzero(mask),
+                    'YEAR': df['YEAR'].to_numpy()[mask],
+                    'STATE': df['STATE'].to_numpy()[mask],
+                    'DISTRICT': df['DISTRICT'].to_numpy()[mask],
+                    'check': check,
+                    'detail': detail.to_numpy()[mask],
+                }))
+
+        add(self.aggregate_rows, 'aggregate_row',
+            pd.Series('national total row (STATE/DISTRICT = 0), exclude from district analysis', index=df.index))
+
+        if {STAGE_COLUMN, EXTRACTION_COLUMN, EXTRACTABLE_COLUMN} <= set(df.columns):
+            extractable = df[EXTRACTABLE_COLUMN]
+            implied = df[EXTRACTION_COLUMN] / extractable.replace(0, np.nan) * 100
+            gap = (df[STAGE_COLUMN] - implied).abs()
+            add(gap > STAGE_TOLERANCE, 'stage_inconsistent',
+                'stage ' + df[STAGE_COLUMN].round(2).astype(str) + '% vs extraction/extractable '
+                + implied.round(2).astype(str) + '%')
+            add((extractable == 0) & (df[EXTRACTION_COLUMN] > 0), 'zero_extractable',
+                'extraction ' + df[EXTRACTION_COLUMN].round(2).astype(str) + ' ham with 0 extractable resource')
+
+        sectors = [col for col in df.columns if col.startswith(SECTOR_PREFIX)]
+        if sectors and EXTRACTION_COLUMN in df.columns:
+            sector_sum = df[sectors].sum(axis=1)
+            add(_relative_gap(sector_sum, df[EXTRACTION_COLUMN]) > VOLUME_TOLERANCE, 'sector_sum_mismatch',
+                'sectors sum to ' + sector_sum.round(2).astype(str) + ' ham vs total '
+                + df[EXTRACTION_COLUMN].round(2).astype(str))
+
+        if {RECHARGE_COLUMN, ENV_FLOWS_COLUMN, EXTRACTABLE_COLUMN} <= set(df.columns):
+            expected = df[RECHARGE_COLUMN] - df[ENV_FLOWS_COLUMN]
+            add(_relative_gap(expected, df[EXTRACTABLE_COLUMN]) > VOLUME_TOLERANCE, 'extractable_mismatch',
+                'extractable ' + df[EXTRACTABLE_COLUMN].round(2).astype(str) + ' ham vs recharge - env. flows '
+                + expected.round(2).astype(str))
+
+        numeric = df[self.numeric]
+        negative = (numeric < 0).any(axis=1)
+        add(negative, 'negative_value', pd.Series('negative value in a volume/area column', index=df.index))
+
+        if not checks:
+            return pd.DataFrame(columns=['row', 'YEAR', 'STATE', 'DISTRICT', 'check', 'detail'])
+        return pd.concat(checks, ignore_index=True)
+
+    # ------------------------------------------------------------------ views
+
+    def _select(self, table: pd.DataFrame, states: Optional[Sequence[str]] = None,
+                districts: Optional[Sequence[str]] = None, years: Optional[Sequence[int]] = None,
+                columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        mask = np.ones(len(table), dtype=bool)
+        if states:
+            mask &= table['STATE'].astype(str).str.upper().isin([s.upper() for s in states]).to_numpy()
+        if districts:
+            mask &= table['DISTRICT'].astype(str).str.upper().isin([d.upper() for d in districts]).to_numpy()
+        if years:
+            mask &= table['YEAR'].isin(list(years)).to_numpy()
+        if columns and 'column' in table.columns:
+            mask &= table['column'].isin(list(columns)).to_numpy()
+        return table[mask]
+
+    def summary(self, states: Optional[Sequence[str]] = None, districts: Optional[Sequence[str]] = None,
+                years: Optional[Sequence[int]] = None, columns: Optional[Sequence[str]] = None,
+                limit: int = 100) -> Dict[str, Any]:
+        """
+        JSON-ready report (or slice of it) used by /api/data_quality.
+        """
+        outliers = self._select(self.outliers, states, districts, years, columns)
+        suspicious = self._select(self.suspicious, states, districts, years)
+        column_stats = {col: stats for col, stats in self.columns.items() if not columns or col in columns}
+        return {
+            "overview": self.overview,
+            "filters": {"states": states, "districts": districts, "years": years, "columns": columns},
+            "thresholds": {"z": Z_THRESHOLD, "iqr_factor": IQR_FACTOR, "min_group_size": MIN_GROUP_SIZE,
+                           "stage_tolerance_points": STAGE_TOLERANCE, "volume_tolerance": VOLUME_TOLERANCE},
+            "columns": column_stats,
+            "outliers": {
+                "total": int(len(outliers)),
+                "by_column": {col: int(n) for col, n in outliers['column'].value_counts().items()},
+                "rows": _records(outliers.head(limit).drop(columns=['row'])),
+            },
+            "suspicious": {
+                "total": int(len(suspicious)),
+                "by_check": {check: int(n) for check, n in suspicious['check'].value_counts().items()},
+                "rows": _records(suspicious.head(limit).drop(columns=['row'])),
+            },
+        }
+
+    def scope_from_query(self, query: str) -> Dict[str, List[Any]]:
+        """
+        States, districts and years mentioned in a (query_maker) query, by plain
+        case-insensitive matching against the dataset's own names.
+        """
+        text = f" {re.sub(r'[^A-Z0-9]+', ' ', query.upper())} "
+        states = [s for s in self.keys['STATE'].unique() if len(s) > 2 and f" {s} " in text]
+        districts = [d for d in self.keys['DISTRICT'].unique() if len(d) > 2 and f" {d} " in text]
+        years = [int(y) for y in self.overview["years"] if str(y) in text]
+        return {"states": states, "districts": districts, "years": years}
+
+    def prompt_context(self, query: str, limit: int = 8) -> str:
+        """
+        Compact text for the agent prompt: known data issues within the query's scope.
+        """
+        scope = self.scope_from_query(query)
+        columns = [col for col in self.numeric if col.upper() in query.upper()] or None
+        outliers = self._select(self.outliers, scope["states"], scope["districts"], scope["years"], columns)
+        suspicious = self._select(self.suspicious, scope["states"], scope["districts"], scope["years"])
+        suspicious = suspicious[suspicious['check'] != 'aggregate_row']
+
+        nulls = {col: s["nulls"] for col, s in self.columns.items() if s["nulls"]}
+        non_numeric = self.overview["non_numeric_columns"]
+        lines = [
+            f"- {self.overview['rows']} rows, {self.overview['total_nulls']} nulls in total"
+            + (f" (columns with nulls: {nulls})" if nulls else "")
+            + (f"; non-numeric data columns: {non_numeric}" if non_numeric else "; all metric columns are numeric"),
+            f"- {self.overview['aggregate_rows']} national total rows have STATE == '0' and DISTRICT == '0': "
+            "exclude them from district rankings and sums",
+        ]
+        if self.overview["duplicate_keys"]:
+            lines.append(f"- Duplicate (YEAR, STATE, DISTRICT) keys: {self.overview['duplicate_keys']}")
+
+        scope_text = ", ".join(f"{k}={v}" for k, v in scope.items() if v) or "whole dataset"
+        lines.append(f"- Outliers within state/year ({scope_text}): {len(outliers)}")
+        for row in outliers.head(limit).itertuples(index=False):
+            lines.append(f"  * {row.YEAR} {row.STATE} / {row.DISTRICT}: {row.column} = {row.value} "
+                         f"(z={row.z}, {row.method})")
+        lines.append(f"- Rows with inconsistent columns ({scope_text}): {len(suspicious)}")
+        for row in suspicious.head(limit).itertuples(index=False):
+            lines.append(f"  * {row.YEAR} {row.STATE} / {row.DISTRICT}: {row.check} - {row.detail}")
+        return "\n".join(lines)
+
+
+_REPORTS: FrameCache[DataQualityReport] = FrameCache(DataQualityReport)
+
+
+def get_quality_report(df: pd.DataFrame) -> DataQualityReport:
+    """
+    Returns the (cached) DataQualityReport for this DataFrame so it is computed once.
+    """
+    return _REPORTS.get(df)
@@ -0,0 +1,62 @@
+# dataset_rows.py
+
+"""
+Row-level facts about the INGRES dataset shared by the precomputed views, and
+the per-frame cache those views are kept in.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Callable, Generic, Tuple, TypeVar
+
+import pandas as pd
+
+STAGE_COLUMN = 'Stage of Ground Water Extraction (%)'
+EXTRACTION_COLUMN = 'Ground Water Extraction for all uses (ha.m)'
+EXTRACTABLE_COLUMN = 'Annual Extractable Ground water Resource (ham)'
+RECHARGE_COLUMN = 'Annual Ground water Recharge (ham)'
+
+T = TypeVar('T')
+
+
+def aggregate_row_mask(df: pd.DataFrame) -> pd.Series:
+    """
+    Rows that are not a real district: the source data carries a national total
+    per year with STATE and DISTRICT set to '0'.
+    """
+    state = df['STATE'].astype(str).str.strip()
+    district = df['DISTRICT'].astype(str).str.strip()
+    return (state == '0') | (district == '0')
+
+
+class FrameCache(Generic[T]):
+    """
+    One value built per DataFrame, for the views that precompute over the
+    whole dataset (trend panel, similarity index, quality report, dashboard).
+
+    Entries are keyed by id(df) and checked by identity, so a recycled id never
+    returns a value built for another frame. Only the `max_frames` most recently
+    used frames are kept: the values hold their frame, and a reloaded dataset
+    must release the old one instead of pinning it for the life of the process.
+    """
+
+    def __init__(self, build: Callable[[pd.DataFrame], T], max_frames: int = 2):
+        self.build = build
+        self.max_frames = max(1, max_frames)
+        self._entries: 'OrderedDict[int, Tuple[pd.DataFrame, T]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, df: pd.DataFrame) -> T:
+        with self._lock:
+            entry = self._entries.get(id(df))
+            if entry is None or entry[0] is not df:
+                entry = (df, self.build(df))
+                self._entries[id(df)] = entry
+            self._entries.move_to_end(id(df))
+            while len(self._entries) > self.max_frames:
+                self._entries.popitem(last=False)
+            return entry[1]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,216 @@
+# export.py
+
+"""
+Streaming bulk export of filtered rows as CSV, NDJSON or Arrow IPC.
+
+Takes the same structured parameters build_pandas_filters understands. Only
+the boolean mask and the selected row positions are held for the whole
+result; rows are sliced, serialized and yielded chunk_size at a time, so
+memory stays flat regardless of how many rows match.
+"""
+
+import io
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from agents.visualizing_agent import build_filter_mask, clean_column_names
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow export is optional
+    pa = None
+
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+DEFAULT_CHUNK_SIZE = 5000
+MAX_CHUNK_SIZE = 100000
+
+
+class ExportError(ValueError):
+    """Invalid export request (unknown format, column or missing optional dependency)."""
+
+
+def resolve_columns(df: pd.DataFrame, params: Dict[str, Any]) -> List[str]:
+    columns = params.get('columns_to_show') or list(df.columns)
+    unknown = [col for col in columns if col not in df.columns]
+    if unknown:
+        raise ExportError(f"Unknown columns: {unknown}")
+    return columns
+
+
+def select_positions(df: pd.DataFrame, params: Dict[str, Any]) -> np.ndarray:
+    """
+    Row positions matching the filters, sorted and limited like sort_and_limit_data.
+    """
+    positions = np.flatnonzero(build_filter_mask(df, params).to_numpy())
+
+    sort_by = params.get('sort_by')
+    if sort_by:
+        if sort_by not in df.columns:
+            raise ExportError(f"Unknown sort column '{sort_by}'")
+        # Only the sort key of matching rows is copied; NaNs go last like sort_values
+        keys = pd.Series(df[sort_by].to_numpy()[positions])
+        ascending = (params.get('sort_order', 'desc') == 'asc')
+        positions = positions[keys.sort_values(ascending=ascending, kind='stable').index.to_numpy()]
+
+    limit = params.get('limit')
+    if limit and isinstance(limit, int) and limit > 0:
+        positions = positions[:limit]
+    return positions
+
+
+def export_chunks(df: pd.DataFrame, params: Dict[str, Any], fmt: str = "csv",
+                  chunk_size: int = DEFAULT_CHUNK_SIZE, clean_names: bool = False) -> Iterator[bytes]:
+    """
+    Validates the request eagerly, then returns a generator of encoded chunks.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError(f"Unknown format '{fmt}'. Use one of: {sorted(EXPORT_FORMATS)}")
+    if fmt == "arrow" and pa is None:
+        raise ExportError("Arrow export requires pyarrow (pip install pyarrow)")
+
+    chunk_size = max(1, min(int(chunk_size), MAX_CHUNK_SIZE))
+    columns = resolve_columns(df, params)
+    positions = select_positions(df, params)
+    rename = clean_column_names(columns) if clean_names else {}
+    return _generate(df, columns, positions, fmt, chunk_size, rename)
+
+
+def _generate(df: pd.DataFrame, columns: List[str], positions: np.ndarray, fmt: str,
+              chunk_size: int, rename: Dict[str, str]) -> Iterator[bytes]:
+    writer = None
+    sink = None
+
+    for start in range(0, max(len(positions), 1), chunk_size):
+        chunk = df.iloc[positions[start:start + chunk_size]][columns]
+        if rename:
+            chunk = chunk.rename(columns=rename)
+
+        if fmt == "csv":
+            yield chunk.to_csv(index=False, header=(start == 0)).encode("utf-8")
+        elif fmt == "ndjson":
+            if len(chunk):
+                text = chunk.to_json(orient="records", lines=True)
+                # Newer pandas already ends lines output with a newline, older versions do not
+                yield (text if text.endswith("\n") else text + "\n").encode("utf-8")
+        else:
+            batch = pa.RecordBatch.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                sink = _ChunkSink()
+                writer = pa.ipc.new_stream(sink, batch.schema)
+            if len(chunk):
+                writer.write_batch(batch)
+            yield sink.drain()
+
+    if writer is not None:
+        writer.close()  # end-of-stream marker
+        yield sink.drain()
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write target for the Arrow stream writer; drain() hands out what was written
+    since the last call, so only one record batch is buffered at a time.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._parts: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def params_from_args(args) -> Dict[str, Any]:
+    """
+    Query-string form of the filter parameters (comma-separated lists):
+    states, districts, years, stage, stage_min, stage_max, columns, sort_by, sort_order, limit.
+    """
+    def split(name) -> List[str]:
+        value = args.get(name)
+        return [item.strip() for item in value.split(',') if item.strip()] if value else []
+
+    def number(name) -> Optional[float]:
+        value = args.get(name)
+        return float(value) if value not in (None, "") else None
+
+    try:
+        return {
+            "states": split("states"),
+            "districts": split("districts"),
+            "years": [int(y) for y in split("years")],
+            "stage_filter": {"type": args.get("stage", "none"), "min": number("stage_min"),
+                             "max": number("stage_max")},
+            "columns_to_show": split("columns"),
+            "sort_by": args.get("sort_by"),
+            "sort_order": args.get("sort_order", "desc"),
+            "limit": int(args["limit"]) if args.get("limit") else None,
+        }
+    except ValueError as e:
+        raise ExportError(f"Invalid export parameter: {e}")
+
+
+def params_from_json(body: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    JSON-body form of the filter parameters, with the extract_query_parameters keys.
+    Lists may also be given as comma-separated strings and numbers as strings;
+    anything else of the wrong type is rejected instead of being iterated or ignored.
+    """
+    def listed(name) -> List[str]:
+        value = body.get(name)
+        if value is None:
+            return []
+        if isinstance(value, str):
+            return [item.strip() for item in value.split(',') if item.strip()]
+        if isinstance(value, list) and all(isinstance(item, (str, int)) for item in value):
+            return [str(item).strip() for item in value if str(item).strip()]
+        raise ValueError(f"'{name}' must be a list of strings")
+
+    def number(value, name) -> Optional[float]:
+        if value in (None, ""):
+            return None
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            raise ValueError(f"'{name}' must be a number")
+        return float(value)
+
+    def text(value, name) -> Optional[str]:
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f"'{name}' must be a string")
+        return value
+
+    try:
+        stage_filter = body.get("stage_filter") or {}
+        if not isinstance(stage_filter, dict):
+            raise ValueError("'stage_filter' must be an object")
+        limit = body.get("limit")
+        if isinstance(limit, (bool, float)) or not isinstance(limit, (type(None), int, str)):
+            raise ValueError("'limit' must be an integer")
+
+        return {
+            "states": listed("states"),
+            "districts": listed("districts"),
+            "years": [int(y) for y in listed("years")],
+            "stage_filter": {"type": text(stage_filter.get("type"), "stage_filter.type") or "none",
+                             "min": number(stage_filter.get("min"), "stage_filter.min"),
+                             "max": number(stage_filter.get("max"), "stage_filter.max")},
+            "columns_to_show": listed("columns_to_show"),
+            "sort_by": text(body.get("sort_by"), "sort_by"),
+            "sort_order": text(body.get("sort_order"), "sort_order") or "desc",
+            "limit": int(limit) if limit not in (None, "") else None,
+        }
+    except ValueError as e:
+        raise ExportError(f"Invalid export parameter: {e}")
@@ -0,0 +1,23 @@
+# gunicorn.conf.py
+#
+# Multi-process serving with one shared copy of the dataset:
+#     gunicorn -c gunicorn.conf.py app:app
+#
+# The app is preloaded in the master, which publishes ingres_one.csv to shared
+# memory (see shared_dataset.py); forked workers inherit the read-only mapping.
+# Conversation sessions and background jobs (/api/jobs) live in the memory of
+# the worker that created them: a poll that lands on another worker gets a 404.
+# With more than one worker, put sticky routing (per client) in front, or run
+# the job API with INGRES_WORKERS=1 and raise INGRES_THREADS instead.
+
+import multiprocessing
+import os
+
+os.environ.setdefault("INGRES_SHARED_DATASET", "1")
+
+bind = os.getenv("INGRES_BIND", "127.0.0.1:5000")
+workers = int(os.getenv("INGRES_WORKERS", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.getenv("INGRES_THREADS", "4"))
+preload_app = True
+timeout = 180  # the agent pipeline makes several sequential LLM calls
@@ -0,0 +1,442 @@
+# ingest.py
+
+"""
+Chunked, schema-validated ingestion of INGRES assessment files into the columnar store.
+
+Each CSV is streamed in chunks; headers are normalized to the canonical schema
+(the column names of ingres_one.csv that the agents use, plus an optional
+BLOCK column for block/firka/mandal/taluk-level files), values are type- and
+range-checked and appended to the store as Parquet part files. Files already
+ingested (same content hash) are skipped, so re-running over a folder only adds
+new data; --force re-ingests a file, replacing the rows it wrote before.
+
+Rows are keyed on (YEAR, STATE, DISTRICT[, BLOCK]) and the latest row wins at
+every level: later rows in a file replace earlier ones, and a later ingested
+file replaces what earlier files stored. Superseded rows stay in their parts
+until they are rewritten; load_store resolves the key to the last one written.
+
+Store layout:
+    <store>/part-<n>.parquet   one part per ingested chunk, all with STORE_SCHEMA
+    <store>/_manifest.json     ingested files (with the parts each wrote), row counts, throughput
+    <store>/_rejects/*.csv     rejected rows with the reason, for review
+
+Usage:
+    python ingest.py data/raw/*.csv --store data_store
+    INGRES_DATA_STORE=data_store python app.py     # serve from the store
+
+Requires pyarrow.
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # only needed for the columnar store
+    pa = None
+    pq = None
+
+KEY_TEXT_COLUMNS = ['STATE', 'DISTRICT']
+BLOCK_COLUMN = 'BLOCK'
+
+# Canonical schema: the ingres_one.csv columns in their original order
+NUMERIC_COLUMNS = [
+    'Rainfall (mm)',
+    'Total Geographical Area (ha) - Recharge Worthy Area (ha).3',
+    'Total Geographical Area (ha) - Hilly Area',
+    'Total Geographical Area (ha)',
+    'Ground Water Recharge (ham) - Rainfall Recharge.3',
+    'Ground Water Recharge (ham) - Canals.3',
+    'Ground Water Recharge (ham) - Surface Water Irrigation.3',
+    'Ground Water Recharge (ham) - Ground Water Irrigation.3',
+    'Ground Water Recharge (ham) - Tanks and Ponds.3',
+    'Ground Water Recharge (ham) - Water Conservation Structure.3',
+    'Ground Water Recharge (ham)',
+    'Annual Ground water Recharge (ham)',
+    'Environmental Flows (ham)',
+    'Annual Extractable Ground water Resource (ham)',
+    'Ground Water Extraction for all uses (ha.m) - Domestic.3',
+    'Ground Water Extraction for all uses (ha.m) - Industrial.3',
+    'Ground Water Extraction for all uses (ha.m) - Irrigation.3',
+    'Ground Water Extraction for all uses (ha.m)',
+    'Stage of Ground Water Extraction (%)',
+    'Allocation of Ground Water Resource for Domestic Utilisation for projected year 2025 (ham)',
+    'Net Annual Ground Water Availability for Future Use (ham)',
+    'In-Storage Unconfined Ground Water Resources(ham) - Fresh',
+    'In-Storage Unconfined Ground Water Resources(ham).1 - Saline',
+    'Total Ground Water Availability in Unconfined Aquifier (ham) - Fresh',
+    'Total Ground Water Availability in Unconfined Aquifier (ham).1 - Saline',
+    'Total Ground Water Availability in the area (ham) - Fresh',
+    'Total Ground Water Availability in the area (ham).1 - Saline',
+]
+CANONICAL_COLUMNS = ['YEAR', 'STATE', 'DISTRICT'] + NUMERIC_COLUMNS + [BLOCK_COLUMN]
+
+# Header spellings seen in raw INGRES exports that normalization alone does not catch
+HEADER_ALIASES = {
+    'assessment year': 'YEAR',
+    'name of state': 'STATE',
+    'state name': 'STATE',
+    'name of district': 'DISTRICT',
+    'district name': 'DISTRICT',
+    'block': BLOCK_COLUMN,
+    'name of block': BLOCK_COLUMN,
+    'assessment unit': BLOCK_COLUMN,
+    'assessment unit name': BLOCK_COLUMN,
+    'firka': BLOCK_COLUMN,
+    'mandal': BLOCK_COLUMN,
+    'taluk': BLOCK_COLUMN,
+    'tehsil': BLOCK_COLUMN,
+}
+
+# Plausible value ranges; values outside reject the row
+YEAR_RANGE = (1990, 2100)
+STAGE_RANGE = (0, 5000)
+RAINFALL_RANGE = (0, 15000)
+
+if pa is not None:
+    STORE_SCHEMA = pa.schema(
+        [pa.field('YEAR', pa.int64()), pa.field('STATE', pa.string()), pa.field('DISTRICT', pa.string())]
+        + [pa.field(col, pa.float64()) for col in NUMERIC_COLUMNS]
+        + [pa.field(BLOCK_COLUMN, pa.string())]
+    )
+else:
+    STORE_SCHEMA = None
+
+
+class IngestError(ValueError):
+    """A file cannot be ingested (e.g. required columns missing)."""
+
+
+def normalize_header(header: str) -> str:
+    """
+    Comparable form of a header: lowercase, no '.1'/'.3' de-duplication suffixes,
+    unit spellings unified, punctuation collapsed to single spaces.
+    """
+    h = str(header).lower()
+    h = re.sub(r'\.\d+(?=\s|$|-)', '', h)
+    h = h.replace('ha.m', 'ham').replace('aquifier', 'aquifer')
+    h = re.sub(r'projected year \d{4}', 'projected year', h)
+    return re.sub(r'[^a-z0-9%]+', ' ', h).strip()
+
+
+_CANONICAL_BY_NORMALIZED = {normalize_header(col): col for col in CANONICAL_COLUMNS}
+_CANONICAL_BY_NORMALIZED.update(HEADER_ALIASES)
+
+
+def map_headers(headers: Iterable[str]) -> Tuple[Dict[str, str], List[str]]:
+    """
+    Returns ({raw header: canonical column}, [unmapped raw headers]).
+    When two raw headers map to the same column, the first one wins.
+    """
+    mapping: Dict[str, str] = {}
+    unmapped: List[str] = []
+    taken: Set[str] = set()
+    for raw in headers:
+        canonical = _CANONICAL_BY_NORMALIZED.get(normalize_header(raw))
+        if canonical is None or canonical in taken:
+            unmapped.append(raw)
+            continue
+        mapping[raw] = canonical
+        taken.add(canonical)
+
+    missing = [col for col in ['YEAR', 'STATE', 'DISTRICT'] if col not in taken]
+    if missing:
+        raise IngestError(f"Required columns not found: {missing}")
+    return mapping, unmapped
+
+
+def validate_chunk(raw: pd.DataFrame, mapping: Dict[str, str]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Canonicalizes one chunk (read as strings) and splits it into (valid, rejected)
+    rows. Rejected rows carry a 'reject_reason' column.
+    """
+    chunk = raw[list(mapping)].rename(columns=mapping)
+    out = pd.DataFrame(index=chunk.index)
+    reasons = pd.Series('', index=chunk.index, dtype=object)
+
+    def flag(mask: pd.Series, reason: str):
+        reasons[mask & (reasons == '')] = reason
+
+    for col in KEY_TEXT_COLUMNS + [BLOCK_COLUMN]:
+        if col in chunk:
+            values = chunk[col].astype('string').str.strip().str.replace(r'\s+', ' ', regex=True)
+            out[col] = values.replace('', pd.NA)
+        else:
+            out[col] = pd.Series(pd.NA, index=chunk.index, dtype='string')
+    out['STATE'] = out['STATE'].str.upper()
+    flag(out['STATE'].isna() | out['DISTRICT'].isna(), 'missing STATE/DISTRICT')
+
+    years = pd.to_numeric(chunk['YEAR'].astype('string').str.extract(r'(\d{4})')[0], errors='coerce')
+    flag(years.isna(), 'invalid YEAR')
+    flag(years.notna() & ~years.between(*YEAR_RANGE), 'YEAR out of range')
+    out['YEAR'] = years
+
+    for col in NUMERIC_COLUMNS:
+        if col not in chunk:
+            out[col] = np.nan
+            continue
+        text = chunk[col].astype('string').str.strip().str.replace(',', '', regex=False)
+        values = pd.to_numeric(text, errors='coerce')
+        flag(values.isna() & text.notna() & (text != '') & (text.str.upper() != 'NA'), f'non-numeric {col}')
+        if col == 'Stage of Ground Water Extraction (%)':
+            flag(values.notna() & ~values.between(*STAGE_RANGE), 'stage % out of range')
+        elif col == 'Rainfall (mm)':
+            flag(values.notna() & ~values.between(*RAINFALL_RANGE), 'rainfall out of range')
+        else:
+            flag(values < 0, f'negative {col}')
+        out[col] = values.astype(float)
+
+    out = out[CANONICAL_COLUMNS]
+    bad = reasons != ''
+    rejected = raw[bad].assign(reject_reason=reasons[bad])
+    valid = out[~bad].astype({'YEAR': 'int64'})
+    return valid, rejected
+
+
+def dedupe_key(df: pd.DataFrame) -> pd.Series:
+    """
+    String key per row on (YEAR, STATE, DISTRICT[, BLOCK]), case-insensitive.
+    """
+    return (
+        df['YEAR'].astype(str) + '|' + df['STATE'].astype('string').str.upper()
+        + '|' + df['DISTRICT'].astype('string').str.upper()
+        + '|' + df[BLOCK_COLUMN].astype('string').str.upper().fillna('')
+    )
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ColumnarStore:
+    def __init__(self, path: str):
+        if pa is None:
+            raise IngestError("The columnar store requires pyarrow (pip install pyarrow)")
+        self.path = path
+        self.manifest_path = os.path.join(path, '_manifest.json')
+        os.makedirs(path, exist_ok=True)
+        self.manifest = self._read_manifest()
+        self._keys: Optional[Set[str]] = None
+
+    def _read_manifest(self) -> Dict[str, Any]:
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        return {"files": {}, "parts": 0, "rows": 0}
+
+    def save_manifest(self):
+        tmp = self.manifest_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp, self.manifest_path)
+
+    def part_files(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.path, 'part-*.parquet')))
+
+    def keys(self, exclude: Iterable[str] = ()) -> Set[str]:
+        """
+        Dedupe keys already in the store (reads only the key columns), leaving out
+        the parts named in exclude.
+        """
+        exclude = set(exclude)
+        if self._keys is not None and not exclude:
+            return self._keys
+
+        keys: Set[str] = set()
+        for part in self.part_files():
+            if os.path.basename(part) in exclude:
+                continue
+            table = pq.read_table(part, columns=['YEAR', 'STATE', 'DISTRICT', BLOCK_COLUMN])
+            keys.update(dedupe_key(table.to_pandas()))
+        if not exclude:
+            self._keys = keys
+        return keys
+
+    def append(self, df: pd.DataFrame) -> str:
+        """
+        Writes df as the next part and returns the part's file name.
+        """
+        name = f"part-{self.manifest['parts']:06d}.parquet"
+        part = os.path.join(self.path, name)
+        table = pa.Table.from_pandas(df, schema=STORE_SCHEMA, preserve_index=False)
+        pq.write_table(table, part + '.tmp')
+        os.replace(part + '.tmp', part)
+        self.manifest['parts'] += 1
+        self.manifest['rows'] += len(df)
+        self.save_manifest()  # part counter stays in step with the files on disk
+        return name
+
+    def remove_parts(self, names: Iterable[str]):
+        """
+        Deletes parts (e.g. the rows of a file being re-ingested).
+        """
+        for name in names:
+            part = os.path.join(self.path, name)
+            if not os.path.exists(part):
+                continue
+            self.manifest['rows'] -= pq.ParquetFile(part).metadata.num_rows
+            os.remove(part)
+        self._keys = None  # rebuilt from the remaining parts on next use
+        self.save_manifest()
+
+
+def ingest_file(path: str, store: ColumnarStore, chunk_size: int = 50000,
+                force: bool = False) -> Dict[str, Any]:
+    """
+    Streams one file into the store. Returns its stats: 'duplicates' counts rows
+    replaced by a later row of the same file, 'updated' rows replacing a key
+    stored by an earlier file. With force, the rows a previous ingest of this
+    file wrote are replaced by this run's.
+    """
+    digest = file_hash(path)
+    previous = store.manifest['files'].get(digest)
+    if previous is not None and not force:
+        return {"file": path, "skipped": "already ingested"}
+
+    started = time.time()
+    stats = {"file": path, "rows_read": 0, "rows_written": 0, "rows_rejected": 0,
+             "duplicates": 0, "updated": 0, "unmapped_headers": [], "reject_reasons": {}, "parts": []}
+    rejects_path = os.path.join(store.path, '_rejects', f"{os.path.basename(path)}.{digest[:8]}.csv")
+    replaced = (previous or {}).get("parts", [])
+    if previous is not None:
+        if not replaced:
+            print(f"⚠️ {path}: the manifest does not list the parts of the earlier ingest; "
+                  f"its rows stay, superseded by this run")
+        if os.path.exists(rejects_path):
+            os.remove(rejects_path)
+    # The file's own earlier rows are not 'updates' of other data
+    known = store.keys(exclude=replaced)
+    seen: Set[str] = set()
+
+    reader = pd.read_csv(path, dtype=str, chunksize=chunk_size, keep_default_na=False,
+                         skipinitialspace=True)
+    mapping = None
+    for raw in reader:
+        if mapping is None:
+            mapping, stats["unmapped_headers"] = map_headers(raw.columns)
+
+        valid, rejected = validate_chunk(raw, mapping)
+        stats["rows_read"] += len(raw)
+
+        # Latest row wins: within the chunk only the last copy is written, rows of
+        # earlier chunks and files with the same key are superseded at load time
+        keys = dedupe_key(valid)
+        keep = ~keys.duplicated(keep='last')
+        valid, keys = valid[keep], keys[keep]
+        repeated = keys.isin(seen)
+        stats["duplicates"] += int((~keep).sum() + repeated.sum())
+        stats["updated"] += int((~repeated & keys.isin(known)).sum())
+        seen.update(keys)
+
+        if len(valid):
+            stats["parts"].append(store.append(valid))
+            stats["rows_written"] += len(valid)
+
+        if len(rejected):
+            os.makedirs(os.path.dirname(rejects_path), exist_ok=True)
+            rejected.to_csv(rejects_path, mode='a', index=False,
+                            header=not os.path.exists(rejects_path))
+            stats["rows_rejected"] += len(rejected)
+            for reason, count in rejected['reject_reason'].value_counts().items():
+                stats["reject_reasons"][reason] = stats["reject_reasons"].get(reason, 0) + int(count)
+
+    elapsed = time.time() - started
+    stats["seconds"] = round(elapsed, 3)
+    stats["rows_per_second"] = round(stats["rows_read"] / elapsed) if elapsed > 0 else None
+
+    known.update(seen)
+    store.manifest['files'][digest] = {k: v for k, v in stats.items() if k != "unmapped_headers"}
+    store.save_manifest()
+    if replaced:
+        # Only once the new parts are written: until then the old rows stay, superseded
+        store.remove_parts(replaced)
+    return stats
+
+
+def load_store(path: str, level: str = "district") -> pd.DataFrame:
+    """
+    Reads the store back as a DataFrame in the canonical (ingres_one.csv) layout,
+    one row per key: the one written last (parts are numbered in write order).
+    level='district' keeps district-level rows only (no BLOCK), which is what the
+    agents expect; level='block' keeps block-level rows; level='all' keeps both.
+    """
+    if pa is None:
+        raise IngestError("The columnar store requires pyarrow (pip install pyarrow)")
+    parts = sorted(glob.glob(os.path.join(path, 'part-*.parquet')))
+    if not parts:
+        raise FileNotFoundError(f"No data in store '{path}'")
+    # One table per part keeps the write order; a multi-file read does not promise it
+    df = pa.concat_tables([pq.read_table(part, schema=STORE_SCHEMA) for part in parts]).to_pandas()
+    df = df[~dedupe_key(df).duplicated(keep='last').to_numpy()]
+    for col in KEY_TEXT_COLUMNS + [BLOCK_COLUMN]:
+        df[col] = df[col].astype(object)
+
+    if level == "district":
+        df = df[df[BLOCK_COLUMN].isna()].drop(columns=[BLOCK_COLUMN])
+    elif level == "block":
+        df = df[df[BLOCK_COLUMN].notna()]
+    return df.sort_values(['YEAR', 'STATE', 'DISTRICT'], ascending=[False, True, True], kind='stable').reset_index(drop=True)
+
+
+def expand_paths(patterns: Iterable[str]) -> List[str]:
+    paths: List[str] = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths.extend(sorted(glob.glob(os.path.join(pattern, '**', '*.csv'), recursive=True)))
+        else:
+            paths.extend(sorted(glob.glob(pattern)) or [pattern])
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest INGRES assessment CSVs into the columnar store")
+    parser.add_argument("paths", nargs="+", help="CSV files, globs or directories")
+    parser.add_argument("--store", default=os.getenv("INGRES_DATA_STORE", "data_store"))
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--force", action="store_true",
+                        help="Re-ingest files already in the manifest, replacing their earlier rows")
+    args = parser.parse_args(argv)
+
+    store = ColumnarStore(args.store)
+    started = time.time()
+    total_rows = 0
+    for path in expand_paths(args.paths):
+        try:
+            stats = ingest_file(path, store, args.chunk_size, args.force)
+        except (IngestError, OSError, pd.errors.ParserError) as e:
+            print(f"❌ {path}: {e}")
+            continue
+        if stats.get("skipped"):
+            print(f"⏭️  {path}: {stats['skipped']}")
+            continue
+        total_rows += stats["rows_read"]
+        print(f"✅ {path}: {stats['rows_written']} written, {stats['updated']} updated, "
+              f"{stats['duplicates']} duplicates, {stats['rows_rejected']} rejected, "
+              f"{stats['rows_per_second']} rows/s")
+        if stats["unmapped_headers"]:
+            print(f"   ignored columns: {stats['unmapped_headers']}")
+        for reason, count in stats["reject_reasons"].items():
+            print(f"   rejected ({reason}): {count}")
+
+    elapsed = time.time() - started
+    rate = round(total_rows / elapsed) if elapsed > 0 else None
+    print(f"\n📦 Store '{args.store}': {store.manifest['rows']} rows in {len(store.part_files())} parts; "
+          f"{total_rows} rows read this run at {rate} rows/s")
+
+
+if __name__ == "__main__":
+    main()
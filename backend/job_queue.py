@@ -0,0 +1,226 @@
+# job_queue.py
+
+"""
+In-process background job queue for agent runs (no external broker).
+
+POST /api/jobs enqueues a run and returns immediately; worker threads pick
+jobs by role priority, record each finished pipeline stage as it happens and
+store the final response. Clients poll or long-poll GET /api/jobs/<id>.
+
+Jobs live in the memory of the process that accepted them: with several
+gunicorn workers, polls must reach that same worker (single worker or sticky
+routing, see gunicorn.conf.py). Submissions are refused once max_queued jobs
+are waiting.
+"""
+
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+# Lower number = served first. Override with INGRES_JOB_PRIORITIES='{"researcher": 0}'.
+ROLE_PRIORITIES: Dict[str, int] = {
+    "government": 0,
+    "researcher": 1,
+    "citizen": 2,
+    "user": 2,
+}
+DEFAULT_PRIORITY = 2
+
+try:
+    ROLE_PRIORITIES.update(json.loads(os.getenv("INGRES_JOB_PRIORITIES", "{}")))
+except (json.JSONDecodeError, TypeError, ValueError) as e:
+    print(f"⚠️ Ignoring invalid INGRES_JOB_PRIORITIES: {e}")
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class QueueFull(Exception):
+    """Raised by JobQueue.submit when max_queued jobs are already waiting."""
+
+
+class Job:
+    def __init__(self, query: str, role: str, session_id: Optional[str], priority: int):
+        self.job_id = uuid.uuid4().hex
+        self.query = query
+        self.role = role
+        self.session_id = session_id
+        self.priority = priority
+        self.status = QUEUED
+        self.stages: List[Dict[str, Any]] = []
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.version = 0  # bumped on every change, used by long-polling clients
+        self.changed = threading.Condition()
+
+    def _touch(self):
+        # Caller holds self.changed
+        self.version += 1
+        self.changed.notify_all()
+
+    def add_stage(self, stage: str, result: Any):
+        with self.changed:
+            self.stages.append({"stage": stage, "result": result, "finished_at": time.time()})
+            self._touch()
+
+    def set_status(self, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        with self.changed:
+            self.status = status
+            if status == RUNNING:
+                self.started_at = time.time()
+            if status in FINISHED_STATES:
+                self.finished_at = time.time()
+            if result is not None:
+                self.result = result
+            if error is not None:
+                self.error = error
+            self._touch()
+
+    def transition(self, expected: str, status: str) -> bool:
+        """
+        Atomically moves the job from expected to status (e.g. queued -> running).
+        """
+        with self.changed:  # Condition wraps an RLock, so set_status can re-enter
+            if self.status != expected:
+                return False
+            self.set_status(status)
+            return True
+
+    def wait_for_change(self, since_version: int, timeout: float) -> bool:
+        """
+        Blocks until the job changes past since_version or finishes. Returns True on change.
+        """
+        with self.changed:
+            return self.changed.wait_for(
+                lambda: self.version > since_version or self.status in FINISHED_STATES,
+                timeout=timeout,
+            )
+
+    def to_dict(self, include_stages: bool = True) -> Dict[str, Any]:
+        with self.changed:
+            data = {
+                "job_id": self.job_id,
+                "status": self.status,
+                "query": self.query,
+                "role": self.role,
+                "session_id": self.session_id,
+                "priority": self.priority,
+                "version": self.version,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "completed_stages": [s["stage"] for s in self.stages],
+                "result": self.result,
+                "error": self.error,
+            }
+            if include_stages:
+                data["stages"] = list(self.stages)
+            return data
+
+
+class JobQueue:
+    """
+    Priority queue + fixed pool of worker threads. runner(query, role, session_id, on_stage)
+    must return the final response dict (app.execute_pipeline).
+    At most max_queued jobs wait at once; finished jobs are kept for result_ttl
+    seconds, at most max_jobs in total.
+    """
+
+    def __init__(self, runner: Callable[..., Dict[str, Any]], workers: int = 4,
+                 max_jobs: int = 1000, result_ttl: float = 3600, max_queued: int = 100):
+        self.runner = runner
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self._queue: "queue.PriorityQueue" = queue.PriorityQueue()
+        self._order = itertools.count()  # FIFO within a priority level
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._started = False
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._started = True
+
+    def _prune(self, now: float):
+        # Caller holds self._lock. Oldest first; unfinished jobs are never dropped.
+        for job_id, job in list(self._jobs.items()):
+            if job.status not in FINISHED_STATES:
+                continue
+            expired = self.result_ttl > 0 and now - job.finished_at > self.result_ttl
+            if expired or len(self._jobs) > self.max_jobs:
+                del self._jobs[job_id]
+
+    def submit(self, query: str, role: str, session_id: Optional[str] = None) -> Job:
+        """
+        Enqueues a run. Raises QueueFull when the backlog is already at max_queued.
+        """
+        self.start()
+        job = Job(query, role, session_id, ROLE_PRIORITIES.get(role, DEFAULT_PRIORITY))
+        with self._lock:
+            self._prune(time.time())
+            waiting = sum(1 for j in self._jobs.values() if j.status == QUEUED)
+            if waiting >= self.max_queued:
+                raise QueueFull(f"{waiting} jobs are already waiting (limit {self.max_queued})")
+            self._jobs[job.job_id] = job
+        self._queue.put((job.priority, next(self._order), job.job_id))
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancels a job that has not started yet. Running jobs cannot be interrupted.
+        """
+        job = self.get(job_id)
+        return job is not None and job.transition(QUEUED, CANCELLED)
+
+    def queue_position(self, job: Job) -> Optional[int]:
+        if job.status != QUEUED:
+            return None
+        with self._lock:
+            waiting = [j for j in self._jobs.values() if j.status == QUEUED]
+        ahead = [j for j in waiting if (j.priority, j.created_at) < (job.priority, job.created_at)]
+        return len(ahead)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return {"workers": self.workers, "max_queued": self.max_queued, "jobs": counts}
+
+    def _worker(self):
+        while True:
+            _, _, job_id = self._queue.get()
+            job = self.get(job_id)
+            if job is None or not job.transition(QUEUED, RUNNING):
+                continue  # cancelled or pruned while waiting
+
+            try:
+                result = self.runner(job.query, job.role, job.session_id, on_stage=job.add_stage)
+                job.set_status(SUCCEEDED, result=result)
+            except Exception as e:
+                print(f"❌ Job {job.job_id} failed: {e}")
+                traceback.print_exc()
+                job.set_status(FAILED, error=str(e))
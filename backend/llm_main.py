@@ -8,4 +8,7 @@ load_dotenv()
 
 GOOGLE_API_KEYS = os.getenv("GOOGLE_API_KEY")
 
-llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0.5,google_api_key=GOOGLE_API_KEYS)
\ No newline at end of file
+# Optional: point the client at another endpoint (e.g. mock_gemini.py for load tests)
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL")
+
+llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0.5,google_api_key=GOOGLE_API_KEYS,base_url=GEMINI_BASE_URL)
@@ -0,0 +1,425 @@
+# loadtest.py
+
+"""
+Load-testing harness for the Flask API.
+
+Starts mock_gemini.py in-process, launches app.py under one or more serving
+configurations with GEMINI_BASE_URL pointing at the mock, drives
+/api/run_agent with a closed- or open-loop workload and reports throughput,
+latency percentiles, error rates and server CPU/RSS over time.
+
+Examples:
+    # 16 concurrent chat users, threaded dev server vs 4 gunicorn workers
+    python loadtest.py --serving threaded,multiprocess --mode closed --users 16 --duration 60
+
+    # Poisson arrivals at 5 req/s against the async (gevent) config, slower and flaky LLM
+    python loadtest.py --serving async --mode open --rate 5 --latency-ms 1500 --error-rate 0.05
+
+Serving configurations:
+    threaded     - werkzeug server, one process, a thread per request
+    multiprocess - gunicorn sync workers (--workers); werkzeug processes if gunicorn is missing
+    gthread      - gunicorn threaded workers (--workers x --threads)
+    async        - gunicorn gevent workers (needs gevent)
+"""
+
+import argparse
+import importlib.util
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from mock_gemini import add_mock_arguments, latency_from_args, start_mock_server
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_QUERIES = [
+    ("Which districts in Punjab are over-exploited?", "citizen"),
+    ("Compare groundwater extraction in Punjab and Haryana", "government"),
+    ("Analyze groundwater recharge patterns in Rajasthan", "researcher"),
+    ("Show me a bar chart of stage of extraction in Punjab for 2024", "citizen"),
+    ("Give policy recommendations for critical districts in Tamil Nadu", "government"),
+]
+
+
+# --------------------------------------------------------------------------- server
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _has_module(name: str) -> bool:
+    return importlib.util.find_spec(name) is not None
+
+
+def build_server_command(serving: str, host: str, port: int, workers: int, threads: int) -> List[str]:
+    bind = f"{host}:{port}"
+    # gunicorn would otherwise load ./gunicorn.conf.py (preload + shared dataset) for every
+    # config; the load test sets everything it compares explicitly
+    gunicorn = [sys.executable, "-m", "gunicorn", "-c", os.devnull]
+    if serving == "threaded":
+        code = ("from werkzeug.serving import run_simple; from app import app; "
+                f"run_simple({host!r}, {port}, app, threaded=True)")
+        return [sys.executable, "-c", code]
+
+    if serving == "multiprocess":
+        if _has_module("gunicorn"):
+            return gunicorn + ["-w", str(workers), "-k", "sync", "-b", bind, "app:app"]
+        print("⚠️ gunicorn not installed - using werkzeug with processes instead")
+        code = ("from werkzeug.serving import run_simple; from app import app; "
+                f"run_simple({host!r}, {port}, app, threaded=False, processes={workers})")
+        return [sys.executable, "-c", code]
+
+    if serving == "gthread":
+        if not _has_module("gunicorn"):
+            raise RuntimeError("Serving config 'gthread' needs gunicorn (pip install gunicorn)")
+        return gunicorn + ["-w", str(workers), "-k", "gthread", "--threads", str(threads), "-b", bind, "app:app"]
+
+    if serving == "async":
+        if not (_has_module("gunicorn") and _has_module("gevent")):
+            raise RuntimeError("Serving config 'async' needs gunicorn and gevent (pip install gunicorn gevent)")
+        return gunicorn + ["-w", str(workers), "-k", "gevent", "--worker-connections", str(threads * 10),
+                           "-b", bind, "app:app"]
+
+    raise ValueError(f"Unknown serving config '{serving}'")
+
+
+def start_app(serving: str, mock_url: str, host: str, port: int, workers: int, threads: int,
+              timeout: float = 120, shared_dataset: bool = False) -> subprocess.Popen:
+    env = dict(os.environ)
+    env["GEMINI_BASE_URL"] = mock_url
+    env["GOOGLE_API_KEY"] = "mock-key"
+    env["PYTHONUNBUFFERED"] = "1"
+    # Only --shared-dataset turns it on, not whatever the calling shell exported
+    env["INGRES_SHARED_DATASET"] = "1" if shared_dataset else "0"
+
+    cmd = build_server_command(serving, host, port, workers, threads)
+    proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server '{serving}' exited during startup (code {proc.returncode})")
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return proc
+        except OSError:
+            time.sleep(0.25)
+    stop_app(proc)
+    raise RuntimeError(f"Server '{serving}' did not start within {timeout}s")
+
+
+def stop_app(proc: subprocess.Popen):
+    if proc.poll() is None:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+
+# -------------------------------------------------------------------------- monitor
+
+class ResourceMonitor(threading.Thread):
+    """
+    Samples CPU % and RSS of the server process tree (gunicorn master + workers)
+    from /proc. On platforms without /proc the timeline stays empty.
+    """
+
+    def __init__(self, pid: int, interval: float = 1.0):
+        super().__init__(name="resource-monitor", daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples: List[Dict[str, float]] = []
+        self._stop_event = threading.Event()
+        self._clock_ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+        self._page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+    def _tree(self) -> List[int]:
+        pids = [self.pid]
+        try:
+            children: Dict[int, List[int]] = {}
+            for entry in os.listdir("/proc"):
+                if entry.isdigit():
+                    stat = self._read_stat(int(entry))
+                    if stat:
+                        children.setdefault(int(stat[1]), []).append(int(entry))
+        except OSError:
+            return pids
+        i = 0
+        while i < len(pids):
+            pids.extend(children.get(pids[i], []))
+            i += 1
+        return pids
+
+    @staticmethod
+    def _read_stat(pid: int) -> Optional[List[str]]:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                data = f.read()
+        except OSError:
+            return None
+        # Fields after the parenthesised command name; index 1 = ppid, 11/12 = utime/stime, 21 = rss pages
+        return data[data.rfind(")") + 2:].split()
+
+    def _snapshot(self):
+        cpu_ticks, rss_pages, procs = 0, 0, 0
+        for pid in self._tree():
+            stat = self._read_stat(pid)
+            if stat:
+                cpu_ticks += int(stat[11]) + int(stat[12])
+                rss_pages += int(stat[21])
+                procs += 1
+        return cpu_ticks / self._clock_ticks, rss_pages * self._page_size, procs
+
+    def run(self):
+        if not os.path.isdir("/proc"):
+            return
+        start = time.time()
+        last_cpu, _, _ = self._snapshot()
+        last_t = start
+        while not self._stop_event.wait(self.interval):
+            cpu, rss, procs = self._snapshot()
+            now = time.time()
+            self.samples.append({
+                "t": round(now - start, 2),
+                "cpu_percent": round(max(cpu - last_cpu, 0) / (now - last_t) * 100, 1),
+                "rss_mb": round(rss / 1024 / 1024, 1),
+                "processes": procs,
+            })
+            last_cpu, last_t = cpu, now
+
+    def stop(self):
+        self._stop_event.set()
+        self.join(timeout=self.interval * 2)
+
+
+# ------------------------------------------------------------------------- workload
+
+class LoadResult:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.records: List[Dict[str, Any]] = []
+
+    def add(self, started: float, latency: float, status: Any):
+        with self.lock:
+            self.records.append({"start": started, "latency": latency, "status": status})
+
+
+def send_request(url: str, query: str, role: str, timeout: float) -> Any:
+    body = json.dumps({"query": query, "role": role}).encode("utf-8")
+    req = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"}, method="POST")
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            resp.read()
+            return resp.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except (urllib.error.URLError, socket.timeout, ConnectionError) as e:
+        return type(getattr(e, "reason", e)).__name__
+
+
+def run_closed_loop(url: str, users: int, duration: float, think_ms: float, timeout: float,
+                    queries, result: LoadResult, rng: random.Random):
+    """
+    Each user sends a request, waits for the answer, thinks, and repeats.
+    """
+    stop_at = time.time() + duration
+
+    def user_loop(seed: int):
+        local = random.Random(seed)
+        while time.time() < stop_at:
+            query, role = local.choice(queries)
+            started = time.time()
+            status = send_request(url, query, role, timeout)
+            result.add(started, time.time() - started, status)
+            if think_ms > 0:
+                time.sleep(local.expovariate(1000.0 / think_ms))
+
+    threads = [threading.Thread(target=user_loop, args=(rng.random(),), daemon=True) for _ in range(users)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def run_open_loop(url: str, rate: float, duration: float, max_inflight: int, timeout: float,
+                  queries, result: LoadResult, rng: random.Random):
+    """
+    Poisson arrivals at a fixed rate regardless of how fast the server answers.
+    Latency is measured from the scheduled arrival time, so client-side queueing
+    is not hidden (no coordinated omission).
+    """
+    def fire(scheduled: float, query: str, role: str):
+        status = send_request(url, query, role, timeout)
+        result.add(scheduled, time.time() - scheduled, status)
+
+    start = time.time()
+    next_at = start
+    with ThreadPoolExecutor(max_workers=max_inflight) as pool:
+        while next_at < start + duration:
+            delay = next_at - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            query, role = rng.choice(queries)
+            pool.submit(fire, next_at, query, role)
+            next_at += rng.expovariate(rate)
+
+
+# --------------------------------------------------------------------------- report
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * pct / 100
+    lo, hi = math.floor(k), math.ceil(k)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def summarize(serving: str, result: LoadResult, duration: float, samples: List[Dict[str, float]],
+              mock_stats: Dict[str, int]) -> Dict[str, Any]:
+    records = result.records
+    ok = sorted(r["latency"] for r in records if r["status"] == 200)
+    statuses: Dict[str, int] = {}
+    for r in records:
+        statuses[str(r["status"])] = statuses.get(str(r["status"]), 0) + 1
+
+    def ms(value):
+        return None if value is None else round(value * 1000, 1)
+
+    return {
+        "serving": serving,
+        "requests": len(records),
+        "succeeded": len(ok),
+        "error_rate": round(1 - len(ok) / len(records), 4) if records else None,
+        "throughput_rps": round(len(ok) / duration, 2) if duration else None,
+        "latency_ms": {
+            "p50": ms(percentile(ok, 50)),
+            "p90": ms(percentile(ok, 90)),
+            "p95": ms(percentile(ok, 95)),
+            "p99": ms(percentile(ok, 99)),
+            "max": ms(ok[-1] if ok else None),
+        },
+        "status_counts": statuses,
+        "server": {
+            "cpu_percent_mean": round(sum(s["cpu_percent"] for s in samples) / len(samples), 1) if samples else None,
+            "cpu_percent_max": max((s["cpu_percent"] for s in samples), default=None),
+            "rss_mb_max": max((s["rss_mb"] for s in samples), default=None),
+            "timeline": samples,
+        },
+        "mock_llm": dict(mock_stats),
+    }
+
+
+def print_comparison(reports: List[Dict[str, Any]]):
+    header = f"{'serving':<14}{'reqs':>7}{'ok rps':>9}{'err %':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'cpu%':>8}{'rss MB':>9}"
+    print("\n" + header)
+    print("-" * len(header))
+    for r in reports:
+        lat, srv = r["latency_ms"], r["server"]
+        err = "-" if r["error_rate"] is None else f"{r['error_rate'] * 100:.1f}"
+        print(f"{r['serving']:<14}{r['requests']:>7}{r['throughput_rps'] or 0:>9.2f}{err:>8}"
+              f"{lat['p50'] or '-':>9}{lat['p95'] or '-':>9}{lat['p99'] or '-':>9}"
+              f"{srv['cpu_percent_mean'] or '-':>8}{srv['rss_mb_max'] or '-':>9}")
+
+
+# ----------------------------------------------------------------------------- main
+
+def run_config(serving: str, args, mock) -> Dict[str, Any]:
+    port = args.port or _free_port()
+    print(f"\n🚀 Starting '{serving}' on {args.host}:{port} ...")
+    proc = start_app(serving, mock.url, args.host, port, args.workers, args.threads,
+                     shared_dataset=args.shared_dataset)
+    url = f"http://{args.host}:{port}/api/run_agent"
+    rng = random.Random(args.seed)
+    queries = DEFAULT_QUERIES
+
+    try:
+        if args.warmup > 0:
+            print(f"   Warm-up: {args.warmup}s")
+            run_closed_loop(url, min(args.users, 4), args.warmup, 0, args.timeout, queries, LoadResult(), rng)
+
+        mock.stats.update({"requests": 0, "errors": 0})
+        monitor = ResourceMonitor(proc.pid, args.sample_interval)
+        monitor.start()
+        result = LoadResult()
+        started = time.time()
+        if args.mode == "closed":
+            print(f"   Closed loop: {args.users} users, think {args.think_ms}ms, {args.duration}s")
+            run_closed_loop(url, args.users, args.duration, args.think_ms, args.timeout, queries, result, rng)
+        else:
+            print(f"   Open loop: {args.rate} req/s Poisson, {args.duration}s")
+            run_open_loop(url, args.rate, args.duration, args.max_inflight, args.timeout, queries, result, rng)
+        elapsed = time.time() - started
+        monitor.stop()
+    finally:
+        stop_app(proc)
+
+    report = summarize(serving, result, elapsed, monitor.samples, mock.stats)
+    print(f"✓ {report['succeeded']}/{report['requests']} ok, {report['throughput_rps']} req/s, "
+          f"p95 {report['latency_ms']['p95']} ms")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test /api/run_agent against a local Gemini mock")
+    parser.add_argument("--serving", default="threaded",
+                        help="Comma-separated configs: threaded, multiprocess, gthread, async")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Processes for gunicorn configs")
+    parser.add_argument("--threads", type=int, default=8, help="Threads per gthread worker")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="App port (0 = pick a free one)")
+    parser.add_argument("--shared-dataset", action="store_true",
+                        help="Serve one memory-mapped dataset copy to all workers (INGRES_SHARED_DATASET=1)")
+    parser.add_argument("--mode", choices=["closed", "open"], default="closed")
+    parser.add_argument("--users", type=int, default=8, help="Concurrent users (closed loop)")
+    parser.add_argument("--think-ms", type=float, default=1000, help="Mean think time between requests")
+    parser.add_argument("--rate", type=float, default=2.0, help="Arrival rate in req/s (open loop)")
+    parser.add_argument("--max-inflight", type=int, default=256, help="Client concurrency cap (open loop)")
+    parser.add_argument("--duration", type=float, default=30, help="Measured seconds per config")
+    parser.add_argument("--warmup", type=float, default=5, help="Unmeasured warm-up seconds")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-request timeout")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="CPU/RSS sampling period")
+    parser.add_argument("--out", help="Write the full JSON report (incl. timelines) here")
+    add_mock_arguments(parser)
+    args = parser.parse_args(argv)
+
+    mock = start_mock_server(latency=latency_from_args(args), error_rate=args.error_rate,
+                             error_status=args.error_status, seed=args.seed,
+                             thinking_tokens=args.thinking_tokens)
+    print(f"✅ Mock Gemini on {mock.url} ({args.latency}, {args.latency_ms}ms, error rate {args.error_rate})")
+
+    reports = []
+    try:
+        for serving in [s.strip() for s in args.serving.split(",") if s.strip()]:
+            try:
+                reports.append(run_config(serving, args, mock))
+            except RuntimeError as e:
+                print(f"❌ {e}")
+    finally:
+        mock.shutdown()
+
+    if reports:
+        print_comparison(reports)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(reports, f, indent=2)
+        print(f"\n📄 Full report written to {args.out}")
+    return reports
+
+
+if __name__ == "__main__":
+    main()
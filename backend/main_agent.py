@@ -14,24 +14,113 @@ from agents.decider_agent import deciding_agent
 import pandas as pd
 from agents.user_agent import usy_agent
 from llm_main import llm
+from token_budget import start_ledger
+from speculation import SPECULATE_BY_DEFAULT, SpeculativeTask
+import time
 import json
 
 
 class IngresAgent:
-    def __init__(self, dataframe, query, role):
+    def __init__(self, dataframe, query, role, session=None, on_stage=None, speculate=None):
         self.df = dataframe
         self.context = {}
         self.query = query
         self.results = {}  # Store all agent results
         self.final_output = None 
         self.role = role # Store the final user-facing output
+        self.session = session  # Optional ConversationSession (see session_store.py)
+        self.reused = []  # Result keys served from the session instead of recomputed
+        self.cached = []  # Result keys served from the shared plan cache (see result_cache.py)
+        self.token_ledger = None  # UsageLedger of this run (see token_budget.py)
+        self.on_stage = on_stage  # Optional progress callback(stage, result), e.g. for background jobs
+        # Start data analysis concurrently with routing (see speculation.py)
+        self.speculate = SPECULATE_BY_DEFAULT if speculate is None else speculate
+        self.speculation = {"used": False, "status": "off"}
+        if session is not None and session.has_history():
+            self._seed_context_from_session()
+
+    def _seed_context_from_session(self):
+        """
+        Makes the previous turn's state available to the agents of a follow-up query.
+        """
+        session = self.session
+        self.context['previous_query'] = session.previous_query()
+        self.context['previous_optimized_query'] = session.optimized_query
+        self.context['previous_params'] = session.params
+        self.context['previous_filtered_df'] = session.filtered_df
+        self.context['previous_visualization'] = session.results.get('visualization')
+        if 'data_analysis' in session.results:
+            self.context['data_analysis'] = session.results['data_analysis']
+
+    def _report_stage(self, stage, result):
+        """
+        Forwards a finished stage to the progress callback; never lets it break the run.
+        """
+        if self.on_stage is None:
+            return
+        try:
+            self.on_stage(stage, result)
+        except Exception as e:
+            print(f"⚠️ on_stage callback failed for '{stage}': {e}")
+
+    def _start_speculation(self):
+        """
+        Starts query_maker + the pandas agent in the background while the router runs.
+        """
+        print("--- Speculatively starting data analysis alongside routing ---")
+        return SpeculativeTask(
+            data_analysis_agent,
+            self.df,
+            self.query,
+            previous_query=self.context.get('previous_query'),
+            previous_optimized_query=self.context.get('previous_optimized_query'),
+        )
+
+    def _committed_speculation(self, speculative, routed_at):
+        """
+        Result of the speculative analysis, or None if there was none, it had not
+        started yet or it failed (the caller then runs the stage normally).
+        """
+        if speculative is None:
+            return None
+        try:
+            analysis = speculative.commit(decided_at=routed_at)
+        except Exception as e:
+            print(f"⚠️ Speculative data analysis failed, running it again: {e}")
+            analysis = None
+        self.speculation = speculative.report()
+        return analysis
+
+    def _update_session(self, agent_list):
+        """
+        Stores this turn's resolved state back into the session for the next follow-up.
+        """
+        session = self.session
+        if 'visualization_params' in self.context:
+            session.set_visualization(self.context['visualization_params'],
+                                      self.context['visualization_filtered_df'])
+        analysis = self.results.get('data_analysis')
+        if isinstance(analysis, dict) and analysis.get('input'):
+            session.optimized_query = analysis['input']
+        session.record_turn(self.query, self.role, agent_list, self.results)
 
     def run_pipeline(self):
         """
         Executes the full pipeline and returns the appropriate output based on agents run.
         """
+        # Every budgeted llm call below records its token usage here
+        self.token_ledger = start_ledger()
+
+        speculative = self._start_speculation() if self.speculate else None
+
         # NOTE: deciding_agent must be importable here
-        agent_list = deciding_agent(self.query, self.role)
+        try:
+            agent_list = deciding_agent(self.query, self.role, self.context.get('previous_query'))
+        except Exception:
+            if speculative is not None:
+                speculative.cancel()
+            raise
+        routed_at = time.perf_counter()
         
         # Safety check for NoneType error
         if agent_list is None:
@@ -39,15 +128,31 @@ class IngresAgent:
             print("--- WARNING: deciding_agent returned None. No agents will run. ---")
             
         print(f"\n--- Agents to Run: {agent_list} ---")
+        self._report_stage('routing', agent_list)
+
+        if speculative is not None and "data_analysis_agent" not in agent_list:
+            print("--- Speculative data analysis not needed, cancelling ---")
+            speculative.cancel()
+            self.speculation = speculative.report()
+            speculative = None
 
         for agent_name in agent_list:
             if agent_name == "data_analysis_agent":
                 print("\n--- Data Analysis ---")
-                # NOTE: data_analysis_agent must be importable here
-                analysis = data_analysis_agent(self.df, self.query)
+                analysis = self._committed_speculation(speculative, routed_at)
+                speculative = None
+                if analysis is None:
+                    # NOTE: data_analysis_agent must be importable here
+                    analysis = data_analysis_agent(
+                        self.df,
+                        self.query,
+                        previous_query=self.context.get('previous_query'),
+                        previous_optimized_query=self.context.get('previous_optimized_query'),
+                    )
                 self.context['data_analysis'] = analysis
                 self.results['data_analysis'] = analysis
                 print(analysis)
+                self._report_stage('data_analysis', analysis)
 
             elif agent_name == "policy_agent":
                 print("\n Policy Agent ---")
@@ -55,14 +160,20 @@ class IngresAgent:
                 self.context['policy'] = policy
                 self.results['policy'] = policy
                 print(policy)
+                self._report_stage('policy', policy)
 
             elif agent_name == "visualization_agent":
                 print("\n Creating Visualization Points ---")
                 # Correctly passing self.df to visualization_agent
                 visualization = visualization_agent(self.df, self.query, self.context)
+                if self.context.get('visualization_reused'):
+                    self.reused.append('visualization')
+                if self.context.get('visualization_cached'):
+                    self.cached.append('visualization')
                 self.context['visualization'] = visualization
                 self.results['visualization'] = visualization
                 print(visualization)
+                self._report_stage('visualization', visualization)
 
             elif agent_name == "user_agent":
                 print("\n User Agent ---")
@@ -70,9 +181,18 @@ class IngresAgent:
                 self.context['user_ans'] = user_ans
                 self.results['user_ans'] = user_ans
                 print(user_ans)
+                self._report_stage('user_ans', user_ans)
             
             else:
                 print(f"Unknown agent: {agent_name}")
+
+        # Follow-up served without re-running the analysis: surface the session's result
+        if 'data_analysis_agent' not in agent_list and 'data_analysis' in self.context:
+            self.results['data_analysis'] = self.context['data_analysis']
+            self.reused.append('data_analysis')
+
+        if self.session is not None:
+            self._update_session(agent_list)
         
         # Determine the final output based on what was generated
         self.final_output = self._determine_final_output(agent_list)
@@ -92,12 +212,16 @@ class IngresAgent:
             return self.results['user_ans']
         
         # If only data analysis ran, return that
-        if 'data_analysis' in self.results:
+        # (an analysis carried over from the previous turn never outranks this turn's output)
+        if 'data_analysis' in self.results and 'data_analysis' not in self.reused:
             return self.results['data_analysis']
         
         # If only visualization ran, return visualization data
         if 'visualization' in self.results:
             return self.results['visualization']
+
+        if 'data_analysis' in self.results:
+            return self.results['data_analysis']
         
         # Fallback: return all results
         return self.results
@@ -0,0 +1,263 @@
+# mock_gemini.py
+
+"""
+Local stand-in for the Gemini generateContent REST endpoint.
+
+Used by loadtest.py so the Flask API can be loaded without spending API quota.
+Point the app at it with GEMINI_BASE_URL=http://127.0.0.1:<port> (see llm_main.py).
+
+Run standalone:
+    python mock_gemini.py --port 8765 --latency lognormal --latency-ms 800 --error-rate 0.02
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+
+class LatencyModel:
+    """
+    Samples a response delay in seconds.
+
+    kind:
+        constant  - always latency_ms
+        uniform   - uniform in [latency_ms - jitter_ms, latency_ms + jitter_ms]
+        lognormal - median latency_ms, shape sigma (long tail like a real LLM API)
+    """
+
+    def __init__(self, kind: str = "lognormal", latency_ms: float = 800, jitter_ms: float = 200,
+                 sigma: float = 0.5, seed: Optional[int] = None):
+        self.kind = kind
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.sigma = sigma
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        with self._lock:
+            if self.kind == "constant":
+                ms = self.latency_ms
+            elif self.kind == "uniform":
+                ms = self.rng.uniform(self.latency_ms - self.jitter_ms, self.latency_ms + self.jitter_ms)
+            elif self.kind == "lognormal":
+                ms = self.rng.lognormvariate(0, self.sigma) * self.latency_ms
+            else:
+                raise ValueError(f"Unknown latency distribution '{self.kind}'")
+        return max(ms, 0) / 1000.0
+
+
+def fake_answer(prompt: str) -> str:
+    """
+    Returns a plausible answer for each prompt the pipeline sends, recognised by
+    the fixed wording of the agent prompts.
+    """
+    if "expert router agent" in prompt:
+        # The user's role is the "- Role:" line; the few-shot examples also say "Role: government"
+        match = re.search(r'^\s*-\s*Role:\s*(\w+)', prompt, re.MULTILINE)
+        role = match.group(1).lower() if match else "citizen"
+        if role == "government":
+            return '["data_analysis_agent", "policy_agent"]'
+        if role == "researcher":
+            return '["data_analysis_agent"]'
+        return '["data_analysis_agent", "user_agent"]'
+
+    if "Extract filtering parameters" in prompt:
+        return json.dumps({
+            "states": ["PUNJAB"],
+            "districts": [],
+            "years": [2024],
+            "stage_filter": {"type": "over-exploited", "min": None, "max": None},
+            "columns_to_show": ["STATE", "DISTRICT", "YEAR", "Stage of Ground Water Extraction (%)"],
+            "sort_by": "Stage of Ground Water Extraction (%)",
+            "sort_order": "desc",
+            "limit": 10,
+        })
+
+    if "query optimizer" in prompt:
+        return ("Compare the 'Stage of Ground Water Extraction (%)' for districts where STATE is "
+                "'PUNJAB', showing STATE, DISTRICT, YEAR and the extraction values")
+
+    if "policy advisor" in prompt:
+        return ("**EXECUTIVE SUMMARY**\nMock policy brief.\n\n**CRITICAL FINDINGS**\n- Point 1\n- Point 2\n"
+                "- Point 3\n\n**POLICY RECOMMENDATIONS**\n1. Immediate\n2. Medium-term\n3. Long-term")
+
+    # Pandas agent and anything else: a final answer with no tool call
+    return ("1. **Data Overview**: mock analysis.\n2. **Key Findings**: stage of extraction is 150.0%.\n"
+            "3. **Detailed Analysis**: n/a\n4. **Recommendations**: n/a")
+
+
+def _prompt_text(body: Dict[str, Any]) -> str:
+    parts = []
+    for section in [body.get("systemInstruction") or {}] + list(body.get("contents") or []):
+        for part in section.get("parts", []) or []:
+            if isinstance(part, dict) and part.get("text"):
+                parts.append(part["text"])
+    return "\n".join(parts)
+
+
+class MockGeminiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency: LatencyModel, error_rate: float = 0.0,
+                 error_status: int = 503, seed: Optional[int] = None, thinking_tokens: int = 256):
+        super().__init__(address, MockGeminiHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        # Thinking spent per call when the request sets no thinkingBudget (like gemini-2.5-flash)
+        self.thinking_tokens = thinking_tokens
+        self.rng = random.Random(seed)
+        self.stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def should_fail(self) -> bool:
+        with self.stats_lock:
+            self.stats["requests"] += 1
+            fail = self.rng.random() < self.error_rate
+            if fail:
+                self.stats["errors"] += 1
+            return fail
+
+
+class MockGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass  # keep load-test output readable
+
+    def _send_json(self, status: int, payload: Dict[str, Any]):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b"{}"
+        try:
+            body = json.loads(raw or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"code": 400, "message": "Invalid JSON", "status": "INVALID_ARGUMENT"}})
+            return
+
+        server: MockGeminiServer = self.server
+        time.sleep(server.latency.sample())
+
+        if server.should_fail():
+            self._send_json(server.error_status, {
+                "error": {"code": server.error_status, "message": "Mock upstream failure", "status": "UNAVAILABLE"}
+            })
+            return
+
+        match = re.search(r"/models/([^/:]+):(\w+)", self.path)
+        model = match.group(1) if match else "gemini-2.5-flash"
+        method = match.group(2) if match else "generateContent"
+
+        prompt = _prompt_text(body)
+        answer = fake_answer(prompt)
+        prompt_tokens = max(len(prompt) // 4, 1)
+
+        # Thinking tokens count against maxOutputTokens, as they do on the real API
+        config = body.get("generationConfig") or {}
+        thinking_config = config.get("thinkingConfig") or config.get("thinking_config") or {}
+        # The API accepts both JSON spellings; the Python client sends snake_case here
+        thinking_budget = thinking_config.get("thinkingBudget", thinking_config.get("thinking_budget"))
+        thinking_tokens = server.thinking_tokens
+        if thinking_budget is not None and thinking_budget >= 0:
+            thinking_tokens = min(thinking_tokens, thinking_budget)
+        finish_reason = "STOP"
+        max_output = config.get("maxOutputTokens")
+        if max_output is not None:
+            thinking_tokens = min(thinking_tokens, max_output)
+            room = max_output - thinking_tokens
+            if len(answer) // 4 > room:
+                answer = answer[: room * 4]
+                finish_reason = "MAX_TOKENS"
+        answer_tokens = len(answer) // 4
+
+        payload = {
+            "candidates": [{
+                "content": {"role": "model", "parts": [{"text": answer}]},
+                "finishReason": finish_reason,
+                "index": 0,
+            }],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "candidatesTokenCount": answer_tokens,
+                "thoughtsTokenCount": thinking_tokens,
+                "totalTokenCount": prompt_tokens + answer_tokens + thinking_tokens,
+            },
+            "modelVersion": model,
+        }
+
+        if method == "streamGenerateContent":
+            # Server-sent events with a single chunk
+            body = f"data: {json.dumps(payload)}\r\n\r\n".encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json(200, payload)
+
+
+def start_mock_server(host: str = "127.0.0.1", port: int = 0, latency: Optional[LatencyModel] = None,
+                      error_rate: float = 0.0, error_status: int = 503,
+                      seed: Optional[int] = None, thinking_tokens: int = 256) -> MockGeminiServer:
+    """
+    Starts the mock in a background thread and returns the server (port 0 = pick a free port).
+    """
+    server = MockGeminiServer((host, port), latency or LatencyModel(seed=seed),
+                              error_rate=error_rate, error_status=error_status, seed=seed,
+                              thinking_tokens=thinking_tokens)
+    thread = threading.Thread(target=server.serve_forever, name="mock-gemini", daemon=True)
+    thread.start()
+    return server
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", default="lognormal", choices=["constant", "uniform", "lognormal"],
+                        help="Mock LLM latency distribution")
+    parser.add_argument("--latency-ms", type=float, default=800, help="Mean/median mock latency")
+    parser.add_argument("--jitter-ms", type=float, default=200, help="Half-width for 'uniform'")
+    parser.add_argument("--sigma", type=float, default=0.5, help="Shape for 'lognormal'")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of mock calls that fail")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status of failed mock calls")
+    parser.add_argument("--thinking-tokens", type=int, default=256,
+                        help="Mock thinking tokens per call when the request sets no thinking budget")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def latency_from_args(args) -> LatencyModel:
+    return LatencyModel(args.latency, args.latency_ms, args.jitter_ms, args.sigma, args.seed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local mock of the Gemini generateContent API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockGeminiServer((args.host, args.port), latency_from_args(args),
+                              error_rate=args.error_rate, error_status=args.error_status, seed=args.seed,
+                              thinking_tokens=args.thinking_tokens)
+    print(f"✅ Mock Gemini listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
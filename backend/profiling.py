@@ -0,0 +1,347 @@
+# profiling.py
+
+"""
+Opt-in profiling of a single /api/run_agent request.
+
+A request asks for it with the X-Ingres-Profile header or the ?profile= query
+flag:
+    cprofile   deterministic profile -> .pstats (snakeviz, python -m pstats)
+               + a text summary
+    sample     wall-clock stack sampler of the request thread -> .collapsed
+               stacks (flamegraph.pl, speedscope) + a text summary
+Add "+memory" in the header (?profile=sample+memory, where '+' decodes to a
+space, or ?memory=1 in a URL) to also trace allocations with tracemalloc.
+
+Artifacts are written to INGRES_PROFILE_DIR and downloaded through
+/api/profiles/<id>/<artifact>. Requests without the flag never touch this
+module beyond the flag lookup. The sampler follows only the request thread (a
+speculative analysis thread is not sampled). cProfile only allows one active
+profiler per process from Python 3.12 (it hooks sys.monitoring, which also
+makes it see other threads), so one cprofile request runs at a time and an
+overlapping one falls back to sample. tracemalloc is process-wide as well:
+overlapping "+memory" requests share one trace and see each other's
+allocations. A failing profile never fails the request.
+
+Off by default. INGRES_PROFILING=1 turns it on only together with
+INGRES_PROFILE_TOKEN: profiles contain other users' query text, so profiling
+requests and the /api/profiles endpoints must send the token in
+X-Ingres-Profile-Token.
+"""
+
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import re
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+PROFILE_TOKEN = os.getenv("INGRES_PROFILE_TOKEN")
+PROFILING_ENABLED = os.getenv("INGRES_PROFILING", "0") == "1" and bool(PROFILE_TOKEN)
+if os.getenv("INGRES_PROFILING", "0") == "1" and not PROFILE_TOKEN:
+    print("⚠️ INGRES_PROFILING=1 ignored: set INGRES_PROFILE_TOKEN to enable request profiling")
+PROFILE_DIR = os.getenv("INGRES_PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "ingres-profiles")
+PROFILE_KEEP = int(os.getenv("INGRES_PROFILE_KEEP", "50"))
+SAMPLE_INTERVAL = float(os.getenv("INGRES_PROFILE_INTERVAL_MS", "5")) / 1000
+
+PROFILE_MODES = ("cprofile", "sample")
+# Artifact name -> (file suffix, mimetype)
+ARTIFACTS = {
+    "pstats": (".pstats", "application/octet-stream"),
+    "collapsed": (".collapsed", "text/plain"),
+    "summary": (".summary.txt", "text/plain"),
+    "memory": (".memory.txt", "text/plain"),
+}
+TRUE_VALUES = ("1", "true", "yes", "on")
+
+
+class ProfileRequest:
+    def __init__(self, mode: str, memory: bool):
+        self.mode = mode
+        self.memory = memory
+
+
+def authorized(request) -> bool:
+    """
+    True if profiling is enabled and the request carries the profile token.
+    """
+    if not PROFILING_ENABLED:
+        return False
+    return hmac.compare_digest(request.headers.get("X-Ingres-Profile-Token", ""), PROFILE_TOKEN)
+
+
+def requested_profile(request) -> Optional[ProfileRequest]:
+    """
+    Parses the profiling flag of a Flask request. None = run normally.
+    Raises ValueError for an unknown mode or a wrong token.
+    """
+    flag = request.headers.get("X-Ingres-Profile") or request.args.get("profile")
+    if not flag or not PROFILING_ENABLED:
+        return None
+    if not authorized(request):
+        raise ValueError("Profiling requires a valid X-Ingres-Profile-Token")
+
+    # '+' in a query string arrives as a space
+    parts = re.split(r"[+\s]+", flag.strip().lower())
+    mode = "cprofile" if parts[0] in TRUE_VALUES else parts[0]
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode '{mode}'. Use one of: {list(PROFILE_MODES)}")
+    memory = "memory" in parts[1:] or request.args.get("memory", "").lower() in TRUE_VALUES
+    return ProfileRequest(mode, memory)
+
+
+class StackSampler(threading.Thread):
+    """
+    Samples one thread's Python stack every interval seconds and counts identical
+    stacks, i.e. the collapsed format flame graph tools read.
+    """
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    @staticmethod
+    def _label(code) -> str:
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            self.counts[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+    def top_frames(self, n: int = 20) -> List[Dict[str, Any]]:
+        """
+        Leaf frames by share of samples (where the time is actually spent).
+        """
+        leaves: Counter = Counter()
+        for stack, count in self.counts.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return [
+            {"frame": frame, "samples": count, "percent": round(count / self.samples * 100, 2)}
+            for frame, count in leaves.most_common(n)
+        ]
+
+
+_TRACEMALLOC_LOCK = threading.Lock()
+_TRACEMALLOC_USERS = 0
+_TRACEMALLOC_OWNED = False  # started by us (not e.g. PYTHONTRACEMALLOC), so ours to stop
+
+
+def _acquire_tracemalloc():
+    global _TRACEMALLOC_USERS, _TRACEMALLOC_OWNED
+    with _TRACEMALLOC_LOCK:
+        if _TRACEMALLOC_USERS == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(25)
+            _TRACEMALLOC_OWNED = True
+        _TRACEMALLOC_USERS += 1
+
+
+def _release_tracemalloc():
+    global _TRACEMALLOC_USERS, _TRACEMALLOC_OWNED
+    with _TRACEMALLOC_LOCK:
+        _TRACEMALLOC_USERS -= 1
+        if _TRACEMALLOC_USERS == 0 and _TRACEMALLOC_OWNED:
+            tracemalloc.stop()
+            _TRACEMALLOC_OWNED = False
+
+
+# One cProfile at a time per process (a second enable() raises on Python 3.12+)
+_CPROFILE_LOCK = threading.Lock()
+
+
+class RequestProfiler:
+    """
+    Context manager around the profiled part of a request; writes the artifacts
+    on exit and exposes a JSON summary via report().
+    """
+
+    def __init__(self, profile_request: ProfileRequest, label: str = ""):
+        self.mode = profile_request.mode
+        self.memory = profile_request.memory
+        self.label = label
+        self.profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.artifacts: Dict[str, str] = {}
+        self.wall_seconds = 0.0
+        self.top: List[Dict[str, Any]] = []
+        self.memory_top: List[Dict[str, Any]] = []
+        self.memory_peak: Optional[int] = None
+        self.fallback: Optional[str] = None  # why the requested mode was not used
+        self._profiler: Optional[cProfile.Profile] = None
+        self._sampler: Optional[StackSampler] = None
+
+    def _start_cprofile(self) -> bool:
+        if not _CPROFILE_LOCK.acquire(blocking=False):
+            self.fallback = "another request is being profiled with cprofile"
+            return False
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except Exception as e:  # e.g. another profiling tool owns sys.monitoring
+            _CPROFILE_LOCK.release()
+            self.fallback = f"cprofile unavailable: {e}"
+            return False
+        self._profiler = profiler
+        return True
+
+    def __enter__(self):
+        if self.memory:
+            _acquire_tracemalloc()
+        self._started = time.perf_counter()
+        if self.mode == "cprofile" and not self._start_cprofile():
+            print(f"⚠️ Profile {self.profile_id} falls back to sampling: {self.fallback}")
+            self.mode = "sample"
+        if self.mode == "sample":
+            self._sampler = StackSampler(threading.get_ident())
+            self._sampler.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._profiler is not None:
+            try:
+                self._profiler.disable()
+            except Exception as e:
+                print(f"⚠️ Could not stop cprofile for profile {self.profile_id}: {e}")
+            finally:
+                _CPROFILE_LOCK.release()
+        if self._sampler is not None:
+            self._sampler.stop()
+        self.wall_seconds = round(time.perf_counter() - self._started, 4)
+
+        # A failed profile must never fail the request it wraps
+        snapshot = None
+        if self.memory:
+            try:
+                snapshot = tracemalloc.take_snapshot()
+                self.memory_peak = tracemalloc.get_traced_memory()[1]
+            except Exception as e:
+                print(f"⚠️ Could not take memory snapshot for profile {self.profile_id}: {e}")
+            finally:
+                _release_tracemalloc()
+
+        try:
+            self._write_artifacts(snapshot)
+        except Exception as e:
+            print(f"⚠️ Could not write profile {self.profile_id}: {e}")
+        return False
+
+    def _path(self, artifact: str) -> str:
+        return os.path.join(PROFILE_DIR, self.profile_id + ARTIFACTS[artifact][0])
+
+    def _write_artifacts(self, snapshot):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        header = f"profile {self.profile_id} ({self.mode}) {self.label}\nwall time: {self.wall_seconds}s\n\n"
+
+        if self._profiler is not None:
+            self._profiler.dump_stats(self._path("pstats"))
+            self.artifacts["pstats"] = self._path("pstats")
+            out = io.StringIO()
+            stats = pstats.Stats(self._profiler, stream=out).sort_stats("cumulative")
+            stats.print_stats(40)
+            summary = out.getvalue()
+            self.top = [
+                {
+                    "function": f"{func[2]} ({os.path.basename(func[0])}:{func[1]})",
+                    "calls": calls,
+                    "total_seconds": round(tottime, 4),
+                    "cumulative_seconds": round(cumtime, 4),
+                }
+                for func, (_, calls, tottime, cumtime, _) in sorted(
+                    stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:20]
+            ]
+        else:
+            with open(self._path("collapsed"), "w") as f:
+                f.write(self._sampler.collapsed())
+            self.artifacts["collapsed"] = self._path("collapsed")
+            self.top = self._sampler.top_frames()
+            summary = f"{self._sampler.samples} samples every {self._sampler.interval * 1000:g} ms\n\n" + "".join(
+                f"{row['percent']:6.2f}%  {row['samples']:6d}  {row['frame']}\n" for row in self.top)
+
+        with open(self._path("summary"), "w") as f:
+            f.write(header + summary)
+        self.artifacts["summary"] = self._path("summary")
+
+        if snapshot is not None:
+            stats = snapshot.statistics("lineno")
+            self.memory_top = [
+                {"location": str(stat.traceback[0]), "size_bytes": stat.size, "count": stat.count}
+                for stat in stats[:20]
+            ]
+            with open(self._path("memory"), "w") as f:
+                f.write(header + f"peak traced memory: {self.memory_peak} bytes\n\n")
+                f.write("".join(f"{stat}\n" for stat in stats[:100]))
+            self.artifacts["memory"] = self._path("memory")
+
+        prune_profiles()
+
+    def report(self, url_prefix: str = "/api/profiles") -> Dict[str, Any]:
+        report = {
+            "profile_id": self.profile_id,
+            "mode": self.mode,
+            "fallback": self.fallback,
+            "wall_seconds": self.wall_seconds,
+            "artifacts": {name: f"{url_prefix}/{self.profile_id}/{name}" for name in self.artifacts},
+            "top": self.top,
+        }
+        if self.memory:
+            report["memory"] = {"peak_bytes": self.memory_peak, "top": self.memory_top}
+        return report
+
+
+def artifact_path(profile_id: str, artifact: str) -> Optional[str]:
+    """
+    Path of a stored artifact, or None if it does not exist (or the id is not ours).
+    """
+    if artifact not in ARTIFACTS or os.path.basename(profile_id) != profile_id:
+        return None
+    path = os.path.join(PROFILE_DIR, profile_id + ARTIFACTS[artifact][0])
+    return path if os.path.isfile(path) else None
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles: Dict[str, Dict[str, Any]] = {}
+    for name in os.listdir(PROFILE_DIR):
+        for artifact, (suffix, _) in ARTIFACTS.items():
+            if name.endswith(suffix):
+                profile_id = name[:-len(suffix)]
+                entry = profiles.setdefault(profile_id, {"profile_id": profile_id, "artifacts": []})
+                entry["artifacts"].append(artifact)
+                break
+    return sorted(profiles.values(), key=lambda p: p["profile_id"], reverse=True)
+
+
+def prune_profiles():
+    """
+    Keeps the newest PROFILE_KEEP profiles (ids start with a timestamp).
+    """
+    for profile in list_profiles()[PROFILE_KEEP:]:
+        for artifact in profile["artifacts"]:
+            path = artifact_path(profile["profile_id"], artifact)
+            if path:
+                os.remove(path)
@@ -0,0 +1,152 @@
+# result_cache.py
+
+"""
+Cache of final visualization payloads keyed on the structured query plan.
+
+Many different questions resolve to the same extract_query_parameters output.
+The key is the canonicalized parameter dict (only the fields the pandas
+pipeline reads, with order-insensitive lists sorted) plus the dataset
+version, so a repeat plan skips filtering, sorting and serialization. Entries
+are stored serialized and evicted LRU by total bytes.
+
+Configured with INGRES_RESULT_CACHE_MB (0 disables the cache).
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import pandas as pd
+
+from dataset_rows import FrameCache
+
+NAMED_STAGES = ('over-exploited', 'critical', 'semi-critical', 'safe')
+
+
+def _number(value) -> Optional[float]:
+    return None if value is None else float(value)
+
+
+def canonical_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Normal form of the parameters build_pandas_filters -> convert_to_json act on.
+    Two dicts with the same normal form always produce the same rows.
+    """
+    stage_filter = params.get('stage_filter') or {}
+    stage_type = stage_filter.get('type', 'none')
+    limit = params.get('limit')
+
+    return {
+        # Matching is case-insensitive and isin() ignores order and repeats
+        'states': sorted({str(s).upper() for s in params.get('states') or []}),
+        'districts': sorted({str(d).upper() for d in params.get('districts') or []}),
+        'years': sorted(set(params.get('years') or []), key=str),
+        'stage_filter': {
+            'type': stage_type,
+            # A named stage overrides min, max applies either way
+            'min': None if stage_type in NAMED_STAGES else _number(stage_filter.get('min')),
+            'max': _number(stage_filter.get('max')),
+        },
+        'columns_to_show': list(params.get('columns_to_show') or []),
+        'sort_by': params.get('sort_by') or None,
+        'sort_order': 'asc' if params.get('sort_order', 'desc') == 'asc' else 'desc',
+        'limit': limit if isinstance(limit, int) and limit > 0 else None,
+    }
+
+
+def _fingerprint(df: pd.DataFrame) -> str:
+    digest = hashlib.sha1(",".join(map(str, df.columns)).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+
+_VERSIONS: FrameCache[str] = FrameCache(_fingerprint)
+
+
+def dataset_version(df: pd.DataFrame) -> str:
+    """
+    Content fingerprint of a DataFrame, computed once per frame object.
+    """
+    return _VERSIONS.get(df)
+
+
+def plan_key(params: Dict[str, Any], version: str) -> str:
+    plan = json.dumps(canonical_params(params), sort_keys=True, default=str)
+    return hashlib.sha1(f"{version}:{plan}".encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Thread-safe LRU of serialized payloads, bounded by total bytes.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns a fresh copy of the cached payload, or None on a miss.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            blob = self._entries.get(key)
+            if blob is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return json.loads(blob)
+
+    def put(self, key: str, payload: Dict[str, Any]) -> bool:
+        if not self.enabled:
+            return False
+        blob = json.dumps(payload, default=str).encode("utf-8")
+        if len(blob) > self.max_bytes:
+            return False  # would evict everything else
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old)
+            self._entries[key] = blob
+            self.bytes += len(blob)
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= len(evicted)
+                self.evictions += 1
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+RESULT_CACHE = ResultCache(max_bytes=int(float(os.getenv("INGRES_RESULT_CACHE_MB", "64")) * 1024 * 1024))
@@ -0,0 +1,191 @@
+# session_store.py
+
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+
+class ConversationSession:
+    """
+    Server-side state for one chat conversation.
+
+    Keeps what the previous turn already resolved (visualization parameters,
+    the filtered frame, agent results) so a follow-up query can reuse or diff
+    it instead of recomputing the whole pipeline.
+    """
+
+    def __init__(self, session_id: str, max_turns: int = 10, max_frame_bytes: int = 16 * 1024 * 1024):
+        self.session_id = session_id
+        self.max_turns = max_turns
+        self.max_frame_bytes = max_frame_bytes
+        self.history: List[Dict[str, Any]] = []   # [{"query", "role", "agents"}]
+        self.params: Optional[Dict[str, Any]] = None  # last resolved visualization params
+        self.filtered_df: Optional[pd.DataFrame] = None  # frame produced by those params
+        self.frame_bytes = 0  # memory held by filtered_df
+        self.results: Dict[str, Any] = {}  # last results per agent key
+        self.optimized_query: Optional[str] = None  # last query_maker output
+        self.lock = threading.Lock()  # serialises turns of the same conversation
+        self.created_at = time.time()
+        self.last_access = self.created_at
+
+    def has_history(self) -> bool:
+        return len(self.history) > 0
+
+    def set_visualization(self, params: Optional[Dict[str, Any]], filtered_df: Optional[pd.DataFrame]):
+        """
+        Keeps the resolved params and, if it is small enough, their filtered frame.
+        Without the frame a follow-up simply filters again.
+        """
+        self.params = params
+        nbytes = int(filtered_df.memory_usage(index=True, deep=True).sum()) if filtered_df is not None else 0
+        if nbytes > self.max_frame_bytes:
+            filtered_df, nbytes = None, 0
+        self.filtered_df = filtered_df
+        self.frame_bytes = nbytes
+
+    def drop_frame(self):
+        self.filtered_df = None
+        self.frame_bytes = 0
+
+    def record_turn(self, query: str, role: str, agent_list: List[str], results: Dict[str, Any]):
+        """
+        Stores the outcome of a finished turn. Results from agents that did not run
+        this turn are kept, so e.g. a chart follow-up still sees the earlier analysis.
+        """
+        self.history.append({"query": query, "role": role, "agents": list(agent_list)})
+        if len(self.history) > self.max_turns:
+            self.history = self.history[-self.max_turns:]
+        self.results.update(results)
+
+    def previous_query(self) -> Optional[str]:
+        return self.history[-1]["query"] if self.history else None
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "turns": len(self.history),
+            "history": self.history,
+            "params": self.params,
+            "cached_results": sorted(self.results.keys()),
+            "filtered_rows": None if self.filtered_df is None else int(len(self.filtered_df)),
+            "created_at": self.created_at,
+            "last_access": self.last_access,
+        }
+
+
+# session_id a client sends to start a new conversation
+NEW_SESSION = "new"
+
+
+class SessionStore:
+    """
+    Thread-safe, bounded session registry with LRU and TTL eviction.
+
+    Besides the session count, the memory of the cached filtered frames is
+    bounded: a frame over max_frame_bytes is never kept, and when all frames
+    together exceed max_bytes the least recently used sessions lose theirs
+    (checked as each turn starts; the conversation history stays).
+    Only ids this store minted are honoured; any other id starts a new session.
+    """
+
+    def __init__(self, max_sessions: int = 256, ttl_seconds: float = 1800, max_turns: int = 10,
+                 max_bytes: int = 256 * 1024 * 1024, max_frame_bytes: int = 16 * 1024 * 1024):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_turns = max_turns
+        self.max_bytes = max_bytes
+        self.max_frame_bytes = max_frame_bytes
+        self._sessions: "OrderedDict[str, ConversationSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.frame_evictions = 0
+
+    def _expired(self, session: ConversationSession, now: float) -> bool:
+        return self.ttl_seconds > 0 and (now - session.last_access) > self.ttl_seconds
+
+    def _purge_expired(self, now: float):
+        # OrderedDict is kept in access order, so expired sessions sit at the front
+        while self._sessions:
+            oldest_id, oldest = next(iter(self._sessions.items()))
+            if not self._expired(oldest, now):
+                break
+            del self._sessions[oldest_id]
+            self.evictions += 1
+
+    def _frame_bytes(self) -> int:
+        return sum(session.frame_bytes for session in self._sessions.values())
+
+    def _enforce_bytes(self):
+        # Oldest sessions give up their frames first
+        total = self._frame_bytes()
+        for session in self._sessions.values():
+            if total <= self.max_bytes:
+                break
+            if session.frame_bytes:
+                total -= session.frame_bytes
+                session.drop_frame()
+                self.frame_evictions += 1
+
+    def get_or_create(self, session_id: Optional[str] = None) -> ConversationSession:
+        """
+        Returns the live session for session_id, creating a new one when the id is
+        missing, NEW_SESSION, unknown or expired. A new session always gets a fresh
+        id (returned to the client), never the one the client sent.
+        """
+        if session_id == NEW_SESSION:
+            session_id = None
+        now = time.time()
+        with self._lock:
+            self._purge_expired(now)
+
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                session = ConversationSession(uuid.uuid4().hex, max_turns=self.max_turns,
+                                              max_frame_bytes=self.max_frame_bytes)
+                self._sessions[session.session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._sessions.move_to_end(session_id)
+            # After the move: the session starting a turn keeps its frame longest
+            self._enforce_bytes()
+
+            session.last_access = now
+            return session
+
+    def get(self, session_id: str) -> Optional[ConversationSession]:
+        now = time.time()
+        with self._lock:
+            self._purge_expired(now)
+            return self._sessions.get(session_id)
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "active_sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "ttl_seconds": self.ttl_seconds,
+                "evictions": self.evictions,
+                "frame_bytes": self._frame_bytes(),
+                "max_bytes": self.max_bytes,
+                "frame_evictions": self.frame_evictions,
+            }
+
+
+SESSION_STORE = SessionStore(
+    max_sessions=int(os.getenv("INGRES_MAX_SESSIONS", "256")),
+    ttl_seconds=float(os.getenv("INGRES_SESSION_TTL", "1800")),
+    max_turns=int(os.getenv("INGRES_SESSION_TURNS", "10")),
+    max_bytes=int(float(os.getenv("INGRES_SESSION_MAX_MB", "256")) * 1024 * 1024),
+    max_frame_bytes=int(float(os.getenv("INGRES_SESSION_FRAME_MB", "16")) * 1024 * 1024),
+)
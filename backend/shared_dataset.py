@@ -0,0 +1,189 @@
+# shared_dataset.py
+
+"""
+One copy of the dataset for all worker processes.
+
+The CSV is parsed once and published as memory-mapped column blocks (one
+(columns x rows) block per numeric dtype, text columns as dictionary codes)
+plus a JSON manifest. Every process then attaches read-only: the DataFrame's
+numeric blocks are views on the mapped pages, so N workers share one copy of
+the data in the page cache instead of N private copies. Text columns are
+rebuilt from the codes with their original dtype (not category, which changes
+groupby and comparison semantics); each process holds only one string object
+per distinct value. Writes to an attached frame copy-on-write into private
+memory, the shared pages are never modified.
+
+Enabled in app.py with INGRES_SHARED_DATASET=1 (gunicorn.conf.py sets it);
+INGRES_SHM_DIR chooses the directory (default /dev/shm when present).
+"""
+
+import glob
+import hashlib
+import json
+import os
+import tempfile
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+FILE_PREFIX = "ingres-"
+# Part of the version key, bumped when the block/manifest layout changes
+FORMAT_VERSION = 2
+
+
+def default_shm_dir() -> str:
+    configured = os.getenv("INGRES_SHM_DIR")
+    if configured:
+        return configured
+    return "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+
+def dataset_key(csv_path: str) -> str:
+    """
+    Version key of a source file: changes whenever the file is replaced or edited.
+    """
+    stat = os.stat(csv_path)
+    raw = f"{FORMAT_VERSION}:{os.path.abspath(csv_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+def _codes_dtype(n_categories: int) -> str:
+    # Same integer width pandas picks for Categorical codes, so attaching needs no cast
+    if n_categories < np.iinfo(np.int8).max:
+        return "int8"
+    if n_categories < np.iinfo(np.int16).max:
+        return "int16"
+    return "int32"
+
+
+def _write_block(path: str, array: np.ndarray):
+    tmp = path + ".tmp"
+    mm = np.memmap(tmp, dtype=array.dtype, mode="w+", shape=array.shape)
+    mm[:] = array
+    mm.flush()
+    del mm
+    os.replace(tmp, path)
+
+
+def publish(df: pd.DataFrame, directory: str, key: str) -> str:
+    """
+    Writes df as mapped blocks + manifest under directory and returns the manifest path.
+    The manifest is written last, so its presence means the blocks are complete.
+    """
+    os.makedirs(directory, exist_ok=True)
+    prefix = os.path.join(directory, f"{FILE_PREFIX}{key}")
+    manifest = {"key": key, "rows": int(len(df)), "columns": [], "blocks": {}}
+
+    numeric_groups: Dict[str, list] = {}
+    for name in df.columns:
+        dtype = df[name].dtype
+        if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+            numeric_groups.setdefault(np.dtype(dtype).name, []).append(name)
+
+    for dtype_name, names in numeric_groups.items():
+        block = np.ascontiguousarray(df[names].to_numpy(dtype=dtype_name).T)
+        path = f"{prefix}-{dtype_name}.bin"
+        _write_block(path, block)
+        manifest["blocks"][dtype_name] = {"file": os.path.basename(path), "shape": list(block.shape)}
+
+    block_of = {name: dtype_name for dtype_name, names in numeric_groups.items() for name in names}
+    for i, name in enumerate(df.columns):
+        if name in block_of:
+            dtype_name = block_of[name]
+            manifest["columns"].append({"name": name, "kind": "numeric", "block": dtype_name,
+                                        "position": numeric_groups[dtype_name].index(name)})
+            continue
+
+        cat = pd.Categorical(df[name].astype("string").to_numpy(dtype=object, na_value=None))
+        codes = np.asarray(cat.codes, dtype=_codes_dtype(len(cat.categories)))
+        path = f"{prefix}-cat{i}.bin"
+        _write_block(path, codes)
+        manifest["columns"].append({
+            "name": name, "kind": "categorical", "file": os.path.basename(path),
+            "dtype": codes.dtype.name, "categories": [str(c) for c in cat.categories],
+            "source_dtype": str(df[name].dtype),
+        })
+
+    manifest_path = f"{prefix}.json"
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(manifest_path + ".tmp", manifest_path)
+    return manifest_path
+
+
+def attach(manifest_path: str) -> pd.DataFrame:
+    """
+    Builds a DataFrame whose numeric data are read-only views on the mapped blocks
+    (no copy); text columns are decoded back to the dtype they were published with.
+    """
+    directory = os.path.dirname(manifest_path)
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    rows = manifest["rows"]
+
+    blocks = {
+        dtype_name: np.memmap(os.path.join(directory, info["file"]), dtype=dtype_name,
+                              mode="r", shape=tuple(info["shape"]))
+        for dtype_name, info in manifest["blocks"].items()
+    }
+
+    frames = []
+    for dtype_name, block in blocks.items():
+        in_block = [c for c in manifest["columns"] if c.get("block") == dtype_name]
+        names = [c["name"] for c in sorted(in_block, key=lambda c: c["position"])]
+        # block.T is a (rows x columns) view; pandas keeps it as a single block without copying
+        frames.append(pd.DataFrame(block.T, columns=names, copy=False))
+
+    for col in manifest["columns"]:
+        if col["kind"] == "categorical":
+            codes = np.memmap(os.path.join(directory, col["file"]), dtype=col["dtype"], mode="r", shape=(rows,))
+            # Code -1 (missing) indexes the trailing NaN
+            lookup = np.array(col["categories"] + [np.nan], dtype=object)
+            values = pd.Series(lookup[codes], name=col["name"], dtype=object, copy=False)
+            source_dtype = col.get("source_dtype", "object")
+            if source_dtype != "object":
+                values = values.astype(source_dtype)
+            frames.append(values.to_frame())
+
+    df = pd.concat(frames, axis=1)
+    return df[[c["name"] for c in manifest["columns"]]]
+
+
+def _remove_stale(directory: str, keep_key: str):
+    # Processes still mapping old files keep them alive until they exit (unlink semantics)
+    for path in glob.glob(os.path.join(directory, f"{FILE_PREFIX}*")):
+        if not os.path.basename(path).startswith(f"{FILE_PREFIX}{keep_key}"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def load_shared(csv_path: str, directory: Optional[str] = None,
+                loader: Optional[Callable[[], pd.DataFrame]] = None) -> Tuple[pd.DataFrame, str]:
+    """
+    Attaches to the published copy of csv_path, publishing it first if this is the
+    first process to ask for this version. Returns (DataFrame, manifest_path).
+    loader builds the frame for other sources (e.g. the ingest store); csv_path is
+    then the file whose changes mark a new version.
+    """
+    directory = directory or default_shm_dir()
+    os.makedirs(directory, exist_ok=True)
+    key = dataset_key(csv_path)
+    manifest_path = os.path.join(directory, f"{FILE_PREFIX}{key}.json")
+
+    if not os.path.exists(manifest_path):
+        import fcntl  # POSIX only; kept here so the app still imports on Windows
+
+        # Only one process parses and publishes; the others wait on the lock and attach
+        with open(os.path.join(directory, f"{FILE_PREFIX}{key}.lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if not os.path.exists(manifest_path):
+                    publish(loader() if loader else pd.read_csv(csv_path), directory, key)
+                    _remove_stale(directory, key)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    return attach(manifest_path), manifest_path
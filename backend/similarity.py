@@ -0,0 +1,239 @@
+# similarity.py
+
+"""
+Similar-district search over standardized groundwater metrics.
+
+Every (YEAR, STATE, DISTRICT) district row becomes a feature vector (recharge,
+extraction by sector, stage %, rainfall, area). Volumes and areas are
+log-scaled, then every feature is z-scored, so "similar" means similar
+hydrogeological profile rather than similar size. The matrix and its squared
+row norms are built ONCE; a query is one matrix-vector product
+(|x|^2 + |q|^2 - 2 X.q) over the rows that pass the filters, plus
+argpartition for the top k, so latency stays in milliseconds even with
+block-level row counts.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from dataset_rows import STAGE_COLUMN, FrameCache, aggregate_row_mask
+from trends import categorize_stage
+
+# Column -> API name
+FEATURE_COLUMNS = {
+    'Annual Ground water Recharge (ham)': 'annual_recharge_ham',
+    'Ground Water Extraction for all uses (ha.m) - Domestic.3': 'domestic_extraction_ham',
+    'Ground Water Extraction for all uses (ha.m) - Industrial.3': 'industrial_extraction_ham',
+    'Ground Water Extraction for all uses (ha.m) - Irrigation.3': 'irrigation_extraction_ham',
+    'Ground Water Extraction for all uses (ha.m)': 'gw_extraction_ham',
+    STAGE_COLUMN: 'extraction_stage_percent',
+    'Rainfall (mm)': 'rainfall_mm',
+    'Total Geographical Area (ha)': 'total_geographical_area_ha',
+}
+# Upper bound on k for the API and the agent tool
+MAX_NEIGHBOURS = 100
+
+# Heavy-tailed (volumes, areas) -> compared on a log scale
+LOG_FEATURES = {
+    'annual_recharge_ham', 'domestic_extraction_ham', 'industrial_extraction_ham',
+    'irrigation_extraction_ham', 'gw_extraction_ham', 'total_geographical_area_ha',
+}
+
+
+class SimilarityIndex:
+    """
+    k-NN over district feature vectors, with optional filters (states, years,
+    category) and constraints relative to the query district (lower / higher).
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        # National total rows are not districts: they would skew the scaling and match as peers
+        df = df[~aggregate_row_mask(df)]
+        self.columns = [col for col in FEATURE_COLUMNS if col in df.columns]
+        self.features = [FEATURE_COLUMNS[col] for col in self.columns]
+
+        self.raw = df[self.columns].to_numpy(dtype=np.float64)  # unscaled, for output and lower/higher
+        scaled = self.raw.copy()
+        for j, name in enumerate(self.features):
+            if name in LOG_FEATURES:
+                scaled[:, j] = np.log1p(np.clip(scaled[:, j], 0, None))
+        self.mean = np.nanmean(scaled, axis=0)
+        self.std = np.nanstd(scaled, axis=0)
+        self.std[~(self.std > 0)] = 1.0
+        scaled = (scaled - self.mean) / self.std
+        scaled[np.isnan(scaled)] = 0.0  # missing value = average on that feature
+
+        self.matrix = np.ascontiguousarray(scaled, dtype=np.float32)
+        self.sq_norms = np.einsum('ij,ij->i', self.matrix, self.matrix)
+
+        self.years = df['YEAR'].to_numpy()
+        self.states = df['STATE'].astype(str).str.strip().str.upper().to_numpy()
+        self.districts = df['DISTRICT'].astype(str).str.strip().str.upper().to_numpy()
+        self.display_states = df['STATE'].to_numpy()
+        self.display_districts = df['DISTRICT'].to_numpy()
+        self.categories = categorize_stage(df[STAGE_COLUMN].to_numpy()) if STAGE_COLUMN in df.columns else None
+
+    # ------------------------------------------------------------------ helpers
+
+    def resolve_feature(self, name: str) -> int:
+        """
+        Column position of a feature given its API name or column name.
+        """
+        if name in self.features:
+            return self.features.index(name)
+        if name in self.columns:
+            return self.columns.index(name)
+        raise ValueError(f"Unknown feature '{name}'. Available: {self.features}")
+
+    def locate(self, district: str, state: Optional[str] = None, year: Optional[int] = None) -> int:
+        """
+        Row of a district; the latest year unless year is given.
+        """
+        if district.strip() == '0' or (state or '').strip() == '0':
+            raise ValueError("'0' marks the national total rows, which are not a district")
+        mask = self.districts == district.strip().upper()
+        if state:
+            mask &= self.states == state.strip().upper()
+        if year is not None:
+            mask &= self.years == year
+        rows = np.flatnonzero(mask)
+        if len(rows) == 0:
+            where = f" in {state}" if state else ""
+            when = f" for {year}" if year is not None else ""
+            raise ValueError(f"District '{district}'{where}{when} not found")
+        matched_states = set(self.states[rows])
+        if len(matched_states) > 1:
+            raise ValueError(f"District '{district}' exists in several states {sorted(matched_states)}; pass state")
+        return int(rows[np.argmax(self.years[rows])])
+
+    def _row(self, i: int, distance: Optional[float] = None) -> Dict[str, Any]:
+        row = {
+            "year": int(self.years[i]),
+            "state": self.display_states[i],
+            "district": self.display_districts[i],
+        }
+        if self.categories is not None:
+            row["category"] = self.categories[i]
+        if distance is not None:
+            row["distance"] = round(float(distance), 4)
+            row["similarity"] = round(float(1.0 / (1.0 + distance)), 4)
+        for j, name in enumerate(self.features):
+            value = self.raw[i, j]
+            row[name] = None if np.isnan(value) else round(float(value), 2)
+        return row
+
+    # ------------------------------------------------------------------ queries
+
+    def candidate_mask(self, query_row: Optional[int] = None, states: Optional[Sequence[str]] = None,
+                       years: Optional[Sequence[int]] = None, category: Optional[str] = None,
+                       lower: Optional[Sequence[str]] = None, higher: Optional[Sequence[str]] = None,
+                       exclude_same_state: bool = False) -> np.ndarray:
+        """
+        Rows allowed as neighbours. lower/higher are features that must be below /
+        above the query district's value (e.g. lower=['gw_extraction_ham']).
+        """
+        mask = np.ones(len(self.matrix), dtype=bool)
+        if states:
+            mask &= np.isin(self.states, [s.strip().upper() for s in states])
+        if years:
+            mask &= np.isin(self.years, list(years))
+        elif query_row is not None:
+            mask &= self.years == self.years[query_row]  # compare within the same assessment year
+        if category:
+            if self.categories is None:
+                raise ValueError("Dataset has no stage column to filter categories on")
+            mask &= self.categories == category
+        if query_row is not None:
+            if exclude_same_state:
+                mask &= self.states != self.states[query_row]
+            for name in lower or []:
+                j = self.resolve_feature(name)
+                mask &= self.raw[:, j] < self.raw[query_row, j]
+            for name in higher or []:
+                j = self.resolve_feature(name)
+                mask &= self.raw[:, j] > self.raw[query_row, j]
+            # The district itself, in any year, is not its own peer
+            mask &= ~((self.districts == self.districts[query_row]) & (self.states == self.states[query_row]))
+        return mask
+
+    def nearest(self, vectors: np.ndarray, k: int = 10, mask: Optional[np.ndarray] = None,
+                weights: Optional[np.ndarray] = None) -> List[List[tuple]]:
+        """
+        Batch k-NN: for each standardized query vector, the k closest (row, distance)
+        among the masked rows, closest first.
+        """
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        candidates = np.flatnonzero(mask) if mask is not None else np.arange(len(self.matrix))
+        if len(candidates) == 0:
+            return [[] for _ in vectors]
+
+        matrix = self.matrix[candidates]
+        sq_norms = self.sq_norms[candidates]
+        if weights is not None:
+            w = np.sqrt(np.asarray(weights, dtype=np.float32))
+            matrix = matrix * w
+            vectors = vectors * w
+            sq_norms = np.einsum('ij,ij->i', matrix, matrix)
+
+        # (n_queries, n_candidates) squared distances in one matrix product
+        d2 = sq_norms[None, :] + np.einsum('ij,ij->i', vectors, vectors)[:, None] - 2.0 * (vectors @ matrix.T)
+        np.maximum(d2, 0, out=d2)
+
+        k = min(k, len(candidates))
+        top = np.argpartition(d2, k - 1, axis=1)[:, :k]
+        results = []
+        for q in range(len(vectors)):
+            order = top[q][np.argsort(d2[q, top[q]], kind='stable')]
+            results.append([(int(candidates[i]), float(np.sqrt(d2[q, i]))) for i in order])
+        return results
+
+    def similar(self, district: str, state: Optional[str] = None, year: Optional[int] = None,
+                k: int = 10, features: Optional[Sequence[str]] = None, **filters) -> Dict[str, Any]:
+        """
+        JSON-ready peers of one district, used by /api/similar and the agent tool.
+        features restricts the comparison to a subset (others get weight 0).
+        """
+        row = self.locate(district, state, year)
+        weights = None
+        if features:
+            weights = np.zeros(len(self.features), dtype=np.float32)
+            for name in features:
+                weights[self.resolve_feature(name)] = 1.0
+
+        mask = self.candidate_mask(query_row=row, **filters)
+        neighbours = self.nearest(self.matrix[row], k=k, mask=mask, weights=weights)[0]
+        return {
+            "query": self._row(row),
+            "features": list(features) if features else self.features,
+            "filters": {key: value for key, value in filters.items() if value},
+            "candidates": int(mask.sum()),
+            "neighbours": [self._row(i, distance) for i, distance in neighbours],
+        }
+
+
+_INDEXES: FrameCache[SimilarityIndex] = FrameCache(SimilarityIndex)
+
+
+def get_similarity_index(df: pd.DataFrame) -> SimilarityIndex:
+    """
+    Returns the (cached) SimilarityIndex for this DataFrame so it is built once.
+    """
+    return _INDEXES.get(df)
+
+
+def clamp_k(k: Optional[int], default: int = 10) -> int:
+    """
+    Neighbour count limited to 1..MAX_NEIGHBOURS (k comes from users and the LLM).
+    """
+    return max(1, min(default if k is None else int(k), MAX_NEIGHBOURS))
+
+
+def similar_districts(df: pd.DataFrame, district: str, **kwargs) -> Dict[str, Any]:
+    """
+    Module-level entry point so similarity queries can run in the analysis process pool
+    (used by /api/similar).
+    """
+    return get_similarity_index(df).similar(district, **kwargs)
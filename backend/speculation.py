@@ -0,0 +1,182 @@
+# speculation.py
+
+"""
+Speculative execution of the data-analysis stage while the router is deciding.
+
+The router almost always puts data_analysis_agent first, so with speculation
+on, IngresAgent starts query_maker + the pandas agent in a background thread
+at the same time as deciding_agent. If the plan contains data_analysis_agent
+the running work is committed (its result is awaited instead of starting
+from scratch); otherwise it is cancelled cooperatively, between LLM and tool
+calls, and the work already spent is recorded as waste. Speculation that is
+still queued on the pool when the router decides is dropped and the stage runs
+inline, so a busy pool never delays a request more than not speculating would.
+
+Enabled with INGRES_SPECULATE=1 (or IngresAgent(..., speculate=True)).
+"""
+
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from token_budget import UsageLedger, current_ledger, start_ledger
+
+SPECULATE_BY_DEFAULT = os.getenv("INGRES_SPECULATE", "0") == "1"
+
+_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("INGRES_SPECULATION_WORKERS", "8")),
+    thread_name_prefix="speculation",
+)
+
+
+class SpeculationCancelled(Exception):
+    """Raised inside speculative work once the router decided it is not needed."""
+
+
+class CancelOnEvent(BaseCallbackHandler):
+    """
+    LangChain callback that aborts an agent run at its next LLM or tool call
+    after the event is set (an in-flight call itself cannot be interrupted).
+    """
+
+    raise_error = True
+
+    def __init__(self, event: threading.Event):
+        self.event = event
+
+    def _check(self, *args, **kwargs):
+        if self.event.is_set():
+            raise SpeculationCancelled("speculative run cancelled")
+
+    on_llm_start = _check
+    on_chat_model_start = _check
+    on_tool_start = _check
+
+
+class SpeculationStats:
+    """
+    Process-wide counters; wasted_* is the work spent on cancelled speculation.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = 0
+        self.committed = 0
+        self.cancelled = 0
+        self.not_started = 0  # still queued when routing finished, run inline instead
+        self.failed = 0
+        self.wasted_seconds = 0.0
+        self.wasted_llm_calls = 0
+        self.wasted_tokens = 0
+        self.saved_seconds = 0.0  # router latency hidden by committed speculation
+
+    def record(self, outcome: str, seconds: float = 0.0, ledger: Optional[UsageLedger] = None,
+               saved: float = 0.0):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+            self.saved_seconds += saved
+            if outcome == "cancelled":
+                self.wasted_seconds += seconds
+                if ledger is not None:
+                    usage = ledger.summary()
+                    self.wasted_llm_calls += len(usage["calls"])
+                    self.wasted_tokens += usage["actual_input_tokens"] + usage["actual_output_tokens"]
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            decided = self.committed + self.cancelled + self.not_started
+            return {
+                "started": self.started,
+                "committed": self.committed,
+                "cancelled": self.cancelled,
+                "not_started": self.not_started,
+                "failed": self.failed,
+                "hit_rate": round(self.committed / decided, 4) if decided else 0.0,
+                "wasted_seconds": round(self.wasted_seconds, 3),
+                "wasted_llm_calls": self.wasted_llm_calls,
+                "wasted_tokens": self.wasted_tokens,
+                "saved_seconds": round(self.saved_seconds, 3),
+            }
+
+
+SPECULATION_STATS = SpeculationStats()
+
+
+class SpeculativeTask:
+    """
+    One speculative call of func(*args, cancel_event=..., **kwargs) on the shared pool.
+
+    The task records its LLM usage in a ledger of its own, which is merged into
+    the request's ledger on commit and counted as waste on cancel.
+    """
+
+    def __init__(self, func: Callable[..., Any], *args, **kwargs):
+        self.cancel_event = threading.Event()
+        self.ledger: Optional[UsageLedger] = None
+        self.started_at = time.perf_counter()
+        self.finished_at: Optional[float] = None
+        self.status = "running"
+        SPECULATION_STATS.record("started")
+
+        def run():
+            self.ledger = start_ledger()
+            try:
+                return func(*args, cancel_event=self.cancel_event, **kwargs)
+            finally:
+                self.finished_at = time.perf_counter()
+
+        # Fresh context copy, so the speculative ledger never replaces the caller's
+        self._future: Future = _EXECUTOR.submit(contextvars.copy_context().run, run)
+
+    def _elapsed(self) -> float:
+        return (self.finished_at or time.perf_counter()) - self.started_at
+
+    def commit(self, decided_at: Optional[float] = None) -> Any:
+        """
+        Waits for the speculative result. Returns None without waiting if the task is
+        still queued behind other speculation (status 'not_started'), and re-raises
+        its exception (status 'failed'); either way the caller runs the stage normally.
+        decided_at (perf_counter when routing finished) measures the latency saved.
+        """
+        if self._future.cancel():  # only succeeds while the task is still queued
+            self.status = "not_started"
+            SPECULATION_STATS.record("not_started")
+            return None
+
+        try:
+            result = self._future.result()
+        except Exception:
+            self.status = "failed"
+            SPECULATION_STATS.record("failed")
+            raise
+
+        self.status = "committed"
+        ledger = current_ledger()
+        if ledger is not None and self.ledger is not None:
+            for call in self.ledger.summary()["calls"]:
+                ledger.record(dict(call, speculative=True))
+        saved = min(decided_at - self.started_at, self._elapsed()) if decided_at else 0.0
+        SPECULATION_STATS.record("committed", saved=max(saved, 0.0))
+        return result
+
+    def cancel(self):
+        """
+        Stops the task at its next LLM/tool call; the waste is recorded once it has stopped.
+        """
+        self.status = "cancelled"
+        self.cancel_event.set()
+        self._future.cancel()
+
+        def account(_future):
+            SPECULATION_STATS.record("cancelled", seconds=self._elapsed(), ledger=self.ledger)
+
+        self._future.add_done_callback(account)
+
+    def report(self) -> Dict[str, Any]:
+        return {"used": self.status == "committed", "status": self.status,
+                "elapsed_seconds": round(self._elapsed(), 3)}
@@ -0,0 +1,10 @@
+# conftest.py
+
+# The backend modules are flat (imported as 'ingest', 'similarity', ...), so put backend/ on the path
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# llm_main builds the Gemini client at import time; no test here calls it
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
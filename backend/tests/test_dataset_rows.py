@@ -0,0 +1,41 @@
+# test_dataset_rows.py
+
+import gc
+import weakref
+
+import pandas as pd
+
+from dataset_rows import FrameCache, aggregate_row_mask
+
+
+def _frame(value):
+    return pd.DataFrame({'STATE': ['PUNJAB', '0'], 'DISTRICT': ['LUDHIANA', '0'], 'X': [value, value]})
+
+
+def test_aggregate_rows_are_the_zero_rows():
+    assert aggregate_row_mask(_frame(1)).tolist() == [False, True]
+
+
+def test_value_is_built_once_per_frame():
+    built = []
+    cache = FrameCache(lambda df: built.append(df) or len(built))
+    df = _frame(1)
+
+    assert cache.get(df) == cache.get(df) == 1
+    assert cache.get(df.copy()) == 2
+    assert len(built) == 2
+
+
+def test_old_frames_are_released():
+    cache = FrameCache(lambda df: df['X'].sum(), max_frames=2)
+    first = _frame(1)
+    ref = weakref.ref(first)
+    cache.get(first)
+    del first
+
+    for value in (2, 3):
+        cache.get(_frame(value))
+    gc.collect()
+
+    assert len(cache) == 2
+    assert ref() is None
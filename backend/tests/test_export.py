@@ -0,0 +1,85 @@
+# test_export.py
+
+import io
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from export import ExportError, export_chunks, params_from_json
+
+STAGE = 'Stage of Ground Water Extraction (%)'
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({
+        'YEAR': [2024, 2024, 2024, 2024, 2023],
+        'STATE': ['PUNJAB', 'PUNJAB', 'PUNJAB', 'HARYANA', 'PUNJAB'],
+        'DISTRICT': ['Amritsar', 'Barnala', 'Ludhiana', 'Karnal', 'Amritsar'],
+        STAGE: [150.5, 120.0, np.nan, 90.0, 140.0],
+    })
+
+
+PARAMS = {"states": ["punjab"], "sort_by": STAGE, "sort_order": "desc"}
+# Punjab rows by stage, NaN last
+EXPECTED = [('Amritsar', 2024), ('Amritsar', 2023), ('Barnala', 2024), ('Ludhiana', 2024)]
+
+
+def body(df, fmt, chunk_size=1, params=PARAMS):
+    return b"".join(export_chunks(df, params, fmt=fmt, chunk_size=chunk_size))
+
+
+def rows(frame):
+    return list(zip(frame['DISTRICT'], frame['YEAR']))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 100])
+def test_csv_round_trip(df, chunk_size):
+    parsed = pd.read_csv(io.BytesIO(body(df, "csv", chunk_size)))
+    assert rows(parsed) == EXPECTED
+    assert list(parsed.columns) == list(df.columns)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 100])
+def test_ndjson_round_trip(df, chunk_size):
+    lines = body(df, "ndjson", chunk_size).decode("utf-8").split("\n")
+    assert lines[-1] == ""  # newline-terminated, no blank lines in between
+    records = [json.loads(line) for line in lines[:-1]]
+    assert [(r['DISTRICT'], r['YEAR']) for r in records] == EXPECTED
+    assert records[-1][STAGE] is None
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 100])
+def test_arrow_round_trip(df, chunk_size):
+    pa = pytest.importorskip("pyarrow")
+    table = pa.ipc.open_stream(body(df, "arrow", chunk_size)).read_all()
+    assert rows(table.to_pandas()) == EXPECTED
+
+
+def test_empty_result_is_still_well_formed(df):
+    empty = {"states": ["KERALA"]}
+    assert pd.read_csv(io.BytesIO(body(df, "csv", params=empty))).empty
+    assert body(df, "ndjson", params=empty) == b""
+
+
+def test_limit_and_columns(df):
+    params = dict(PARAMS, limit=2, columns_to_show=['DISTRICT', 'YEAR'])
+    parsed = pd.read_csv(io.BytesIO(body(df, "csv", params=params)))
+    assert list(parsed.columns) == ['DISTRICT', 'YEAR']
+    assert rows(parsed) == EXPECTED[:2]
+
+
+def test_params_from_json_coerces_strings():
+    params = params_from_json({"states": "PUNJAB, HARYANA", "years": "2024", "limit": "5"})
+    assert params["states"] == ["PUNJAB", "HARYANA"]
+    assert params["years"] == [2024]
+    assert params["limit"] == 5
+
+
+@pytest.mark.parametrize("body_", [{"states": 5}, {"limit": True}, {"stage_filter": "critical"},
+                                   {"sort_by": ["a"]}, {"years": ["x"]}])
+def test_params_from_json_rejects_wrong_types(body_):
+    with pytest.raises(ExportError):
+        params_from_json(body_)
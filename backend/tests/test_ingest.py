@@ -0,0 +1,75 @@
+# test_ingest.py
+
+import json
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from ingest import ColumnarStore, ingest_file, load_store
+
+HEADER = "YEAR,STATE,DISTRICT,Rainfall (mm)\n"
+
+
+def write_csv(path, rows):
+    path.write_text(HEADER + "".join(f"{row}\n" for row in rows))
+    return str(path)
+
+
+def rainfall(df, district):
+    return df.loc[df['DISTRICT'].str.upper() == district.upper(), 'Rainfall (mm)'].tolist()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 50000])
+def test_last_row_of_a_file_wins(tmp_path, chunk_size):
+    source = write_csv(tmp_path / "a.csv", ["2024,Punjab,Ludhiana,100", "2024,PUNJAB,Amritsar,300",
+                                            "2024,punjab,LUDHIANA,200"])
+    store = ColumnarStore(str(tmp_path / "store"))
+
+    stats = ingest_file(source, store, chunk_size=chunk_size)
+
+    df = load_store(store.path)
+    assert len(df) == 2
+    assert rainfall(df, "Ludhiana") == [200.0]
+    assert stats["duplicates"] == 1
+
+
+def test_later_file_wins_over_the_store(tmp_path):
+    store = ColumnarStore(str(tmp_path / "store"))
+    ingest_file(write_csv(tmp_path / "old.csv", ["2024,PUNJAB,Ludhiana,100", "2024,PUNJAB,Amritsar,300"]), store)
+
+    stats = ingest_file(write_csv(tmp_path / "new.csv", ["2024,PUNJAB,LUDHIANA,150"]), store)
+
+    df = load_store(store.path)
+    assert rainfall(df, "Ludhiana") == [150.0]
+    assert rainfall(df, "Amritsar") == [300.0]
+    assert stats["updated"] == 1 and stats["duplicates"] == 0
+
+
+def test_already_ingested_file_is_skipped(tmp_path):
+    source = write_csv(tmp_path / "a.csv", ["2024,PUNJAB,Ludhiana,100"])
+    store = ColumnarStore(str(tmp_path / "store"))
+    ingest_file(source, store)
+
+    assert ingest_file(source, store) == {"file": source, "skipped": "already ingested"}
+
+
+def test_force_replaces_the_rows_of_the_file(tmp_path):
+    store = ColumnarStore(str(tmp_path / "store"))
+    source = write_csv(tmp_path / "a.csv", ["2024,PUNJAB,Ludhiana,100", "2024,PUNJAB,Amritsar,300"])
+    first = ingest_file(source, store, chunk_size=1)
+    ingest_file(write_csv(tmp_path / "b.csv", ["2024,PUNJAB,Amritsar,350"]), store)
+
+    again = ingest_file(source, store, chunk_size=1, force=True)
+
+    # The forced file is now the latest source for its keys, and its old parts are gone
+    df = load_store(store.path)
+    assert rainfall(df, "Ludhiana") == [100.0]
+    assert rainfall(df, "Amritsar") == [300.0]
+    assert again["rows_written"] == 2 and again["updated"] == 1
+    assert not set(first["parts"]) & set(again["parts"])
+    assert not any((tmp_path / "store" / part).exists() for part in first["parts"])
+
+    manifest = json.loads((tmp_path / "store" / "_manifest.json").read_text())
+    assert manifest["rows"] == 3  # two from the forced file + b.csv's superseded row
+    assert ColumnarStore(store.path).manifest == manifest
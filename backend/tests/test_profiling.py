@@ -0,0 +1,80 @@
+# test_profiling.py
+
+import cProfile
+import tracemalloc
+
+import pytest
+from flask import Flask, request
+
+import profiling
+from profiling import ProfileRequest, RequestProfiler, requested_profile
+
+app = Flask(__name__)
+
+
+@pytest.fixture(autouse=True)
+def profiling_on(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "secret")
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+
+
+def parse(url, **headers):
+    with app.test_request_context(url, headers=dict({"X-Ingres-Profile-Token": "secret"}, **headers)):
+        return requested_profile(request)
+
+
+@pytest.mark.parametrize("url, headers, mode, memory", [
+    ("/?profile=sample+memory", {}, "sample", True),       # '+' decodes to a space
+    ("/?profile=sample%2Bmemory", {}, "sample", True),
+    ("/?profile=1&memory=1", {}, "cprofile", True),
+    ("/", {"X-Ingres-Profile": "cprofile+memory"}, "cprofile", True),
+    ("/?profile=sample", {}, "sample", False),
+])
+def test_flag_forms(url, headers, mode, memory):
+    profile = parse(url, **headers)
+    assert (profile.mode, profile.memory) == (mode, memory)
+
+
+def test_flag_requires_token():
+    with pytest.raises(ValueError, match="Token"):
+        parse("/?profile=sample", **{"X-Ingres-Profile-Token": "wrong"})
+
+
+def test_overlapping_cprofile_falls_back_to_sampling():
+    first = RequestProfiler(ProfileRequest("cprofile", False))
+    second = RequestProfiler(ProfileRequest("cprofile", False))
+    with first:
+        with second:
+            sum(range(1000))
+    assert first.mode == "cprofile" and first.fallback is None
+    assert second.mode == "sample" and "another request" in second.fallback
+    assert "pstats" in first.artifacts and "collapsed" in second.artifacts
+
+    # The lock is free again
+    with RequestProfiler(ProfileRequest("cprofile", False)) as third:
+        pass
+    assert third.mode == "cprofile"
+
+
+def test_cprofile_that_cannot_start_does_not_fail_the_request(monkeypatch):
+    def busy(self):
+        raise ValueError("Another profiling tool is already active")
+    monkeypatch.setattr(cProfile.Profile, "enable", busy)
+
+    with RequestProfiler(ProfileRequest("cprofile", False)) as profiler:
+        pass
+    assert profiler.mode == "sample" and "already active" in profiler.fallback
+    assert not profiling._CPROFILE_LOCK.locked()
+
+
+def test_overlapping_memory_profiles_share_tracemalloc():
+    first = RequestProfiler(ProfileRequest("sample", True))
+    second = RequestProfiler(ProfileRequest("sample", True))
+    first.__enter__()
+    second.__enter__()
+    first.__exit__(None, None, None)
+    assert tracemalloc.is_tracing()
+    second.__exit__(None, None, None)
+    assert not tracemalloc.is_tracing()
+    assert "memory" in first.artifacts and "memory" in second.artifacts
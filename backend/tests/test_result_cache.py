@@ -0,0 +1,70 @@
+# test_result_cache.py
+
+import pandas as pd
+
+from result_cache import ResultCache, canonical_params, dataset_version, plan_key
+
+BASE = {
+    "states": ["PUNJAB", "HARYANA"],
+    "districts": [],
+    "years": [2024, 2023],
+    "stage_filter": {"type": "over-exploited", "min": None, "max": None},
+    "columns_to_show": ["STATE", "DISTRICT"],
+    "sort_by": "Stage of Ground Water Extraction (%)",
+    "sort_order": "desc",
+    "limit": 10,
+}
+
+
+def test_equivalent_plans_share_a_key():
+    reordered = dict(BASE, states=["haryana", "Punjab", "PUNJAB"], years=[2023, 2024, 2024])
+    # A named stage ignores min; defaults equal their explicit values
+    named = dict(reordered, stage_filter={"type": "over-exploited", "min": 50, "max": None})
+    sparse = {k: v for k, v in named.items() if k not in ("districts", "sort_order")}
+
+    keys = {plan_key(params, "v1") for params in (BASE, reordered, named, sparse)}
+    assert len(keys) == 1
+
+
+def test_missing_and_empty_values_are_equivalent():
+    assert canonical_params({}) == canonical_params({
+        "states": None, "districts": [], "years": None, "stage_filter": None,
+        "columns_to_show": None, "sort_by": "", "limit": 0,
+    })
+    assert canonical_params({"stage_filter": {"type": "none", "min": 5}}) == \
+        canonical_params({"stage_filter": {"type": "none", "min": 5.0}})
+
+
+def test_plans_that_select_different_rows_differ():
+    variants = [
+        dict(BASE, states=["PUNJAB"]),
+        dict(BASE, years=[2024]),
+        dict(BASE, stage_filter={"type": "none", "min": 50, "max": None}),
+        dict(BASE, stage_filter={"type": "over-exploited", "min": None, "max": 200}),
+        dict(BASE, columns_to_show=["DISTRICT", "STATE"]),  # column order is the output order
+        dict(BASE, sort_order="asc"),
+        dict(BASE, limit=5),
+    ]
+    keys = {plan_key(params, "v1") for params in variants}
+    assert len(keys) == len(variants)
+    assert plan_key(BASE, "v1") not in keys
+    assert plan_key(BASE, "v1") != plan_key(BASE, "v2")
+
+
+def test_dataset_version_follows_content():
+    df = pd.DataFrame({"STATE": ["PUNJAB"], "YEAR": [2024]})
+    assert dataset_version(df) == dataset_version(df.copy())
+    assert dataset_version(df) != dataset_version(df.assign(YEAR=[2023]))
+
+
+def test_cache_evicts_least_recently_used_by_bytes():
+    cache = ResultCache(max_bytes=60)
+    cache.put("a", {"rows": "x" * 10})
+    cache.put("b", {"rows": "y" * 10})
+    assert cache.get("a") == {"rows": "x" * 10}  # a is now the most recent
+
+    cache.put("c", {"rows": "z" * 10})
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
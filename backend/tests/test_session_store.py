@@ -0,0 +1,60 @@
+# test_session_store.py
+
+import pandas as pd
+
+from session_store import NEW_SESSION, SessionStore
+
+
+def frame(rows):
+    return pd.DataFrame({"YEAR": [2024] * rows, "STATE": ["PUNJAB"] * rows})
+
+
+def test_client_chosen_ids_are_not_adopted():
+    store = SessionStore()
+    first = store.get_or_create("abc")
+    second = store.get_or_create("abc")
+
+    assert first.session_id != "abc" and second.session_id != "abc"
+    assert first is not second
+    assert store.get("abc") is None
+
+
+def test_minted_id_resumes_the_conversation():
+    store = SessionStore()
+    session = store.get_or_create(NEW_SESSION)
+    session.record_turn("q1", "citizen", ["data_analysis_agent"], {})
+
+    assert store.get_or_create(session.session_id) is session
+    assert store.get_or_create(session.session_id).previous_query() == "q1"
+
+
+def test_oversized_frame_is_not_kept():
+    store = SessionStore(max_frame_bytes=1000)
+    session = store.get_or_create()
+    params = {"states": ["PUNJAB"]}
+
+    session.set_visualization(params, frame(1000))
+    assert session.filtered_df is None and session.frame_bytes == 0
+    assert session.params == params
+
+    session.set_visualization(params, frame(2))
+    assert session.filtered_df is not None and 0 < session.frame_bytes <= 1000
+
+
+def test_total_frame_bytes_drop_oldest_frames_first():
+    small = frame(5)
+    size = int(small.memory_usage(index=True, deep=True).sum())
+    store = SessionStore(max_bytes=2 * size, max_frame_bytes=10 * size)
+    sessions = [store.get_or_create() for _ in range(3)]
+    for session in sessions:
+        session.set_visualization({}, small)
+        session.record_turn("q", "citizen", [], {})
+
+    store.get_or_create(sessions[0].session_id)  # a new turn enforces the budget
+
+    # sessions[1] was least recently used, then sessions[2]; sessions[0] was just touched
+    assert sessions[1].filtered_df is None
+    assert sessions[2].filtered_df is not None and sessions[0].filtered_df is not None
+    assert sessions[1].has_history()  # the conversation itself survives
+    stats = store.stats()
+    assert stats["frame_bytes"] <= stats["max_bytes"] and stats["frame_evictions"] == 1
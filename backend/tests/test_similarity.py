@@ -0,0 +1,81 @@
+# test_similarity.py
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from similarity import SimilarityIndex, clamp_k, get_similarity_index
+
+EXTRACTION = 'Ground Water Extraction for all uses (ha.m)'
+AREA = 'Total Geographical Area (ha)'
+STAGE = 'Stage of Ground Water Extraction (%)'
+
+
+def frame(rows):
+    return pd.DataFrame(rows, columns=['YEAR', 'STATE', 'DISTRICT', EXTRACTION, AREA, STAGE])
+
+
+@pytest.fixture
+def df():
+    rows = [
+        (2024, 'PUNJAB', 'Ludhiana', 100.0, 3000.0, 150.0),
+        (2024, 'PUNJAB', 'Amritsar', 90.0, 2600.0, 140.0),
+        (2024, 'HARYANA', 'Karnal', 80.0, 2500.0, 130.0),
+        (2024, 'RAJASTHAN', 'Jaipur', 120.0, 11000.0, 110.0),
+        # National total: larger than every district on every volume
+        (2024, '0', '0', 100000.0, 3000000.0, 60.0),
+        (2023, 'PUNJAB', 'Ludhiana', 95.0, 3000.0, 145.0),
+        (2023, '0', '0', 99000.0, 3000000.0, 59.0),
+    ]
+    return frame(rows)
+
+
+def test_national_total_rows_are_not_indexed(df):
+    index = SimilarityIndex(df)
+
+    assert len(index.matrix) == 5
+    assert '0' not in set(index.districts) and '0' not in set(index.states)
+    # Scaling comes from districts only
+    assert np.isclose(index.mean[index.resolve_feature('extraction_stage_percent')], 135.0)
+
+
+def test_national_total_is_never_a_neighbour(df):
+    result = SimilarityIndex(df).similar('LUDHIANA', higher=['gw_extraction_ham', 'total_geographical_area_ha'])
+
+    assert [(n['state'], n['district']) for n in result['neighbours']] == [('RAJASTHAN', 'Jaipur')]
+    assert result['candidates'] == 1
+
+
+def test_national_total_is_rejected_as_a_query(df):
+    index = SimilarityIndex(df)
+    with pytest.raises(ValueError, match='national total'):
+        index.similar('0')
+    with pytest.raises(ValueError, match='national total'):
+        index.similar('Ludhiana', state='0')
+
+
+def test_latest_year_and_own_history_excluded(df):
+    result = SimilarityIndex(df).similar('Ludhiana', k=10)
+
+    assert result['query']['year'] == 2024
+    assert {n['district'] for n in result['neighbours']} == {'Amritsar', 'Karnal', 'Jaipur'}
+    assert result['neighbours'][0]['district'] == 'Amritsar'
+
+
+def test_index_is_cached_per_frame(df):
+    assert get_similarity_index(df) is get_similarity_index(df)
+    assert get_similarity_index(df.copy()) is not get_similarity_index(df)
+
+
+@pytest.mark.parametrize("k, expected", [(-3, 1), (0, 1), (None, 10), (7, 7), (1000, 100)])
+def test_clamp_k(k, expected):
+    assert clamp_k(k) == expected
+
+
+def test_agent_tool_clamps_k(df):
+    from agents.data_analysis_agent import make_similarity_tool
+
+    report = json.loads(make_similarity_tool(df).invoke({"district": "Ludhiana", "k": -2}))
+    assert len(report["neighbours"]) == 1
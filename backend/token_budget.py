@@ -0,0 +1,284 @@
+# token_budget.py
+
+"""
+Token budgets for LLM calls.
+
+Every prompt is estimated locally before llm.invoke, oversized inputs are
+trimmed to the role's input budget, max_output_tokens is set from the role's
+output budget, and estimated vs. actual usage is recorded in the ledger of the
+current request (see IngresAgent.run_pipeline).
+
+The pandas agent builds its own prompts (tool schemas, dataframe preview,
+scratchpad), so its calls cannot be estimated or trimmed up front: it runs on
+budgeted_llm(llm, "analysis") for the output limits, and a LedgerCallback
+records the actual usage of each of its LLM calls.
+"""
+
+import json
+import os
+import re
+import time
+import threading
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Per-role budgets in tokens. Gemini 2.5 counts thinking tokens against the
+# output limit, so every role sets an explicit thinking budget: the short
+# structured replies (routing list, query, JSON params) get none at all, the
+# prose roles get a fixed slice on top of their answer length.
+# Override with INGRES_TOKEN_BUDGETS='{"policy": {"max_input": 3000}}'.
+ROLE_BUDGETS: Dict[str, Dict[str, int]] = {
+    "router": {"max_input": 2000, "max_output": 256, "thinking": 0},
+    "query_maker": {"max_input": 2500, "max_output": 512, "thinking": 0},
+    "viz_params": {"max_input": 2500, "max_output": 1024, "thinking": 0},
+    "policy": {"max_input": 4000, "max_output": 2048, "thinking": 512},
+    "user": {"max_input": 4000, "max_output": 2048, "thinking": 512},
+    # Each pandas agent step: a tool call or the final structured analysis
+    "analysis": {"max_input": 8000, "max_output": 4096, "thinking": 1024},
+}
+DEFAULT_BUDGET = {"max_input": 4000, "max_output": 1024}
+BUDGET_KEYS = ("max_input", "max_output", "thinking")
+
+
+def _apply_overrides(raw: str):
+    """
+    Merges INGRES_TOKEN_BUDGETS into ROLE_BUDGETS, skipping (and reporting) every
+    entry that is not {role: {max_input|max_output|thinking: non-negative int}}.
+    """
+    try:
+        overrides = json.loads(raw)
+    except json.JSONDecodeError as e:
+        print(f"⚠️ Ignoring invalid INGRES_TOKEN_BUDGETS: {e}")
+        return
+    if not isinstance(overrides, dict):
+        print("⚠️ Ignoring INGRES_TOKEN_BUDGETS: expected an object of roles")
+        return
+
+    for role, budget in overrides.items():
+        if not isinstance(budget, dict):
+            print(f"⚠️ Ignoring INGRES_TOKEN_BUDGETS['{role}']: expected an object, got {budget!r}")
+            continue
+        valid = {}
+        for key, value in budget.items():
+            if key not in BUDGET_KEYS or isinstance(value, bool) or not isinstance(value, int) or value < 0:
+                print(f"⚠️ Ignoring INGRES_TOKEN_BUDGETS['{role}']['{key}'] = {value!r}")
+                continue
+            valid[key] = value
+        ROLE_BUDGETS.setdefault(role, dict(DEFAULT_BUDGET)).update(valid)
+
+
+_apply_overrides(os.getenv("INGRES_TOKEN_BUDGETS", "{}"))
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Local token estimate (no tokenizer download or API call). SentencePiece-style
+    tokenizers average ~4 characters per token on English prose but split numbers
+    and punctuation finely, so take the larger of the char- and piece-based counts.
+    """
+    if not text:
+        return 0
+    by_chars = len(text) / 4
+    by_pieces = len(_WORD_RE.findall(text)) * 0.75
+    return int(max(by_chars, by_pieces)) + 1
+
+
+def budget_for(role: str) -> Dict[str, int]:
+    return ROLE_BUDGETS.get(role, DEFAULT_BUDGET)
+
+
+def analysis_text(data_analysis: Any) -> str:
+    """
+    Reduces the data_analysis context value to the text worth sending downstream.
+    The pandas agent returns {'input': ..., 'output': ..., maybe intermediate steps};
+    only 'output' carries the findings.
+    """
+    if isinstance(data_analysis, dict):
+        if data_analysis.get('output'):
+            return str(data_analysis['output'])
+        return json.dumps(data_analysis, default=str)
+    return str(data_analysis)
+
+
+def trim_to_budget(text: str, max_tokens: int) -> str:
+    """
+    Extractive trim: keeps headings and lines with numbers first (the data-bearing
+    lines downstream prompts need), then other lines, in original order, until
+    the budget is used. Returns text unchanged when it already fits.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    lines = text.splitlines()
+    costs = [estimate_tokens(line) for line in lines]
+    is_key = [bool(re.search(r"\d", line)) or line.lstrip().startswith(("#", "**", "1.", "2.", "3.", "4."))
+              for line in lines]
+
+    keep = set()
+    used = 0
+    for priority in (True, False):
+        for i, line in enumerate(lines):
+            if is_key[i] == priority and i not in keep and used + costs[i] <= max_tokens:
+                keep.add(i)
+                used += costs[i]
+
+    if not keep:
+        # One huge line: hard cut by characters
+        return text[: max_tokens * 4] + "\n[... truncated to fit token budget]"
+
+    dropped = len(lines) - len(keep)
+    kept = [lines[i] for i in sorted(keep)]
+    return "\n".join(kept) + f"\n[... {dropped} lines omitted to fit token budget]"
+
+
+def fit_input(role: str, fixed_prompt_tokens: int, text: str) -> str:
+    """
+    Trims a variable prompt input so fixed prompt + input stays within the role's input budget.
+    """
+    room = max(budget_for(role)["max_input"] - fixed_prompt_tokens, 200)
+    return trim_to_budget(text, room)
+
+
+class UsageLedger:
+    """
+    Estimated vs. actual token usage of all budgeted LLM calls in one request.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls: List[Dict[str, Any]] = []
+
+    def record(self, entry: Dict[str, Any]):
+        with self._lock:
+            self.calls.append(entry)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = list(self.calls)
+
+        def total(key):
+            return sum(c.get(key) or 0 for c in calls)
+
+        # Estimate error only over calls that were estimated (not the pandas agent's)
+        estimated_calls = [c for c in calls if c.get("estimated_input_tokens") is not None]
+        estimated = sum(c["estimated_input_tokens"] for c in estimated_calls)
+        actual = sum(c.get("actual_input_tokens") or 0 for c in estimated_calls)
+        return {
+            "calls": calls,
+            "estimated_input_tokens": estimated,
+            "actual_input_tokens": total("actual_input_tokens"),
+            "actual_output_tokens": total("actual_output_tokens"),
+            "thinking_tokens": total("thinking_tokens"),
+            "truncated_calls": sum(1 for c in calls if c.get("truncated")),
+            "estimate_error_percent": round((estimated - actual) / actual * 100, 1) if actual else None,
+        }
+
+
+_CURRENT_LEDGER: ContextVar[Optional[UsageLedger]] = ContextVar("ingres_token_ledger", default=None)
+
+
+def start_ledger() -> UsageLedger:
+    """
+    Starts a fresh ledger for the current request (thread / context).
+    """
+    ledger = UsageLedger()
+    _CURRENT_LEDGER.set(ledger)
+    return ledger
+
+
+def current_ledger() -> Optional[UsageLedger]:
+    return _CURRENT_LEDGER.get()
+
+
+def _limits(role: str) -> Dict[str, int]:
+    budget = budget_for(role)
+    limits = {"max_output_tokens": budget["max_output"]}
+    if budget.get("thinking") is not None:
+        limits["thinking_budget"] = budget["thinking"]
+    return limits
+
+
+def _usage_entry(role: str, message, finish_reason: Optional[str]) -> Dict[str, Any]:
+    """
+    Ledger fields taken from a reply: actual usage, thinking and truncation.
+    """
+    budget = budget_for(role)
+    usage = getattr(message, "usage_metadata", None) or {}
+    truncated = finish_reason == "MAX_TOKENS"
+    if truncated:
+        print(f"⚠️ {role} reply hit its {budget['max_output']} output token limit and is truncated")
+    return {
+        "actual_input_tokens": usage.get("input_tokens"),
+        "actual_output_tokens": usage.get("output_tokens"),
+        "max_input_tokens": budget["max_input"],
+        "thinking_tokens": (usage.get("output_token_details") or {}).get("reasoning"),
+        "max_output_tokens": budget["max_output"],
+        "thinking_budget": budget.get("thinking"),
+        "finish_reason": finish_reason,
+        "truncated": truncated,
+    }
+
+
+def budgeted_llm(llm, role: str):
+    """
+    llm with the role's output and thinking limits bound to every call, for
+    callers (the pandas agent) that invoke it themselves.
+    """
+    return llm.bind(**_limits(role))
+
+
+class LedgerCallback(BaseCallbackHandler):
+    """
+    Records every LLM call of a run into the ledger current when it was created
+    (estimated_input_tokens stays None: the prompts are built by the agent).
+    """
+
+    def __init__(self, role: str):
+        self.role = role
+        self.ledger = current_ledger()
+        self._started: Dict[UUID, float] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs):
+        self._started[run_id] = time.time()
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs):
+        if self.ledger is None:
+            return
+        started = self._started.pop(run_id, None)
+        for generations in response.generations:
+            for generation in generations:
+                info = generation.generation_info or {}
+                entry = {"role": self.role, "estimated_input_tokens": None}
+                entry.update(_usage_entry(self.role, getattr(generation, "message", None),
+                                          info.get("finish_reason")))
+                entry["latency_ms"] = round((time.time() - started) * 1000, 1) if started else None
+                self.ledger.record(entry)
+
+
+def budgeted_invoke(llm, role: str, prompt: str):
+    """
+    llm.invoke with the role's output and thinking limits, recording estimated vs.
+    actual usage and whether the reply was cut off at the output limit.
+    Callers are expected to have fitted variable inputs with fit_input first.
+    """
+    budget = budget_for(role)
+    estimated = estimate_tokens(prompt)
+    if estimated > budget["max_input"]:
+        print(f"⚠️ {role} prompt estimated at {estimated} tokens, over its {budget['max_input']} budget")
+
+    started = time.time()
+    response = llm.invoke(prompt, **_limits(role))
+    finish_reason = (getattr(response, "response_metadata", None) or {}).get("finish_reason")
+    entry = {"role": role, "estimated_input_tokens": estimated}
+    entry.update(_usage_entry(role, response, finish_reason))
+    entry["latency_ms"] = round((time.time() - started) * 1000, 1)
+
+    ledger = current_ledger()
+    if ledger is not None:
+        ledger.record(entry)
+    return response
@@ -0,0 +1,311 @@
+# trends.py
+
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from dataset_rows import STAGE_COLUMN, FrameCache, aggregate_row_mask
+
+KEY_COLUMNS = ['STATE', 'DISTRICT']
+
+# Same thresholds as build_pandas_filters in agents/visualizing_agent.py
+CATEGORY_ORDER = ['safe', 'semi-critical', 'critical', 'over-exploited']
+
+
+def categorize_stage(stage: np.ndarray) -> np.ndarray:
+    """
+    Vectorized stage-of-extraction categorisation. NaN stays uncategorised (None).
+    """
+    stage = np.asarray(stage, dtype=float)
+    return np.select(
+        [stage > 100, stage >= 90, stage >= 70, stage < 70],
+        ['over-exploited', 'critical', 'semi-critical', 'safe'],
+        default=None,
+    )
+
+
+def _is_extensive(metric: str) -> bool:
+    # Volumes and areas add up across districts; percentages and rainfall do not
+    return '(ham)' in metric or '(ha.m)' in metric or '(ha)' in metric
+
+
+class TrendEngine:
+    """
+    Year-over-year comparisons for every district.
+
+    The dataset is pivoted ONCE into a (STATE, DISTRICT) x (metric, YEAR) panel;
+    every trend query is then a column slice plus NumPy arithmetic on a
+    district x year matrix, no per-request groupby.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        # National total rows are not districts and would double every aggregate
+        keyed = df[~aggregate_row_mask(df)].assign(
+            STATE=df['STATE'].str.strip().str.upper(),
+            DISTRICT=df['DISTRICT'].str.strip().str.upper(),
+        )
+        self.metrics = [
+            col for col in keyed.select_dtypes(include='number').columns if col != 'YEAR'
+        ]
+        # Duplicate (YEAR, STATE, DISTRICT) rows are averaged
+        self.panel = (
+            keyed.groupby(KEY_COLUMNS + ['YEAR'])[self.metrics]
+            .mean()
+            .unstack('YEAR')
+            .sort_index()
+        )
+        self.years = sorted(int(y) for y in self.panel.columns.get_level_values('YEAR').unique())
+        self._lock = threading.Lock()
+        self._matrices: Dict[str, pd.DataFrame] = {}
+        self._clean_names: Optional[Dict[str, str]] = None
+
+    # ------------------------------------------------------------------ helpers
+
+    def resolve_metric(self, metric: Optional[str]) -> str:
+        """
+        Accepts an exact column name or its cleaned API name (see clean_column_names).
+        """
+        if not metric:
+            return STAGE_COLUMN
+        if metric in self.metrics:
+            return metric
+        if self._clean_names is None:
+            from agents.visualizing_agent import clean_column_names
+            self._clean_names = {clean: col for col, clean in clean_column_names(self.metrics).items()}
+        if metric in self._clean_names:
+            return self._clean_names[metric]
+        raise ValueError(f"Unknown metric '{metric}'. Available: {self.metrics}")
+
+    def matrix(self, metric: str, states: Optional[List[str]] = None,
+               districts: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        District x year matrix for one metric (rows: (STATE, DISTRICT), columns: YEAR).
+        """
+        metric = self.resolve_metric(metric)
+        with self._lock:
+            mat = self._matrices.get(metric)
+            if mat is None:
+                mat = self.panel[metric]
+                self._matrices[metric] = mat
+
+        if states:
+            states_upper = [s.upper() for s in states]
+            mat = mat[mat.index.get_level_values('STATE').isin(states_upper)]
+        if districts:
+            districts_upper = [d.upper() for d in districts]
+            mat = mat[mat.index.get_level_values('DISTRICT').isin(districts_upper)]
+        return mat
+
+    def _year_window(self, start: Optional[int], end: Optional[int]):
+        start = int(start) if start is not None else self.years[0]
+        end = int(end) if end is not None else self.years[-1]
+        for year in (start, end):
+            if year not in self.years:
+                raise ValueError(f"Year {year} not in dataset. Available: {self.years}")
+        if end <= start:
+            raise ValueError("'end' year must be after 'start' year.")
+        return start, end
+
+    # --------------------------------------------------------------- computations
+
+    def yoy_change(self, metric: str, pct: bool = True, **filters) -> pd.DataFrame:
+        """
+        Year-over-year change per district. First year column is dropped.
+        """
+        mat = self.matrix(metric, **filters)
+        values = mat.to_numpy(dtype=float)
+        diff = values[:, 1:] - values[:, :-1]
+        if pct:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                diff = np.where(values[:, :-1] != 0, diff / values[:, :-1] * 100, np.nan)
+        return pd.DataFrame(diff, index=mat.index, columns=mat.columns[1:])
+
+    def cagr(self, metric: str, start: Optional[int] = None, end: Optional[int] = None,
+             **filters) -> pd.Series:
+        """
+        Compound annual growth rate (%) between two years per district.
+        Undefined (NaN) where either endpoint is missing or non-positive.
+        """
+        start, end = self._year_window(start, end)
+        mat = self.matrix(metric, **filters)
+        first = mat[start].to_numpy(dtype=float)
+        last = mat[end].to_numpy(dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rate = np.where(
+                (first > 0) & (last > 0),
+                (np.power(last / first, 1.0 / (end - start)) - 1) * 100,
+                np.nan,
+            )
+        return pd.Series(rate, index=mat.index, name='cagr_percent')
+
+    def category_transitions(self, start: Optional[int] = None, end: Optional[int] = None,
+                             **filters) -> Dict[str, Any]:
+        """
+        Stage category movement between two years, e.g. safe -> critical.
+        """
+        start, end = self._year_window(start, end)
+        mat = self.matrix(STAGE_COLUMN, **filters)
+        mat = mat[[start, end]].dropna()
+        before = categorize_stage(mat[start].to_numpy())
+        after = categorize_stage(mat[end].to_numpy())
+
+        cat_before = pd.Categorical(before, categories=CATEGORY_ORDER)
+        cat_after = pd.Categorical(after, categories=CATEGORY_ORDER)
+        counts = pd.crosstab(cat_before, cat_after, dropna=False)
+        # Category codes follow CATEGORY_ORDER, so a higher code means a worse stage
+        rank_before = cat_before.codes
+        rank_after = cat_after.codes
+        changed = rank_before != rank_after
+
+        moved = [
+            {
+                "state": state,
+                "district": district,
+                "from": b,
+                "to": a,
+                "direction": "worsened" if ra > rb else "improved",
+                "stage_start": round(float(s0), 2),
+                "stage_end": round(float(s1), 2),
+            }
+            for (state, district), b, a, rb, ra, s0, s1 in zip(
+                mat.index[changed], before[changed], after[changed],
+                rank_before[changed], rank_after[changed],
+                mat[start].to_numpy()[changed], mat[end].to_numpy()[changed],
+            )
+        ]
+
+        return {
+            "start": start,
+            "end": end,
+            "matrix": {
+                str(b): {str(a): int(n) for a, n in row.items()} for b, row in counts.iterrows()
+            },
+            "worsened": int(np.sum(rank_after > rank_before)),
+            "improved": int(np.sum(rank_after < rank_before)),
+            "unchanged": int(np.sum(~changed)),
+            "transitions": moved,
+        }
+
+    def top_movers(self, metric: str, start: Optional[int] = None, end: Optional[int] = None,
+                   n: int = 10, by: str = 'abs', **filters) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Districts with the largest increase / decrease of a metric between two years.
+        by: 'abs' (absolute change) or 'pct' (percentage change).
+        """
+        start, end = self._year_window(start, end)
+        mat = self.matrix(metric, **filters)
+        first = mat[start].to_numpy(dtype=float)
+        last = mat[end].to_numpy(dtype=float)
+        change = last - first
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pct = np.where(first != 0, change / first * 100, np.nan)
+
+        score = pct if by == 'pct' else change
+        valid = np.flatnonzero(~np.isnan(score))
+        order = valid[np.argsort(score[valid], kind='stable')]
+
+        def rows(idx):
+            return [
+                {
+                    "state": mat.index[i][0],
+                    "district": mat.index[i][1],
+                    "start_value": round(float(first[i]), 2),
+                    "end_value": round(float(last[i]), 2),
+                    "change": round(float(change[i]), 2),
+                    "change_percent": None if np.isnan(pct[i]) else round(float(pct[i]), 2),
+                }
+                for i in idx
+            ]
+
+        n = max(int(n), 0)
+        return {
+            "increase": rows(order[::-1][:n]),
+            "decrease": rows(order[:n]),
+        }
+
+    def aggregate_series(self, metric: str, **filters) -> Dict[int, float]:
+        """
+        Yearly aggregate of a metric over the selected districts: sum for volumes and
+        areas, mean otherwise. Stage % is recomputed from the summed volumes.
+        """
+        if self.resolve_metric(metric) == STAGE_COLUMN:
+            extraction = self.matrix('Ground Water Extraction for all uses (ha.m)', **filters).sum()
+            extractable = self.matrix('Annual Extractable Ground water Resource (ham)', **filters).sum()
+            series = extraction / extractable.replace(0, np.nan) * 100
+        else:
+            mat = self.matrix(metric, **filters)
+            series = mat.sum() if _is_extensive(self.resolve_metric(metric)) else mat.mean()
+        return {int(year): round(float(v), 2) for year, v in series.items() if not np.isnan(v)}
+
+    def summary(self, metric: Optional[str] = None, start: Optional[int] = None,
+                end: Optional[int] = None, n: int = 10, by: str = 'abs',
+                states: Optional[List[str]] = None, districts: Optional[List[str]] = None,
+                include_districts: bool = False) -> Dict[str, Any]:
+        """
+        JSON-ready trend report used by /api/trends and the analysis agent tool.
+        """
+        metric = self.resolve_metric(metric)
+        start, end = self._year_window(start, end)
+        filters = {"states": states, "districts": districts}
+
+        aggregate = self.aggregate_series(metric, **filters)
+        agg_years = sorted(aggregate)
+        aggregate_yoy = {
+            year: round((aggregate[year] - aggregate[prev]) / aggregate[prev] * 100, 2)
+            for prev, year in zip(agg_years, agg_years[1:]) if aggregate[prev]
+        }
+        agg_cagr = None
+        if aggregate.get(start, 0) > 0 and aggregate.get(end, 0) > 0:
+            agg_cagr = round(((aggregate[end] / aggregate[start]) ** (1 / (end - start)) - 1) * 100, 2)
+
+        result = {
+            "metric": metric,
+            "years": self.years,
+            "start": start,
+            "end": end,
+            "filters": filters,
+            "aggregate": {str(y): v for y, v in aggregate.items()},
+            "aggregate_yoy_percent": {str(y): v for y, v in aggregate_yoy.items()},
+            "aggregate_cagr_percent": agg_cagr,
+            "top_movers": self.top_movers(metric, start, end, n=n, by=by, **filters),
+            "category_transitions": self.category_transitions(start, end, **filters),
+        }
+
+        if include_districts:
+            mat = self.matrix(metric, **filters)
+            cagr = self.cagr(metric, start, end, **filters)
+            yoy = self.yoy_change(metric, **filters)
+            result["districts"] = [
+                {
+                    "state": state,
+                    "district": district,
+                    "values": {str(y): (None if np.isnan(v) else round(float(v), 2)) for y, v in zip(mat.columns, values)},
+                    "yoy_percent": {str(y): (None if np.isnan(v) else round(float(v), 2)) for y, v in zip(yoy.columns, yoy_row)},
+                    "cagr_percent": None if np.isnan(c) else round(float(c), 2),
+                }
+                for (state, district), values, yoy_row, c in zip(
+                    mat.index, mat.to_numpy(dtype=float), yoy.to_numpy(dtype=float), cagr.to_numpy()
+                )
+            ]
+
+        return result
+
+
+_ENGINES: FrameCache[TrendEngine] = FrameCache(TrendEngine)
+
+
+def get_trend_engine(df: pd.DataFrame) -> TrendEngine:
+    """
+    Returns the (cached) TrendEngine for this DataFrame so the pivot happens once.
+    """
+    return _ENGINES.get(df)
+
+
+def trend_summary(df: pd.DataFrame, **kwargs) -> Dict[str, Any]:
+    """
+    Module-level entry point so trend reports can run in the analysis process pool.
+    """
+    return get_trend_engine(df).summary(**kwargs)
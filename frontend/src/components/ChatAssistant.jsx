@@ -13,6 +13,8 @@ const ChatAssistant = ({ onDataUpdate }) => {
   ]);
 
   const [userRole, setUserRole] = useState(null);
+  // Server-side conversation id, returned by the backend on the first answer
+  const [sessionId, setSessionId] = useState(null);
   const [inputValue, setInputValue] = useState("");
   const [isLoading, setIsLoading] = useState(false);
   const messagesEndRef = useRef(null);
@@ -85,6 +87,7 @@ const ChatAssistant = ({ onDataUpdate }) => {
         body: JSON.stringify({
           query: messageToSend,
           role: userRole || "user",
+          session_id: sessionId || "new",
         }),
       });
 
@@ -95,6 +98,10 @@ const ChatAssistant = ({ onDataUpdate }) => {
       const data = await response.json();
       console.log("✅ Full backend response:", data);
 
+      if (data.session_id) {
+        setSessionId(data.session_id);
+      }
+
       if (data.error) {
         const errorMessage = {
           id: (Date.now() + 1).toString(),